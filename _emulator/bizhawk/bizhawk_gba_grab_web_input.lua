@@ -164,7 +164,7 @@ end
 -- Set keys, keep existing key presses if there is nothing in the buffer
 function SetTheKeys()
     if next(INPUTBUFFER) ~= nil then
-        local numhopefully = table.remove(INPUTBUFFER)
+        local numhopefully = table.remove(INPUTBUFFER, 1) -- Oldest first
 
         if DEBUG then
             print("Input: " .. numhopefully)
@@ -1,94 +1,257 @@
 #!/usr/bin/env python3
-"""Client to get the inputs and output them as key presses."""
+"""Client to get the inputs and output them as key presses.
 
+Listens on localhost:5001 by default, give it host:port or unix:/path/to/socket to listen somewhere else,
+the same as flaskcontroller's targets. e.g. python3 generic_keyboard.py unix:/tmp/flaskcontroller.sock
+
+flaskcontroller sends 2 byte little endian input states (protocol version 1), one bit per button,
+or with --protocol 2 frames of run length encoded states to match protocol_version = 2.
+A read can end half way through a state or frame, so received bytes are buffered until they are whole, and
+each state is compared to the last with one XOR so only the buttons that changed are pressed or released.
+
+By default one upstream is served at a time, with --asyncio several can be connected at once
+(e.g. two flaskcontroller instances, or the replay tool), the keys held are the OR of all their states.
+When an upstream goes away the keys it was holding are released.
+"""
+
+import argparse
+import asyncio
+import contextlib
 import logging
+import os
 import socket
+import struct
+from collections.abc import Callable
 
 logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-DUMMY_SERVER = True
+DUMMY_SERVER = True  # Log key presses instead of pressing them, --no-dummy to press them with pydirectinput
 
-if not DUMMY_SERVER:
-    import pydirectinput
+DEFAULT_LISTEN = "localhost:5001"
+DEFAULT_KEYS = "q,w,e,r,t,y,u,i,o,p"  # Bit 0 (GBA_A) to bit 9 (GBA_L), see BUTTON_CODES in flaskcontroller
+UNIX_PREFIX = "unix:"
+STATE = struct.Struct("<H")
+V2_MAGIC = 0xFC
+V2_HEADER = struct.Struct("<BBIHH")  # magic, version, sequence number, number of states, number of entries
+V2_ENTRY = struct.Struct("<HB")  # state, run length
+RECV_SIZE = 4096  # Bytes per read, states that arrive together are handled together
+
+
+class StateDecoder:
+    """Turns received bytes into whole states, keeping a state that was cut short for the next read."""
+
+    def __init__(self) -> None:
+        """Init, nothing buffered."""
+        self._partial = b""
+
+    def feed(self, data: bytes) -> list[int]:
+        """Add received data, return every state that is now complete, in order."""
+        if self._partial:
+            data = self._partial + data
+        end = len(data) - len(data) % STATE.size
+        self._partial = data[end:]
+        return [state for (state,) in STATE.iter_unpack(memoryview(data)[:end])]
+
+
+class FrameDecoder:
+    """Turns received bytes into states for protocol version 2, keeping a frame that was cut short for the next read."""
+
+    def __init__(self) -> None:
+        """Init, nothing buffered."""
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[int]:
+        """Add received data, return the states of every frame that is now complete, in order."""
+        self._buffer += data
+        states = []
+        offset = 0
+        while len(self._buffer) - offset >= V2_HEADER.size:
+            magic, version, _, _, n_entries = V2_HEADER.unpack_from(self._buffer, offset)
+            if magic != V2_MAGIC or version != 2:  # noqa: PLR2004
+                self._buffer.clear()
+                msg = f"Invalid frame header, is flaskcontroller using protocol_version = 2? magic: {magic:#x}"
+                raise ValueError(msg)
 
-    pydirectinput.PAUSE = 1 / 120
+            end = offset + V2_HEADER.size + n_entries * V2_ENTRY.size
+            if len(self._buffer) < end:
+                break  # Rest of the frame hasn't arrived yet
+            for state, run in V2_ENTRY.iter_unpack(memoryview(self._buffer)[offset + V2_HEADER.size : end]):
+                states.extend([state] * run)
+            offset = end
+        del self._buffer[:offset]
+        return states
 
-SERVER = None
-HOST = "localhost"
-PORT = 5001
-last_input_array = [False, False, False, False, False, False, False, False, False, False]
 
+DECODERS = {1: StateDecoder, 2: FrameDecoder}  # Protocol version -> decoder
 
-# Create a socket object
-server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-# Bind the socket to a specific address and port
-server_socket.bind((HOST, PORT))
+class Keyboard:
+    """Presses and releases keys for the bits that changed between one state and the next."""
 
-# Set the maximum number of queued connections
-server_socket.listen(5)
+    def __init__(self, keys: list[str], press: Callable[[str], None], release: Callable[[str], None]) -> None:
+        """Create the keyboard.
 
-logging.info("Server listening on %s:%s", HOST, PORT)
+        Args:
+            keys: Key for each bit of the state, bit 0 first. Bits without a key are ignored.
+            press: Called with a key to press it.
+            release: Called with a key to release it.
+        """
+        self.keys = keys
+        self.press = press
+        self.release = release
+        self.state = 0
+        self._mask = (1 << len(keys)) - 1
 
+    def apply(self, state: int) -> None:
+        """Press what is newly down in state, release what is newly up."""
+        state &= self._mask
+        changed = state ^ self.state
+        self.state = state
+        while changed:
+            bit = changed & -changed  # Lowest changed bit
+            key = self.keys[bit.bit_length() - 1]
+            if state & bit:
+                self.press(key)
+            else:
+                self.release(key)
+            changed ^= bit
 
-def iterate_bits(num: int) -> list:
-    """Make a gross dict representing 10 bits."""
-    input_array = []
-    binary_representation = bin(num)[2:]  # Convert the integer to binary and remove the '0b' prefix
-    binary_representation = binary_representation.zfill(10)  # Assuming 32-bit integers for illustration
 
-    for _bit_position, bit_value in enumerate(binary_representation[::-1]):
-        logger.debug("Bit at position: %s:%s", _bit_position, bit_value)
-        new_bit_value = bit_value != "0"  # Why didn't I comment this, this is nonsense
-        input_array.append(new_bit_value)
+class Receiver:
+    """Applies the states from every connected upstream to the keyboard, ORed together."""
 
-    return input_array
+    def __init__(self, keyboard: Keyboard) -> None:
+        """Create the receiver."""
+        self.keyboard = keyboard
+        self._states = {}  # Upstream -> its latest state
 
+    def receive(self, upstream: object, states: list[int]) -> None:
+        """Apply states from one upstream, in order."""
+        if not self._states or self._states.keys() == {upstream}:  # One upstream, the usual case
+            for state in states:
+                self.keyboard.apply(state)
+            self._states[upstream] = self.keyboard.state
+            return
 
-def press_buttons(in_data: bytes) -> None:
-    """Bitwise compare to the socked and press/release depending."""
-    global last_input_array  # noqa: PLW0603 fine for this program/scale
+        for state in states:
+            self._states[upstream] = state
+            merged = 0
+            for upstream_state in self._states.values():
+                merged |= upstream_state
+            self.keyboard.apply(merged)
 
-    my_int = int.from_bytes(in_data, "little")
+    def disconnect(self, upstream: object) -> None:
+        """Forget an upstream, releasing whatever only it was holding."""
+        self._states.pop(upstream, None)
+        merged = 0
+        for upstream_state in self._states.values():
+            merged |= upstream_state
+        self.keyboard.apply(merged)
 
-    input_array = iterate_bits(my_int)
 
-    logger.debug(str(input_array))
+def create_server_socket(listen: str) -> socket.socket:
+    """Bind and listen on host:port or unix:/path."""
+    if listen.startswith(UNIX_PREFIX):
+        # Unix socket, for flaskcontroller on the same machine, skips the TCP stack altogether
+        socket_path = listen[len(UNIX_PREFIX) :]
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(socket_path)  # Left over from last time
+        server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server_socket.bind(socket_path)
+    else:
+        host, _, port = listen.rpartition(":")
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind((host, int(port)))
 
-    logger.debug("New input: %s", int.from_bytes(in_data))
-    keys = ["q", "w", "e", "r", "t", "y", "u", "i", "o", "p"]
-    n = 0
+    server_socket.listen(5)  # Set the maximum number of queued connections
+    logger.info("Server listening on %s", listen)
+    return server_socket
+
+
+def prepare_client(client_socket: socket.socket) -> None:
+    """Set up an upstream's connection."""
+    if client_socket.family == socket.AF_INET:
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)  # Notice if flaskcontroller goes away
+
+
+def serve_blocking(server_socket: socket.socket, receiver: Receiver, new_decoder: Callable) -> None:
+    """Serve one upstream at a time, the lowest latency for the usual single flaskcontroller."""
+    while True:
+        client_socket, client_address = server_socket.accept()
+        logger.info("Connection from: %s", client_address or "unix socket")
+        prepare_client(client_socket)
+        decoder = new_decoder()
+        with client_socket:
+            try:
+                while data := client_socket.recv(RECV_SIZE):
+                    receiver.receive(client_socket, decoder.feed(data))
+            except (OSError, ValueError):
+                logger.exception("Restarting Socket Client")
+        receiver.disconnect(client_socket)
+        logger.info("Upstream disconnected, keys released")
+
+
+async def serve_asyncio(server_socket: socket.socket, receiver: Receiver, new_decoder: Callable) -> None:
+    """Serve any number of upstreams at once."""
+
+    async def handle_upstream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client_socket = writer.get_extra_info("socket")
+        logger.info("Connection from: %s", writer.get_extra_info("peername") or "unix socket")
+        prepare_client(client_socket)
+        decoder = new_decoder()
+        try:
+            while data := await reader.read(RECV_SIZE):
+                receiver.receive(writer, decoder.feed(data))
+        except (OSError, ValueError):
+            logger.exception("Upstream connection failed")
+        finally:
+            receiver.disconnect(writer)
+            writer.close()
+            logger.info("Upstream disconnected, keys it held released")
+
+    if server_socket.family == socket.AF_INET:
+        server = await asyncio.start_server(handle_upstream, sock=server_socket)
+    else:
+        server = await asyncio.start_unix_server(handle_upstream, sock=server_socket)
+    async with server:
+        await server.serve_forever()
+
+
+def get_key_functions(dummy: bool, pause: float) -> tuple[Callable[[str], None], Callable[[str], None]]:  # noqa: FBT001
+    """Return the press and release functions, logging ones for the dummy server."""
+    if dummy:
+        return (lambda key: logger.info("Pressing %s", key)), (lambda key: logger.info("Releasing %s", key))
+
+    import pydirectinput
 
-    for key in keys:
-        if input_array[n] != last_input_array[n]:
-            if input_array[n]:
-                if DUMMY_SERVER:
-                    logging.info("Pressing %s", key)
-                else:
-                    pydirectinput.keyDown(key)
-            else:  # noqa: PLR5501 HUH?
-                if DUMMY_SERVER:
-                    logging.info("Releasing %s", key)
-                else:
-                    pydirectinput.keyUp(key)
-        n = n + 1
+    pydirectinput.PAUSE = pause  # pydirectinput sleeps this long after every press and release
+    return pydirectinput.keyDown, pydirectinput.keyUp
 
-    last_input_array = input_array
 
+def main() -> None:
+    """Listen for flaskcontroller and press keys."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("listen", nargs="?", default=DEFAULT_LISTEN, help="host:port or unix:/path to listen on")
+    parser.add_argument("--keys", default=DEFAULT_KEYS, help="Comma separated key for each button, bit 0 first")
+    parser.add_argument(
+        "--protocol", type=int, choices=sorted(DECODERS), default=1, help="flaskcontroller's protocol_version"
+    )
+    parser.add_argument("--asyncio", action="store_true", help="Serve several upstreams at once")
+    parser.add_argument("--dummy", action=argparse.BooleanOptionalAction, default=DUMMY_SERVER, help="Only log keys")
+    parser.add_argument("--pause", type=float, default=1 / 120, help="pydirectinput's pause after each key")
+    args = parser.parse_args()
 
-while True:
-    # Wait for a client to connect
-    client_socket, client_address = server_socket.accept()
-    logging.info("Connection from: %s", client_address)
+    press, release = get_key_functions(args.dummy, args.pause)
+    receiver = Receiver(Keyboard(args.keys.split(","), press, release))
+    server_socket = create_server_socket(args.listen)
+    with contextlib.suppress(KeyboardInterrupt):
+        if args.asyncio:
+            asyncio.run(serve_asyncio(server_socket, receiver, DECODERS[args.protocol]))
+        else:
+            serve_blocking(server_socket, receiver, DECODERS[args.protocol])
 
-    try:
-        while True:
-            # Receive and logging.info data from the client
-            data = client_socket.recv(2)
-            press_buttons(data)
-    except Exception:
-        logging.exception("Restarting Socket Client")
 
-    # Close the connection with the client
-    client_socket.close()
+if __name__ == "__main__":
+    main()
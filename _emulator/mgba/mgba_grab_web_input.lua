@@ -10,6 +10,33 @@ local port = 5001
 -- L  ,R  ,Down,Up,Left,Right,Start,Select,B,A
 
 INPUTBUFFER = {}
+RECVBUFFER = ""
+
+-- Match [app] protocol_version in the flaskcontroller config
+-- 1: bare 2 byte little endian state, 2: framed batches with sequence numbers
+PROTOCOL_VERSION = 1
+V2_MAGIC = 0xFC
+V2_HEADER = "<BBI4I2I2"
+V2_HEADER_SIZE = 10
+V2_ENTRY = "<I2B"
+V2_ENTRY_SIZE = 3
+EXPECTEDSEQ = nil
+
+-- Match [app] send_mode in the flaskcontroller config, true for "pull"
+-- Pull mode sends a frame tick every frame and sets the keys from the reply, one state per frame
+PULL_MODE = false
+PULL_MAGIC = 0xFD
+PULL_TICK = "<BI4"
+PULL_STATE = "<BI4I2"
+PULL_STATE_SIZE = 7
+LASTPULLSTATE = nil
+
+-- Match [app] latency_acks in the flaskcontroller config, needs PROTOCOL_VERSION 2 or PULL_MODE
+-- Acks every state on the frame it is applied, so flaskcontroller can measure input to applied latency
+LATENCY_ACKS = false
+ACK_MAGIC = 0xFE
+ACK = "<BI4I4"
+INPUTACKS = {} -- {socket id, sequence number} of each state in INPUTBUFFER
 
 console:log("-- Starting --")
 
@@ -30,21 +57,99 @@ function ST_format(id, msg, isError)
     return prefix .. msg
 end
 
+function SendAck(id, seq)
+    local sock = ST_SOCKETS[id]
+    if sock then
+        sock:send(string.pack(ACK, ACK_MAGIC, seq, emu:currentFrame() % 0x100000000))
+    end
+end
+
 function ST_error(id, err)
     console:error(ST_format(id, err, true))
     ST_stop(id)
 end
 
+-- Version 1, every 2 bytes is a state
+function ParseV1()
+    while #RECVBUFFER >= 2 do
+        table.insert(INPUTBUFFER, (string.unpack("<I2", RECVBUFFER)))
+        RECVBUFFER = string.sub(RECVBUFFER, 3)
+    end
+end
+
+-- Version 2, header then (state, run length) entries
+function ParseV2(id)
+    while #RECVBUFFER >= V2_HEADER_SIZE do
+        local magic, version, seq, nstates, nentries = string.unpack(V2_HEADER, RECVBUFFER)
+        if magic ~= V2_MAGIC or version ~= 2 then
+            console:error("Invalid frame header, dropping buffer")
+            RECVBUFFER = ""
+            return
+        end
+
+        local framesize = V2_HEADER_SIZE + nentries * V2_ENTRY_SIZE
+        if #RECVBUFFER < framesize then
+            return -- Rest of the frame hasn't arrived yet
+        end
+
+        if EXPECTEDSEQ ~= nil and seq ~= EXPECTEDSEQ then
+            console:log("Frame sequence gap, expected: " .. EXPECTEDSEQ .. " got: " .. seq)
+        end
+        EXPECTEDSEQ = (seq + 1) % 0x100000000
+
+        local offset = V2_HEADER_SIZE + 1
+        for _ = 1, nentries do
+            local state, run = string.unpack(V2_ENTRY, RECVBUFFER, offset)
+            for _ = 1, run do
+                table.insert(INPUTBUFFER, state)
+                if LATENCY_ACKS then
+                    table.insert(INPUTACKS, {id, seq})
+                end
+            end
+            offset = offset + V2_ENTRY_SIZE
+        end
+        RECVBUFFER = string.sub(RECVBUFFER, framesize + 1)
+    end
+end
+
+-- Pull mode, replies to our frame ticks, each is the state for the frame it names
+function ParsePull(id)
+    while #RECVBUFFER >= PULL_STATE_SIZE do
+        local magic, frame, state = string.unpack(PULL_STATE, RECVBUFFER)
+        if magic ~= PULL_MAGIC then
+            console:error("Invalid pull state, dropping buffer")
+            RECVBUFFER = ""
+            return
+        end
+        if state ~= LASTPULLSTATE then
+            console:log("Input: " .. state)
+            LASTPULLSTATE = state
+        end
+        emu:setKeys(state)
+        if LATENCY_ACKS then
+            SendAck(id, frame)
+        end
+        RECVBUFFER = string.sub(RECVBUFFER, PULL_STATE_SIZE + 1)
+    end
+end
+
 function ST_received(id)
     local sock = ST_SOCKETS[id]
     if not sock then
         return
     end
     while true do
-        local p, err = sock:receive(2)
+        local p, err = sock:receive(1024)
         if p then
-            -- Add input to input buffer
-            table.insert(INPUTBUFFER, p)
+            -- Add input to input buffer, reads can end part way through a state or frame
+            RECVBUFFER = RECVBUFFER .. p
+            if PULL_MODE then
+                ParsePull(id)
+            elseif PROTOCOL_VERSION == 2 then
+                ParseV2(id)
+            else
+                ParseV1()
+            end
         else
             if err ~= socket.ERRORS.AGAIN then
                 console:error(ST_format(id, err, true))
@@ -64,6 +169,8 @@ function ST_accept()
     local id = NEXTID
     NEXTID = id + 1
     ST_SOCKETS[id] = sock
+    RECVBUFFER = ""
+    EXPECTEDSEQ = nil
     sock:add("received", function()
         ST_received(id)
     end)
@@ -73,13 +180,29 @@ function ST_accept()
     console:log(ST_format(id, "Connected"))
 end
 
+-- Pull mode, ask every connected flaskcontroller for this frame's input
+function SendFrameTick()
+    local tick = string.pack(PULL_TICK, PULL_MAGIC, emu:currentFrame() % 0x100000000)
+    for _, sock in pairs(ST_SOCKETS) do
+        sock:send(tick)
+    end
+end
+
 -- This is the realest
 function SetTheKeys()
+    if PULL_MODE then
+        SendFrameTick()
+        return
+    end
     if next(INPUTBUFFER) ~= nil then
-        local p = table.remove(INPUTBUFFER)
-        local numhopefully = string.byte(p)
+        -- Oldest first, so presses come out in the order they were sent
+        local numhopefully = table.remove(INPUTBUFFER, 1)
         console:log("Input: " .. numhopefully)
         emu:setKeys(numhopefully)
+        if LATENCY_ACKS and next(INPUTACKS) ~= nil then
+            local ack = table.remove(INPUTACKS, 1)
+            SendAck(ack[1], ack[2])
+        end
     end
 end
 
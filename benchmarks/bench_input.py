@@ -0,0 +1,126 @@
+"""Microbenchmark for the /input handler, the hottest code in the app.
+
+Compares the work the handler used to do per request (rebuilding the input list and button dict,
+a linear `in` check, string slicing and formatting a debug string) with the precompiled INPUT_TABLE,
+then times whole requests through the Flask test client.
+
+Run from the repo root: python -m benchmarks.bench_input
+"""
+
+import logging
+import tempfile
+import timeit
+
+from flaskcontroller import controller, create_app
+
+N_DECODES = 200000
+N_REQUESTS = 5000
+INPUTS = ["D_GBA_A", "U_GBA_A", "D_GBA_DOWN", "U_GBA_DOWN", "INVALID"]
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_decode(da_input: str) -> tuple[int, bool] | None:
+    """The validation and decoding the /input handler did before INPUT_TABLE."""
+    valid_inputs = [
+        "D_GBA_L",
+        "U_GBA_L",
+        "D_GBA_R",
+        "U_GBA_R",
+        "D_GBA_START",
+        "U_GBA_START",
+        "D_GBA_B",
+        "U_GBA_B",
+        "D_GBA_A",
+        "U_GBA_A",
+        "D_GBA_SELECT",
+        "U_GBA_SELECT",
+        "D_GBA_LEFT",
+        "U_GBA_LEFT",
+        "D_GBA_UP",
+        "U_GBA_UP",
+        "D_GBA_RIGHT",
+        "U_GBA_RIGHT",
+        "D_GBA_DOWN",
+        "U_GBA_DOWN",
+    ]
+    button_code_dict = {
+        "GBA_A": 1,
+        "GBA_B": 2,
+        "GBA_SELECT": 4,
+        "GBA_START": 8,
+        "GBA_RIGHT": 16,
+        "GBA_LEFT": 32,
+        "GBA_UP": 64,
+        "GBA_DOWN": 128,
+        "GBA_R": 256,
+        "GBA_L": 512,
+    }
+
+    if da_input not in valid_inputs:
+        return None
+
+    pressed = da_input[:2] == "D_"
+    msg = "Input! Down: " + da_input[2:] if pressed else "Input! Up: " + da_input[2:]
+    logger.debug(msg)
+    msg = f"{button_code_dict[da_input[2:]]:b}".rjust(10, "0")
+    logger.debug(msg)
+    return button_code_dict[da_input[2:]], pressed
+
+
+def current_decode(da_input: str) -> tuple[int, bool] | None:
+    """The validation and decoding the /input handler does now."""
+    decoded_input = controller.INPUT_TABLE.get(da_input)
+    if decoded_input is not None and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Input! %s %s", da_input[2:], f"{decoded_input[0]:b}".rjust(10, "0"))
+    return decoded_input
+
+
+def bench_decode(func: callable) -> float:
+    """Return the average time per decode in nanoseconds."""
+    n_loops = N_DECODES // len(INPUTS)
+
+    def run() -> None:
+        for da_input in INPUTS:
+            func(da_input)
+
+    return min(timeit.repeat(run, number=n_loops, repeat=5)) / (n_loops * len(INPUTS)) * 1e9
+
+
+def bench_requests() -> float:
+    """Return the average time per /input request through the Flask test client in microseconds."""
+    with tempfile.TemporaryDirectory() as tmp_path:
+        app = create_app(
+            test_config={
+                "app": {"testing": {"dont_run_socket": True}},
+                "rate_limit": {"client_rate": 0, "address_rate": 0},  # One client, as fast as it can go
+                "flask": {"TESTING": True},
+            },
+            instance_path=tmp_path,
+        )
+        logging.getLogger().setLevel(logging.WARNING)
+        controller.input_logger.setLevel(logging.WARNING)  # Measure the handler, not the terminal
+        client = app.test_client()
+        headers = {"client-id": "BENCH"}
+
+        def run() -> None:
+            for da_input in INPUTS:
+                client.post(f"/input/{da_input}", headers=headers)
+
+        n_loops = N_REQUESTS // len(INPUTS)
+        return min(timeit.repeat(run, number=n_loops, repeat=3)) / (n_loops * len(INPUTS)) * 1e6
+
+
+def main() -> None:
+    """Run the benchmarks and print the results."""
+    assert all(legacy_decode(da_input) == current_decode(da_input) for da_input in INPUTS)  # noqa: S101
+
+    legacy = bench_decode(legacy_decode)
+    current = bench_decode(current_decode)
+    print(f"Decode, before:  {legacy:8.0f} ns/input")
+    print(f"Decode, after:   {current:8.0f} ns/input ({legacy / current:.1f}x faster)")
+    print(f"Whole request:   {bench_requests():8.1f} us/request (Flask test client)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark for the generic_keyboard bridge, decoding states and turning them into key presses.
+
+Feeds a synthetic stream of states, a few buttons changing at a time like real play, through the old
+per state code (a binary string per state, a list of booleans compared key by key) and the new
+StateDecoder and XOR diffing Keyboard, split into reads of random sizes like a real socket.
+Key presses are counted rather than made, this measures the bridge's own CPU time.
+
+Run from the repo root: python -m benchmarks.bench_keyboard
+"""
+
+import importlib.util
+import logging
+import os
+import random
+import timeit
+
+N_STATES = 100000
+N_BUTTONS = 10
+KEYS = ["q", "w", "e", "r", "t", "y", "u", "i", "o", "p"]
+GENERIC_KEYBOARD_PATH = os.path.join("_emulator", "generic_keyboard", "generic_keyboard.py")
+
+logger = logging.getLogger(__name__)
+
+
+def load_generic_keyboard() -> object:
+    """Import generic_keyboard.py, it is a script rather than part of a package."""
+    spec = importlib.util.spec_from_file_location("generic_keyboard", GENERIC_KEYBOARD_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_stream(n_states: int) -> tuple[bytes, list[bytes]]:
+    """Return n_states states toggling one or two buttons at a time, and the same bytes split into random reads."""
+    rng = random.Random(1)  # noqa: S311 Synthetic input, the same every run
+    state = 0
+    data = bytearray()
+    for _ in range(n_states):
+        for _ in range(rng.choice([1, 1, 1, 2])):
+            state ^= 1 << rng.randrange(N_BUTTONS)
+        data += state.to_bytes(2, "little")
+
+    reads = []
+    start = 0
+    while start < len(data):
+        size = rng.choice([1, 2, 3, 2, 7, 64])
+        reads.append(bytes(data[start : start + size]))
+        start += size
+    return bytes(data), reads
+
+
+def legacy_iterate_bits(num: int) -> list:
+    """The old generic_keyboard's state to list of booleans."""
+    input_array = []
+    binary_representation = bin(num)[2:]  # noqa: FURB116 As it was
+    binary_representation = binary_representation.zfill(10)
+    for _bit_position, bit_value in enumerate(binary_representation[::-1]):
+        logger.debug("Bit at position: %s:%s", _bit_position, bit_value)
+        new_bit_value = bit_value != "0"
+        input_array.append(new_bit_value)
+    return input_array
+
+
+def legacy_run(data: bytes, events: list) -> None:
+    """The old generic_keyboard's press_buttons, for every 2 byte recv (it couldn't handle partial reads)."""
+    last_input_array = [False] * N_BUTTONS
+    for start in range(0, len(data), 2):
+        in_data = data[start : start + 2]
+        input_array = legacy_iterate_bits(int.from_bytes(in_data, "little"))
+        logger.debug(str(input_array))
+        logger.debug("New input: %s", int.from_bytes(in_data))
+        n = 0
+        for key in KEYS:
+            if input_array[n] != last_input_array[n]:
+                events.append((key, input_array[n]))
+            n = n + 1
+        last_input_array = input_array
+
+
+def current_run(generic_keyboard: object, reads: list[bytes], events: list) -> None:
+    """The new StateDecoder and Keyboard, fed reads of random sizes."""
+    keyboard = generic_keyboard.Keyboard(
+        KEYS, press=lambda key: events.append((key, True)), release=lambda key: events.append((key, False))
+    )
+    receiver = generic_keyboard.Receiver(keyboard)
+    decoder = generic_keyboard.StateDecoder()
+    for data in reads:
+        receiver.receive(None, decoder.feed(data))
+
+
+def main() -> None:
+    """Run the benchmarks and print the results."""
+    generic_keyboard = load_generic_keyboard()
+    logging.getLogger().setLevel(logging.WARNING)
+    data, reads = synthetic_stream(N_STATES)
+
+    legacy_events = []
+    current_events = []
+    legacy_run(data, legacy_events)
+    current_run(generic_keyboard, reads, current_events)
+    assert legacy_events == current_events  # noqa: S101
+
+    legacy = min(timeit.repeat(lambda: legacy_run(data, []), number=1, repeat=5)) / N_STATES * 1e9
+    current = min(timeit.repeat(lambda: current_run(generic_keyboard, reads, []), number=1, repeat=5)) / N_STATES * 1e9
+    print(f"States: {N_STATES}, key events: {len(current_events)}, reads: {len(reads)}")
+    print(f"Before:  {legacy:8.0f} ns/state (whole 2 byte reads only)")
+    print(f"After:   {current:8.0f} ns/state ({legacy / current:.1f}x faster, reads of any size)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""End to end latency benchmark, from an HTTP input request to the bytes arriving on the emulator socket.
+
+Starts create_app with the real socket_sender thread pointed at a StubEmulator, then has client threads
+press and release their own button over and over, timing each input from the start of the request
+until the emulator socket receives a state with it applied. Runs through the Flask test client
+and through a real waitress server, for each tick rate and thread count.
+
+Results are printed and written as json so releases can be compared.
+
+Run from the repo root: python -m benchmarks.bench_latency --output bench_latency.json
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import platform
+import statistics
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime, timezone
+
+from waitress.server import create_server
+
+from flaskcontroller import controller, create_app
+from flaskcontroller.players import N_BUTTONS
+
+from .stub_emulator import StubEmulator
+
+BUTTONS = ["A", "B", "SELECT", "START", "RIGHT", "LEFT", "UP", "DOWN", "R", "L"]  # In bit order
+SENDER_STOP_TIMEOUT = 5
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(quantiles: list[float], p: int) -> float:
+    """Pick the pth percentile from the output of statistics.quantiles(n=100)."""
+    return quantiles[p - 1]
+
+
+def summarise(latencies: list[float], n_lost: int, elapsed: float) -> dict:
+    """Turn raw latencies in seconds into the numbers we report."""
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [latencies[0]] * 99
+    return {
+        "inputs": len(latencies) + n_lost,
+        "lost": n_lost,
+        "p50_ms": percentile(quantiles, 50) * 1000,
+        "p95_ms": percentile(quantiles, 95) * 1000,
+        "p99_ms": percentile(quantiles, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "throughput_rps": (len(latencies) + n_lost) / elapsed,
+    }
+
+
+def flask_client_poster(app: object) -> Callable[[], Callable[[str, str], None]]:
+    """Return a factory for per thread functions that post an input through the Flask test client."""
+
+    def make_poster() -> Callable[[str, str], None]:
+        client = app.test_client()
+
+        def post(da_input: str, client_id: str) -> None:
+            client.post(f"/input/{da_input}", headers={"client-id": client_id})
+
+        return post
+
+    return make_poster
+
+
+def waitress_poster(port: int) -> Callable[[], Callable[[str, str], None]]:
+    """Return a factory for per thread functions that post an input to waitress over a keep-alive connection."""
+
+    def make_poster() -> Callable[[str, str], None]:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+
+        def post(da_input: str, client_id: str) -> None:
+            conn.request("POST", f"/input/{da_input}", headers={"client-id": client_id})
+            conn.getresponse().read()
+
+        return post
+
+    return make_poster
+
+
+def run_clients(make_poster: Callable, stub: StubEmulator, n_threads: int, n_samples: int) -> dict:
+    """Have n_threads clients each press and release their own button, n_samples inputs each.
+
+    Each client waits for its input to reach the emulator before sending the next, so with the
+    default OR merge every client's button is independent of the others.
+    """
+    results = [[] for _ in range(n_threads)]
+    lost = [0] * n_threads
+    ready = threading.Barrier(n_threads + 1)
+
+    def client(index: int) -> None:
+        post = make_poster()
+        button = BUTTONS[index]
+        client_id = f"BENCH{index}"
+        ready.wait()
+        for sample in range(n_samples):
+            pressed = sample % 2 == 0
+            mark = stub.mark()
+            start = time.perf_counter()
+            post(f"{'D' if pressed else 'U'}_GBA_{button}", client_id)
+            arrived = stub.wait_for(1 << index, pressed, mark)
+            if arrived is None:
+                lost[index] += 1
+            else:
+                results[index].append(arrived - start)
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return summarise([latency for result in results for latency in result], sum(lost), elapsed)
+
+
+def start_app(tmp_path: str, stub: StubEmulator, tick_rate: float, protocol_version: int) -> tuple[object, list]:
+    """Create the app with the socket sender connected to the stub, returns the app and the sender thread(s)."""
+    threads_before = set(threading.enumerate())
+    controller._run_thread = True  # noqa: SLF001 The same kill switch the tests use
+    app = create_app(
+        test_config={
+            "app": {
+                "socket_address": stub.address,
+                "socket_port": stub.port,
+                "tick_rate": tick_rate,
+                "protocol_version": protocol_version,
+                "testing": {"dont_run_socket": False},
+            },
+            "logging": {"level": "WARNING"},
+            "rate_limit": {"client_rate": 0, "address_rate": 0},  # A few clients, as fast as they can go
+        },
+        instance_path=tmp_path,
+    )
+    controller.input_logger.setLevel(logging.WARNING)  # Measure the app, not the terminal
+
+    while not controller.fw_controller.get_sock_connected():
+        time.sleep(0.01)
+
+    return app, list(set(threading.enumerate()) - threads_before)
+
+
+def stop_app(sender_threads: list) -> None:
+    """Stop the socket sender so the next configuration starts clean."""
+    controller._run_thread = False  # noqa: SLF001
+    for thread in sender_threads:
+        thread.join(timeout=SENDER_STOP_TIMEOUT)
+
+
+def run_benchmark(
+    tick_rates: list[float], thread_counts: list[int], n_samples: int, protocol_version: int
+) -> list[dict]:
+    """Run every configuration, returns a result per configuration."""
+    results = []
+    for tick_rate in tick_rates:
+        for server, thread_counts_for_server in (("test_client", [1]), ("waitress", thread_counts)):
+            for n_threads in thread_counts_for_server:
+                stub = StubEmulator(protocol_version)
+                with tempfile.TemporaryDirectory() as tmp_path:
+                    app, sender_threads = start_app(tmp_path, stub, tick_rate, protocol_version)
+
+                    if server == "waitress":
+                        wsgi_server = create_server(app, host="127.0.0.1", port=0, threads=n_threads)
+                        threading.Thread(target=wsgi_server.run, daemon=True).start()
+                        make_poster = waitress_poster(wsgi_server.effective_port)
+                    else:
+                        make_poster = flask_client_poster(app)
+
+                    result = run_clients(make_poster, stub, n_threads, n_samples)
+
+                    if server == "waitress":
+                        wsgi_server.close()
+                    stop_app(sender_threads)
+                stub.close()
+
+                result = {
+                    "server": server,
+                    "tick_rate": tick_rate,
+                    "threads": n_threads,
+                    "sends": stub.frames,
+                    **result,
+                }
+                print(
+                    f"{server:<12} tick_rate: {tick_rate:>5} threads: {n_threads:>2}"
+                    f" p50: {result['p50_ms']:6.2f}ms p95: {result['p95_ms']:6.2f}ms p99: {result['p99_ms']:6.2f}ms"
+                    f" {result['throughput_rps']:8.0f} inputs/s lost: {result['lost']}"
+                )
+                results.append(result)
+
+    return results
+
+
+def main() -> None:
+    """Parse arguments, run the benchmark and write the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tick-rates", type=float, nargs="+", default=[60, 120, 240])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8], help=f"At most {N_BUTTONS}")
+    parser.add_argument("--samples", type=int, default=200, help="Inputs per client thread")
+    parser.add_argument("--protocol-version", type=int, default=1, choices=[1, 2])
+    parser.add_argument("--output", default="bench_latency.json", help="Where to write the json results")
+    args = parser.parse_args()
+
+    if max(args.threads) > N_BUTTONS:
+        parser.error(f"Each client thread needs its own button, at most {N_BUTTONS} threads")
+
+    results = run_benchmark(args.tick_rates, args.threads, args.samples, args.protocol_version)
+
+    report = {
+        "benchmark": "bench_latency",
+        "date": datetime.now(tz=timezone.utc).isoformat(),  # noqa: UP017 datetime.UTC is Python 3.11+
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "protocol_version": args.protocol_version,
+        "samples_per_thread": args.samples,
+        "results": results,
+    }
+    with open(args.output, "w") as json_file:
+        json.dump(report, json_file, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
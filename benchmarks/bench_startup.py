@@ -0,0 +1,75 @@
+"""Benchmark for starting the app, what a restarted worker or each test pays before serving anything.
+
+Times importing flaskcontroller in a fresh interpreter, and create_app loading an existing config.toml,
+and checks that loading an unchanged config doesn't write it again or import anything it doesn't need.
+
+Run from the repo root: python -m benchmarks.bench_startup
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from flaskcontroller import create_app
+
+N_IMPORTS = 10
+N_CREATES = 50
+LAZY_MODULES = ["asyncio", "colorama", "multiprocessing.shared_memory", "flaskcontroller.websocket"]
+
+IMPORT_CODE = f"""
+import sys, time
+start = time.perf_counter()
+import flaskcontroller
+print(time.perf_counter() - start)
+print(",".join(module for module in {LAZY_MODULES!r} if module in sys.modules))
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def bench_import() -> tuple[float, str]:
+    """Return the fastest import of flaskcontroller in a new interpreter in ms, and the lazy modules it loaded."""
+    times = []
+    for _ in range(N_IMPORTS):
+        result = subprocess.run(  # noqa: S603 Our own code
+            [sys.executable, "-c", IMPORT_CODE], capture_output=True, text=True, check=True
+        )
+        seconds, loaded = result.stdout.splitlines()
+        times.append(float(seconds))
+    return min(times) * 1e3, loaded or "none"
+
+
+def bench_create_app() -> tuple[float, float, bool]:
+    """Return create_app's first and fastest times in ms with an existing config, and if the config was rewritten."""
+    with tempfile.TemporaryDirectory() as tmp_path:
+        # Write the config.toml the way a deployment would have it, then load it like a restart does
+        create_app(
+            test_config={"app": {"testing": {"dont_run_socket": True}}, "flask": {"TESTING": True}},
+            instance_path=tmp_path,
+        )
+        logging.getLogger().setLevel(logging.WARNING)
+        config_path = os.path.join(tmp_path, "config.toml")
+        written = os.stat(config_path).st_mtime_ns
+
+        first = timeit.timeit(lambda: create_app(instance_path=tmp_path), number=1)
+        fastest = min(timeit.repeat(lambda: create_app(instance_path=tmp_path), number=1, repeat=N_CREATES))
+        rewritten = os.stat(config_path).st_mtime_ns != written
+
+    return first * 1e3, fastest * 1e3, rewritten
+
+
+def main() -> None:
+    """Run the benchmarks and print the results."""
+    import_ms, loaded = bench_import()
+    first_ms, fastest_ms, rewritten = bench_create_app()
+    print(f"Import:                 {import_ms:6.1f} ms (lazy modules loaded: {loaded})")
+    print(f"create_app, first:      {first_ms:6.1f} ms")
+    print(f"create_app, fastest:    {fastest_ms:6.1f} ms (of {N_CREATES})")
+    print(f"Unchanged config rewritten: {rewritten}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+"""Load generator, hundreds or thousands of virtual players against a real server, to plan capacity before big events.
+
+Starts create_app under waitress in its own process, so the players here don't share its GIL, with the
+socket sender pointed at a StubEmulator. Each virtual player has its own client-id, polls /GetStatus every
+STATUS_INTERVAL seconds like the page does, and presses buttons the way people do: mostly taps, some holds,
+with a pause before the next. A probe player presses a button none of the others use and times each input
+from the request to the state arriving at the emulator, the end to end latency everyone feels under the load.
+
+For every player count, waitress thread count and tick rate it reports the request rate achieved, the error
+rate (failed requests and anything but a 200, 429s are counted on their own too), the server's input queue
+depth, HTTP and end to end latency percentiles, and how far behind its own schedule the generator fell.
+The players are spread over --processes generator processes of --clients threads each. If the generator falls
+far behind its schedule it was the limit, not the server, add processes or use a bigger machine.
+
+Run from the repo root: python -m benchmarks.loadgen --players 500 5000 --threads 4 16 --tick-rates 60 120
+"""
+
+import argparse
+import contextlib
+import heapq
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from waitress.server import create_server
+
+from flaskcontroller import controller, create_app
+
+from .bench_latency import BUTTONS
+from .stub_emulator import StubEmulator
+
+STATUS_INTERVAL = 5  # Seconds between each player's /GetStatus, what the page does
+TAP_SECONDS = (0.05, 0.2)  # Most presses are let go after this long
+HOLD_SECONDS = (0.5, 3)  # The rest are held for this long
+HOLD_CHANCE = 0.2
+PAUSE_SECONDS = (0.2, 2)  # From letting go of one button to pressing the next
+PLAYER_BUTTONS = BUTTONS[:-1]
+PROBE_BUTTON = BUTTONS[-1]  # Only the probe presses this one, so its states can be told apart from everyone's
+PROBE_INTERVAL = 0.1  # Seconds between the probe's inputs
+SAMPLE_INTERVAL = 0.25  # Seconds between samples of the server's status
+SERVER_START_TIMEOUT = 30
+
+logger = logging.getLogger(__name__)
+
+
+def summarise_ms(values: list[float]) -> dict:
+    """Return the p50, p95, p99 and max of values in seconds, as milliseconds."""
+    if not values:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    quantiles = statistics.quantiles(values, n=100) if len(values) > 1 else [values[0]] * 99
+    return {
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "max_ms": max(values) * 1000,
+    }
+
+
+def serve(emulator_port: int, tick_rate: float, n_threads: int, n_players: int, instance_path: str) -> None:
+    """Run the app under waitress in this process, prints the port once it is listening."""
+    app = create_app(
+        test_config={
+            "app": {
+                "socket_address": "127.0.0.1",
+                "socket_port": emulator_port,
+                "tick_rate": tick_rate,
+                "max_players": n_players + 1,  # And the probe
+                "testing": {"dont_run_socket": False},
+            },
+            "logging": {"level": "WARNING"},
+            "rate_limit": {"address_rate": 0},  # Every player comes from 127.0.0.1, the client limit stays on
+        },
+        instance_path=instance_path,
+    )
+    controller.input_logger.setLevel(logging.WARNING)  # Measure the app, not the terminal
+    logging.getLogger("waitress.queue").setLevel(logging.ERROR)  # Queued requests are expected, it's a load test
+    wsgi_server = create_server(app, host="127.0.0.1", port=0, threads=n_threads)
+    print(wsgi_server.effective_port, flush=True)
+    wsgi_server.run()
+
+
+def start_server(
+    stub: StubEmulator, tick_rate: float, n_threads: int, n_players: int, instance_path: str
+) -> tuple[subprocess.Popen, int]:
+    """Start serve() in a new process, returns it and the port once the sender is connected to the stub."""
+    process = subprocess.Popen(  # noqa: S603 Our own code
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.loadgen",
+            "--serve",
+            "--emulator-port",
+            str(stub.port),
+            "--tick-rates",
+            str(tick_rate),
+            "--threads",
+            str(n_threads),
+            "--players",
+            str(n_players),
+            "--instance-path",
+            instance_path,
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    port = int(process.stdout.readline())
+
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while not get_status(conn).get("sock_connected"):
+        if time.monotonic() > deadline:
+            process.kill()
+            msg = "The server's socket sender didn't connect to the stub emulator"
+            raise RuntimeError(msg)
+        time.sleep(0.05)
+    conn.close()
+    return process, port
+
+
+def get_status(conn: http.client.HTTPConnection) -> dict:
+    """GET /GetStatus without a client-id, so the sampler isn't counted as a player."""
+    conn.request("GET", "/GetStatus")
+    return json.loads(conn.getresponse().read())
+
+
+def request(conn: http.client.HTTPConnection, method: str, path: str, client_id: str) -> int | None:
+    """Make a request on a keep-alive connection, returns the status or None if the request failed."""
+    try:
+        conn.request(method, path, headers={"client-id": client_id})
+        response = conn.getresponse()
+        response.read()
+    except (OSError, http.client.HTTPException):
+        conn.close()  # http.client reconnects on the next request
+        return None
+    return response.status
+
+
+def new_stats() -> dict:
+    """Return empty counters for one generator thread."""
+    return {"requests": 0, "errors": 0, "rate_limited": 0, "http_latencies": [], "behind": []}
+
+
+def record(stats: dict, status: int | None, latency: float) -> None:
+    """Count a request."""
+    stats["requests"] += 1
+    stats["http_latencies"].append(latency)
+    if status != http.client.OK:
+        stats["errors"] += 1
+    if status == http.client.TOO_MANY_REQUESTS:
+        stats["rate_limited"] += 1
+
+
+def run_players(port: int, player_ids: list[str], until: float, seed: int, stats: dict) -> None:
+    """Play as every player in player_ids on one connection until time.monotonic() reaches until.
+
+    Each player's next action sits in a heap by when it is due, the thread sleeps until the earliest.
+    """
+    rng = random.Random(seed)  # noqa: S311 Synthetic players
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    now = time.monotonic()
+    due = []  # (time due, player id, action, button)
+    for player_id in player_ids:
+        due.append((now + rng.uniform(0, STATUS_INTERVAL), player_id, "status", ""))
+        due.append((now + rng.uniform(0, PAUSE_SECONDS[1]), player_id, "press", ""))
+    heapq.heapify(due)
+
+    while due:
+        when, player_id, action, button = heapq.heappop(due)
+        if when >= until:
+            break
+        now = time.monotonic()
+        if when > now:
+            time.sleep(when - now)
+        stats["behind"].append(max(0.0, now - when))
+
+        start = time.perf_counter()
+        if action == "status":
+            status = request(conn, "GET", "/GetStatus", player_id)
+            heapq.heappush(due, (when + STATUS_INTERVAL, player_id, "status", ""))
+        elif action == "press":
+            button = rng.choice(PLAYER_BUTTONS)
+            status = request(conn, "POST", f"/input/D_GBA_{button}", player_id)
+            hold = rng.uniform(*(HOLD_SECONDS if rng.random() < HOLD_CHANCE else TAP_SECONDS))
+            heapq.heappush(due, (when + hold, player_id, "release", button))
+        else:
+            status = request(conn, "POST", f"/input/U_GBA_{button}", player_id)
+            heapq.heappush(due, (when + rng.uniform(*PAUSE_SECONDS), player_id, "press", ""))
+        record(stats, status, time.perf_counter() - start)
+
+    conn.close()
+
+
+def run_generator(port: int, player_ids: list[str], n_clients: int, until: float, seed: int) -> dict:
+    """Run player_ids over n_clients threads in this process, returns their stats added together."""
+    stats = [new_stats() for _ in range(n_clients)]
+    threads = [
+        threading.Thread(
+            target=run_players, args=(port, player_ids[index::n_clients], until, seed * n_clients + index, stats[index])
+        )
+        for index in range(n_clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    total = new_stats()
+    for thread_stats in stats:
+        for key, value in thread_stats.items():
+            total[key] += value
+    return total
+
+
+def run_probe(port: int, stub: StubEmulator, until: float, latencies: list[float]) -> int:
+    """Press and release the probe button until until, timing each input to the emulator. Returns inputs lost."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    lost = 0
+    pressed = True
+    while time.monotonic() < until:
+        mark = stub.mark()
+        start = time.perf_counter()
+        request(conn, "POST", f"/input/{'D' if pressed else 'U'}_GBA_{PROBE_BUTTON}", "PROBE")
+        arrived = stub.wait_for(1 << BUTTONS.index(PROBE_BUTTON), pressed, mark)
+        if arrived is None:
+            lost += 1
+        else:
+            latencies.append(arrived - start)
+        pressed = not pressed
+        time.sleep(PROBE_INTERVAL)
+    conn.close()
+    return lost
+
+
+def sample_server(port: int, until: float, samples: list[dict]) -> None:
+    """Sample the server's status until until."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    while time.monotonic() < until:
+        with contextlib.suppress(OSError, http.client.HTTPException, ValueError):
+            samples.append(get_status(conn))
+        time.sleep(SAMPLE_INTERVAL)
+    conn.close()
+
+
+def run_load(port: int, stub: StubEmulator, n_players: int, generator: tuple[int, int], duration: float) -> dict:
+    """Run n_players virtual players for duration seconds, returns the results.
+
+    Args:
+        port: The server's port.
+        stub: The emulator the server is sending to, for the probe.
+        n_players: Virtual players.
+        generator: (processes, threads per process) to spread the players over.
+        duration: Seconds to run for.
+    """
+    n_processes, n_clients = generator
+    player_ids = [f"LOAD{index}" for index in range(n_players)]
+    probe_latencies = []
+    samples = []
+    probe_lost = []
+
+    with ProcessPoolExecutor(max_workers=n_processes) as pool:
+        # time.monotonic() is the same clock in every process
+        until = time.monotonic() + duration
+        start = time.perf_counter()
+        futures = [
+            pool.submit(run_generator, port, player_ids[index::n_processes], n_clients, until, index)
+            for index in range(n_processes)
+        ]
+        threads = [
+            threading.Thread(target=sample_server, args=(port, until, samples)),
+            threading.Thread(target=lambda: probe_lost.append(run_probe(port, stub, until, probe_latencies))),
+        ]
+        for thread in threads:
+            thread.start()
+        stats = [future.result() for future in futures]
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    n_requests = sum(thread_stats["requests"] for thread_stats in stats)
+    n_errors = sum(thread_stats["errors"] for thread_stats in stats)
+    depths = [sample["input_queue"]["depth"] for sample in samples if "input_queue" in sample]
+    return {
+        "requests": n_requests,
+        "request_rate": n_requests / elapsed,
+        "error_rate": n_errors / n_requests if n_requests else 0.0,
+        "rate_limited": sum(thread_stats["rate_limited"] for thread_stats in stats),
+        "players_connected": max((sample["players_connected"] for sample in samples), default=0),
+        "queue_depth_mean": statistics.fmean(depths) if depths else 0.0,
+        "queue_depth_max": max(depths, default=0),
+        "queue_dropped": samples[-1]["input_queue"]["dropped"] if depths else 0,
+        "http": summarise_ms([latency for thread_stats in stats for latency in thread_stats["http_latencies"]]),
+        "end_to_end": {**summarise_ms(probe_latencies), "lost": sum(probe_lost)},
+        "behind": summarise_ms([behind for thread_stats in stats for behind in thread_stats["behind"]]),
+    }
+
+
+def run_sweep(
+    player_counts: list[int],
+    thread_counts: list[int],
+    tick_rates: list[float],
+    generator: tuple[int, int],
+    duration: float,
+) -> list[dict]:
+    """Run every configuration, returns a result per configuration."""
+    results = []
+    for n_players in player_counts:
+        for n_threads in thread_counts:
+            for tick_rate in tick_rates:
+                stub = StubEmulator()
+                with tempfile.TemporaryDirectory() as instance_path:
+                    process, port = start_server(stub, tick_rate, n_threads, n_players, instance_path)
+                    try:
+                        result = run_load(port, stub, n_players, generator, duration)
+                    finally:
+                        process.terminate()
+                        process.wait()
+                stub.close()
+
+                result = {"players": n_players, "threads": n_threads, "tick_rate": tick_rate, **result}
+                print(
+                    f"players: {n_players:>5} threads: {n_threads:>2} tick_rate: {tick_rate:>5}"
+                    f" {result['request_rate']:7.0f} req/s errors: {result['error_rate']:6.2%}"
+                    f" (429: {result['rate_limited']}) queue max: {result['queue_depth_max']:>4}"
+                    f" http p99: {result['http']['p99_ms']:7.2f}ms"
+                    f" end to end p50: {result['end_to_end']['p50_ms']:6.2f}ms"
+                    f" p99: {result['end_to_end']['p99_ms']:6.2f}ms"
+                    f" behind p99: {result['behind']['p99_ms']:7.2f}ms"
+                )
+                results.append(result)
+    return results
+
+
+def main() -> None:
+    """Parse arguments, run the sweep and write the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, nargs="+", default=[500], help="Virtual players")
+    parser.add_argument("--threads", type=int, nargs="+", default=[4, 16], help="waitress threads")
+    parser.add_argument("--tick-rates", type=float, nargs="+", default=[120])
+    parser.add_argument("--processes", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Generator processes")
+    parser.add_argument("--clients", type=int, default=16, help="Generator threads per process")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per configuration")
+    parser.add_argument("--output", default="loadgen.json", help="Where to write the json results")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)  # The server process
+    parser.add_argument("--emulator-port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--instance-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.emulator_port, args.tick_rates[0], args.threads[0], args.players[0], args.instance_path)
+        return
+
+    results = run_sweep(args.players, args.threads, args.tick_rates, (args.processes, args.clients), args.duration)
+
+    report = {
+        "benchmark": "loadgen",
+        "date": datetime.now(tz=timezone.utc).isoformat(),  # noqa: UP017 datetime.UTC is Python 3.11+
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processes": args.processes,
+        "clients": args.clients,
+        "duration": args.duration,
+        "results": results,
+    }
+    with open(args.output, "w") as json_file:
+        json.dump(report, json_file, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
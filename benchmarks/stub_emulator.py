@@ -0,0 +1,86 @@
+"""Stand-in for an emulator script, listens like _emulator/generic_keyboard but records what it receives.
+
+Every input state that arrives is stored with the time it arrived, so benchmarks can measure how long
+an input takes to get from a request to the emulator socket.
+"""
+
+import logging
+import socket
+import threading
+import time
+
+from flaskcontroller.protocol import PROTOCOL_V2, V1_STATE, FrameDecoder
+
+logger = logging.getLogger(__name__)
+
+
+class StubEmulator:
+    """Socket listener in a background thread, records (arrival time, state) for every state received."""
+
+    def __init__(self, protocol_version: int = 1, address: str = "127.0.0.1", port: int = 0) -> None:
+        """Start listening, port 0 picks a free one."""
+        self.protocol_version = protocol_version
+        self.states = []  # (time.perf_counter() when it arrived, state)
+        self.frames = 0  # Sends from flaskcontroller, one recv can hold several
+        self._received = threading.Condition()
+        self._server = socket.create_server((address, port))
+        self.address, self.port = self._server.getsockname()[:2]
+        self._thread = threading.Thread(target=self._run, daemon=True, name="stub_emulator")
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stop listening, the connection is closed when the sender goes away."""
+        self._server.close()
+
+    def _run(self) -> None:
+        """Accept connections one at a time, like the emulator scripts."""
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return  # Closed
+            with conn:
+                self._receive(conn)
+
+    def _receive(self, conn: socket.socket) -> None:
+        """Read states until the sender disconnects."""
+        decoder = FrameDecoder()
+        buffer = b""
+        while data := conn.recv(4096):
+            now = time.perf_counter()
+            if self.protocol_version == PROTOCOL_V2:
+                new_states = [state for frame in decoder.feed(data) for state in frame.states]
+            else:
+                buffer += data
+                n_whole = len(buffer) - len(buffer) % V1_STATE.size
+                new_states = [state for (state,) in V1_STATE.iter_unpack(buffer[:n_whole])]
+                buffer = buffer[n_whole:]
+
+            with self._received:
+                self.frames += 1
+                self.states.extend((now, state) for state in new_states)
+                self._received.notify_all()
+
+    def mark(self) -> int:
+        """Return a position in the received states, to wait for states that arrive after it."""
+        with self._received:
+            return len(self.states)
+
+    def wait_for(self, mask: int, pressed: bool, mark: int, timeout: float = 2) -> float | None:  # noqa: FBT001
+        """Wait for a state after mark with the buttons in mask pressed (or released).
+
+        Returns:
+            The time the state arrived, or None if it didn't arrive in time.
+        """
+        deadline = time.perf_counter() + timeout
+        with self._received:
+            while True:
+                for arrived, state in self.states[mark:]:
+                    if bool(state & mask) == pressed:
+                        return arrived
+                mark = len(self.states)
+
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                self._received.wait(remaining)
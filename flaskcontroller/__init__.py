@@ -1,11 +1,15 @@
 """Flask webapp flaskcontroller."""
 
+import logging
+import sys
 from pprint import pformat
 
 from flask import Flask, render_template
 
 from . import config, controller, logger
 
+WEBSOCKET_MODULE = f"{__name__}.websocket"  # Imported when the websocket is enabled, it brings in asyncio
+
 
 def create_app(test_config: dict | None = None, instance_path: str | None = None) -> Flask:
     """Create and configure an instance of the Flask application."""
@@ -33,12 +37,13 @@ def create_app(test_config: dict | None = None, instance_path: str | None = None
         if key != "flask":
             app.config[key] = value
 
-    # Do some debug logging of config
-    app_config_str = ">>>\nFlask config:"
-    for key, value in app.config.items():
-        app_config_str += f"\n  {key}: {pformat(value)}"
+    # Do some debug logging of config, pretty printing all of it is only worth it if it'll be seen
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app_config_str = ">>>\nFlask config:"
+        for key, value in app.config.items():
+            app_config_str += f"\n  {key}: {pformat(value)}"
 
-    app.logger.debug(app_config_str)
+        app.logger.debug(app_config_str)
 
     # Register blueprints
     app.register_blueprint(controller.bp)
@@ -47,12 +52,26 @@ def create_app(test_config: dict | None = None, instance_path: str | None = None
     # Since we use `from flask import current_app` in the imported modules to get the config
     with app.app_context():
         controller.start_socket_sender()  # This runs the function that initialises the socket sender
+        # Optional persistent input channel, off by default. Also run if an earlier app started one, to stop it.
+        if fc_conf["app"]["websocket_enabled"] or WEBSOCKET_MODULE in sys.modules:
+            from . import websocket
+
+            websocket.start_websocket_server()
 
     # Flask homepage, generally don't have this as a blueprint.
     @app.route("/")
     def home() -> str:
         """Flask home."""
-        return render_template("home.html.j2")  # Return a webpage
+        # The js connects to the websocket if there is a port to connect to
+        websocket_port = 0
+        if app.config["app"]["websocket_enabled"]:
+            from . import websocket
+
+            websocket_port = websocket.get_websocket_port()
+        # Otherwise to the status stream if that is on, each one holds a web server thread so it is off by default
+        status_stream = int(int(app.config["app"]["status_stream_clients"]) > 0)
+        # Return a webpage
+        return render_template("home.html.j2", websocket_port=websocket_port, status_stream=status_stream)
 
     app.logger.info("Starting Web Server")
 
@@ -1,22 +1,62 @@
 """Config loading, setup, validating, writing."""
 
 import contextlib
+import copy
+import hashlib
 import logging
 import os
 import pwd
+import socket
+import threading
 
 import tomlkit
 
+from .input_queue import OVERFLOW_POLICIES
+from .journal import HEADER, RECORD
+from .players import MERGE_MODES
+from .protocol import PROTOCOL_V1, PROTOCOL_VERSIONS, SEND_MODES, SEND_PUSH
+from .sender import parse_target
+
 # Logging should be all done at INFO level or higher as the log level hasn't been set yet
 # Modules should all setup logging like this so the log messages include the modules name.
 logger = logging.getLogger(__name__)
 
+JOURNAL_MIN_BYTES = HEADER.size + RECORD.size  # Room for at least one record per file
+
+RELOADABLE_KEYS = ["tick_rate", "targets", "socket_address", "socket_port"]  # [app] keys applied without a restart
+
+_parsed_files = {}  # Config file path -> (sha256 of its contents, the config parsed into plain dicts), see _load_file()
+
 # Default config dictionary, also works as a schema
 DEFAULT_CONFIG = {
     "app": {
         "socket_address": "127.0.0.1",
         "socket_port": 5001,
+        "targets": [],
+        "socket_nodelay": True,
+        "socket_keepalive": True,
+        "socket_keepalive_idle": 10,
+        "socket_keepalive_interval": 5,
+        "socket_keepalive_count": 3,
+        "socket_sndbuf": 0,
+        "reconnect_delay": 1,
+        "reconnect_max_delay": 30,
+        "input_ttl": 0,
         "tick_rate": 120,
+        "input_queue_size": 1024,
+        "input_queue_overflow": "drop_oldest",
+        "protocol_version": 1,
+        "send_mode": "push",
+        "latency_acks": False,
+        "player_timeout": 7,
+        "max_players": 10000,
+        "merge_mode": "or",
+        "websocket_enabled": False,
+        "websocket_address": "127.0.0.1",
+        "websocket_port": 5002,
+        "status_stream_clients": 0,
+        "shared_memory_name": "flaskcontroller",
+        "config_reload_interval": 1,
         "testing": {
             "dont_run_socket": False,
         },
@@ -24,6 +64,21 @@ DEFAULT_CONFIG = {
     "logging": {
         "level": "INFO",
         "path": "",
+        "max_bytes": 1000000,
+        "backup_count": 5,
+        "queued": False,
+        "queue_size": 10000,
+    },
+    "journal": {  # Binary journal of every state sent to the emulator, off if path is empty, see journal.py
+        "path": "",
+        "max_bytes": 10000000,
+        "backup_count": 5,
+    },
+    "rate_limit": {  # Requests per second to /input, /inputs and /GetStatus, see ratelimit.py, a rate of 0 is no limit
+        "client_rate": 30,
+        "client_burst": 60,
+        "address_rate": 120,
+        "address_burst": 240,
     },
     "flask": {  # This section is for Flask default config entries https://flask.palletsprojects.com/en/3.0.x/config/
         "DEBUG": False,
@@ -45,6 +100,15 @@ class ConfigValidationError(Exception):
         super().__init__(failure_list)
 
 
+def get_config_paths(instance_path: str) -> list[str]:
+    """Return the paths a config file is looked for at, the first one found is used."""
+    return [
+        os.path.join(instance_path, "config.toml"),
+        os.path.expanduser("~/.config/flaskcontroller/config.toml"),
+        "/etc/flaskcontroller/config.toml",
+    ]
+
+
 class FlaskControllerConfig:
     """Config Object."""
 
@@ -57,11 +121,12 @@ class FlaskControllerConfig:
         """
         self._config_path = None
         self._config = DEFAULT_CONFIG
+        self._from_file = not config
         self.instance_path = instance_path
 
         self._get_config_file_path()
 
-        if not config:  # If no config is passed in (for testing), we load from a file.
+        if self._from_file:  # If no config is passed in (for testing), we load from a file.
             config = self._load_file()
 
         self._config = self._merge_with_defaults(DEFAULT_CONFIG, config)
@@ -94,10 +159,27 @@ class FlaskControllerConfig:
         return self._config.items()
 
     def _write_config(self) -> None:
-        """Write configuration to a file."""
+        """Write configuration to a file, if it differs from what is already there.
+
+        Written to a temporary file and moved into place, so another process loading the config
+        (multi process mode) never reads a half written file.
+        """
         try:
-            with open(self._config_path, "w", encoding="utf8") as toml_file:
-                tomlkit.dump(self._config, toml_file)
+            with contextlib.suppress(FileNotFoundError):
+                if self._load_file() == self._config:
+                    logger.debug("Config file is up to date, not writing it")
+                    return
+
+            document = self._config
+            # Add the missing keys to the file as loaded, so it keeps its comments and formatting
+            if self._from_file and os.path.isfile(self._config_path):
+                with open(self._config_path, encoding="utf8") as toml_file:
+                    document = self._merge_with_defaults(self._config, tomlkit.load(toml_file))
+
+            temp_path = f"{self._config_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf8") as toml_file:
+                tomlkit.dump(document, toml_file)
+            os.replace(temp_path, self._config_path)
         except PermissionError as exc:
             user_account = pwd.getpwuid(os.getuid())[0]
             err = f"Fix permissions: chown {user_account} {self._config_path}"
@@ -115,10 +197,107 @@ class FlaskControllerConfig:
         ):
             failed_items.append("['flask']['TESTING'] is True but instance_path is not a tmp_path")
 
+        failed_items.extend(self._validate_app_config(self._config["app"]))
+
+        if int(self._config["journal"]["max_bytes"]) < JOURNAL_MIN_BYTES:
+            failed_items.append(f"['journal']['max_bytes'] must be at least {JOURNAL_MIN_BYTES}")
+
+        failed_items.extend(self._validate_rate_limit_config(self._config["rate_limit"]))
+
         # If the config doesn't validate, we exit.
         if len(failed_items) != 0:
             raise ConfigValidationError(failed_items)
 
+    def _validate_app_config(self, app_conf: dict) -> list[str]:
+        """Validate the [app] section, returns the failed items."""
+        failed_items = self._validate_link_config(app_conf)
+        failed_items += self._validate_protocol_config(app_conf)
+
+        if float(app_conf["tick_rate"]) <= 0:
+            failed_items.append("['app']['tick_rate'] must be greater than 0")
+
+        if app_conf["input_queue_overflow"] not in OVERFLOW_POLICIES:
+            failed_items.append(f"['app']['input_queue_overflow'] must be one of {OVERFLOW_POLICIES}")
+
+        if app_conf["merge_mode"] not in MERGE_MODES:
+            failed_items.append(f"['app']['merge_mode'] must be one of {MERGE_MODES}")
+
+        if int(app_conf["input_queue_size"]) < 1:
+            failed_items.append("['app']['input_queue_size'] must be at least 1")
+
+        if float(app_conf["config_reload_interval"]) < 0:
+            failed_items.append("['app']['config_reload_interval'] must be 0 (off) or more")
+
+        if int(app_conf["status_stream_clients"]) < 0:
+            failed_items.append("['app']['status_stream_clients'] must be 0 or more")
+
+        shared_memory_name = str(app_conf["shared_memory_name"])
+        if not shared_memory_name or "/" in shared_memory_name:
+            failed_items.append("['app']['shared_memory_name'] must be set and can't contain /")
+
+        return failed_items
+
+    def _validate_protocol_config(self, app_conf: dict) -> list[str]:
+        """Validate what is sent to the emulator and how, returns the failed items."""
+        failed_items = []
+        if app_conf["protocol_version"] not in PROTOCOL_VERSIONS:
+            failed_items.append(f"['app']['protocol_version'] must be one of {PROTOCOL_VERSIONS}")
+
+        if app_conf["send_mode"] not in SEND_MODES:
+            failed_items.append(f"['app']['send_mode'] must be one of {SEND_MODES}")
+
+        # Acks name the state they are for by its sequence number, version 1 states don't have one
+        pushing_v1 = app_conf["send_mode"] == SEND_PUSH and app_conf["protocol_version"] == PROTOCOL_V1
+        if app_conf["latency_acks"] and pushing_v1:
+            failed_items.append("['app']['latency_acks'] needs protocol_version 2 or send_mode pull")
+
+        return failed_items
+
+    def _validate_link_config(self, app_conf: dict) -> list[str]:
+        """Validate the emulator link settings in the [app] section, returns the failed items."""
+        failed_items = []
+
+        for target in app_conf["targets"]:
+            try:
+                _, port = parse_target(str(target))
+            except ValueError:
+                failed_items.append(f"['app']['targets'] has an invalid target: {target}, expected host:port")
+                continue
+            if port is None and not hasattr(socket, "AF_UNIX"):
+                failed_items.append(f"['app']['targets'] has a unix socket target: {target}, not on this platform")
+
+        failed_items.extend(
+            f"['app']['{key}'] must be at least 1"
+            for key in ["socket_keepalive_idle", "socket_keepalive_interval", "socket_keepalive_count"]
+            if int(app_conf[key]) < 1
+        )
+
+        if int(app_conf["socket_sndbuf"]) < 0:
+            failed_items.append("['app']['socket_sndbuf'] must be 0 (OS default) or more")
+
+        if float(app_conf["reconnect_delay"]) <= 0:
+            failed_items.append("['app']['reconnect_delay'] must be greater than 0")
+
+        if float(app_conf["reconnect_max_delay"]) < float(app_conf["reconnect_delay"]):
+            failed_items.append("['app']['reconnect_max_delay'] must be at least ['app']['reconnect_delay']")
+
+        if float(app_conf["input_ttl"]) < 0:
+            failed_items.append("['app']['input_ttl'] must be 0 or more")
+
+        return failed_items
+
+    def _validate_rate_limit_config(self, rate_limit_conf: dict) -> list[str]:
+        """Validate the [rate_limit] section, returns the failed items."""
+        failed_items = []
+
+        for limit in ["client", "address"]:
+            if float(rate_limit_conf[f"{limit}_rate"]) < 0:
+                failed_items.append(f"['rate_limit']['{limit}_rate'] must be 0 (no limit) or more")
+            elif float(rate_limit_conf[f"{limit}_rate"]) > 0 and float(rate_limit_conf[f"{limit}_burst"]) < 1:
+                failed_items.append(f"['rate_limit']['{limit}_burst'] must be at least 1")
+
+        return failed_items
+
     def _warn_unexpected_keys(self, target_dict: dict, base_dict: dict, parent_key: str) -> dict:
         """If the loaded config has a key that isn't in the schema (default config), we log a warning.
 
@@ -146,7 +325,7 @@ class FlaskControllerConfig:
             if isinstance(value, dict) and key in target_dict:
                 self._merge_with_defaults(value, target_dict[key])
             elif key not in target_dict:
-                target_dict[key] = target_dict.get(key, value)
+                target_dict[key] = copy.deepcopy(value)  # So nothing can change the defaults through the config
 
         return target_dict
 
@@ -155,11 +334,7 @@ class FlaskControllerConfig:
 
         If a config file doesn't exist it will be created and written with current (default) configuration.
         """
-        paths = [
-            os.path.join(self.instance_path, "config.toml"),
-            os.path.expanduser("~/.config/flaskcontroller/config.toml"),
-            "/etc/flaskcontroller/config.toml",
-        ]
+        paths = get_config_paths(self.instance_path)
 
         for path in paths:
             if os.path.isfile(path):
@@ -178,6 +353,104 @@ class FlaskControllerConfig:
             self._write_config()
 
     def _load_file(self) -> dict:
-        """Load configuration from a file."""
-        with open(self._config_path, encoding="utf8") as toml_file:
-            return tomlkit.load(toml_file)
+        """Load configuration from a file.
+
+        Parsing with tomlkit is the slowest part of creating the app, so parsed files are cached by their
+        contents' hash, loading an unchanged file again (tests, restarting the app) is a read and a copy.
+        """
+        with open(self._config_path, "rb") as toml_file:
+            contents = toml_file.read()
+
+        digest = hashlib.sha256(contents).digest()
+        cached = _parsed_files.get(self._config_path)
+        if cached is None or cached[0] != digest:
+            cached = (digest, tomlkit.parse(contents.decode("utf8")).unwrap())
+            _parsed_files[self._config_path] = cached
+
+        return copy.deepcopy(cached[1])
+
+
+class ConfigWatcher:
+    """Polls the config file's mtime, and loads and validates it on its own thread when it changes.
+
+    The socket sender checks latest and applies the RELOADABLE_KEYS itself, the rest need a restart.
+    """
+
+    def __init__(self, instance_path: str, interval: float = 1) -> None:
+        """Create the watcher from the config file as it is now, start() starts polling.
+
+        Args:
+            instance_path: The flask instance path, to find the config file like FlaskControllerConfig does.
+            interval: Seconds between checking the config file's mtime.
+        """
+        self.instance_path = instance_path
+        self.interval = interval
+        self.path = next((path for path in get_config_paths(instance_path) if os.path.isfile(path)), None)
+        self.latest = (0, FlaskControllerConfig(instance_path))  # (version, config), replaced in one go
+        self._mtime = self._get_mtime()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Start polling on a background thread."""
+        logger.info("Watching for config changes: %s", self.path)
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop polling."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def poll(self) -> bool:
+        """Check the config file once, returns True if a changed and valid config was loaded."""
+        mtime = self._get_mtime()
+        if mtime is None or mtime == self._mtime:  # Gone, maybe mid replace, keep running with what we have
+            return False
+        self._mtime = mtime
+
+        try:
+            new_config = FlaskControllerConfig(self.instance_path)
+        except (ConfigValidationError, tomlkit.exceptions.TOMLKitError, ValueError, OSError) as exc:
+            msg = "Config file changed but can't be loaded, keeping the running config: %s"
+            logger.error(msg, exc)  # noqa: TRY400 The reason is enough, not the traceback
+            return False
+        self._mtime = self._get_mtime()  # Loading can write missing defaults, that isn't another change
+
+        version, config = self.latest
+        changed = self._get_changed_keys(config, new_config)
+        if not changed:
+            return False
+
+        self.latest = (version + 1, new_config)
+        live = [f"['app']['{key}']" for key in RELOADABLE_KEYS if f"['app']['{key}']" in changed]
+        restart = [key for key in changed if key not in live]
+        if live:
+            logger.info("Config changed, applying: %s", ", ".join(live))
+        if restart:
+            logger.warning("Config changed, restart to apply: %s", ", ".join(restart))
+        return True
+
+    def _run(self) -> None:
+        """Poll every interval until stopped."""
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def _get_mtime(self) -> tuple[int, int] | None:
+        """Return the config file's mtime and size, None if it's gone."""
+        try:
+            stat = os.stat(self.path)
+        except (OSError, TypeError):
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _get_changed_keys(self, config: dict, new_config: dict) -> list[str]:
+        """Return the keys that differ between two configs, like ['app']['tick_rate']."""
+        return [
+            f"['{section}']['{key}']"
+            for section, values in new_config.items()
+            if section in config
+            for key, value in values.items()
+            if config[section].get(key) != value
+        ]
@@ -1,54 +1,173 @@
 """Flask webapp that interfaces with mGBA with _emulator/<whatever>."""
 
+import functools
+import itertools
+import json
 import logging
-import socket
+import math
+import struct
 import threading
 import time
+from collections import deque
 from http import HTTPStatus
+from types import MappingProxyType
 
-import colorama
 from flask import Blueprint, Flask, Response, current_app, jsonify, request
 
+from . import metrics, shared
+from .config import ConfigWatcher
+from .input_queue import InputQueue
+from .journal import NO_PLAYER, JournalWriter
+from .latency import LatencyTracker
+from .logger import DroppingQueueHandler, get_queue_handler
+from .players import PlayerInputTable, unpack_event
+from .presence import PresenceTracker
+from .protocol import (
+    PROTOCOL_V1,
+    PROTOCOL_V2,
+    PULL_MAGIC,
+    SEND_PULL,
+    SEND_PUSH,
+    EmulatorMessage,
+    FrameEncoder,
+    encode_pull_state,
+    encode_v1,
+)
+from .ratelimit import TokenBucketLimiter
+from .scheduler import TickScheduler
+from .sender import RECONNECT_DELAY, RECONNECT_MAX_DELAY, Target, TargetSender, get_socket_options, get_targets
+from .shared import SharedSegment
+from .status import SSE_HEARTBEAT, StatusBroadcaster
+
 # Main logger
 logger = logging.getLogger(__name__)
 
 # Input logger, just show message
+# The console is written to by a listener thread, so a slow terminal doesn't hold up requests.
+# The queue is bounded, if the terminal can't keep up at all lines are dropped rather than piling up in memory.
 input_logger = logging.getLogger("controller.input_logger")
 input_logger.propagate = False
 console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)  # Set the logging level for the handler
 formatter = logging.Formatter("%(message)s")
 console_handler.setFormatter(formatter)
-input_logger.addHandler(console_handler)
+input_log_handler = DroppingQueueHandler()
+input_logger.addHandler(input_log_handler)
+input_log_handler.start([console_handler])
 
 TESTING_MAX_LOOP = 3
+IDLE_TIMEOUT = 0.1  # How long the socket sender waits for input before checking if it should stop
+SERVICE_INTERVAL = 0.001  # How often the socket sender checks on targets that are connecting or behind
+EXPIRE_INTERVAL = 0.1  # How often the socket sender drops players that have timed out
+SHARED_STATUS_INTERVAL = 0.1  # How often the sender process publishes its status for the web workers
+PLAYER_ID_CACHE_SIZE = 1024  # Coloured player ids to keep, least recently used are dropped
+PULL_BACKLOG_SIZE = 64  # Pull mode, states an emulator can have waiting for its frame ticks before the oldest go
 _run_thread = True  # This is a kill switch used in pytest specifically
 fw_controller = None  # This will be the object that keeps track of the input queue and status
 
-
-fg_colours = [
-    colorama.Fore.BLACK,
-    colorama.Fore.RED,
-    colorama.Fore.GREEN,
-    colorama.Fore.YELLOW,
-    colorama.Fore.BLUE,
-    colorama.Fore.MAGENTA,
-    colorama.Fore.CYAN,
-    colorama.Fore.WHITE,
-]
-bg_colours = [
-    colorama.Back.BLACK,
-    colorama.Back.RED,
-    colorama.Back.GREEN,
-    colorama.Back.YELLOW,
-    colorama.Back.BLUE,
-    colorama.Back.MAGENTA,
-    colorama.Back.CYAN,
-    colorama.Back.WHITE,
-]
-
-input_queue = []
-client_dict = {}
+input_queue = InputQueue()  # Replaced with a configured one in start_socket_sender()
+tick_scheduler = TickScheduler(120)  # Replaced with a configured one in start_socket_sender()
+protocol_version = PROTOCOL_V1  # Set from config in start_socket_sender()
+send_mode = SEND_PUSH  # Set from config in start_socket_sender()
+frame_encoder = FrameEncoder()
+presence = PresenceTracker()  # Replaced with a configured one in start_socket_sender()
+players = PlayerInputTable()  # Replaced with a configured one in start_socket_sender()
+status_broadcaster = None  # Set in start_socket_sender()
+target_sender = None  # Set in socket_sender()
+journal = None  # Set in socket_sender() if journaling is enabled
+shared_segment = None  # Set in start_socket_sender() in multi process mode
+client_limiter = None  # Set in start_socket_sender() if client ids are rate limited
+address_limiter = None  # Set in start_socket_sender() if remote addresses are rate limited
+config_watcher = None  # Set in start_socket_sender() if config reloading is on
+latency_tracker = None  # Set in start_socket_sender() if the emulator acks the states it applies
+pull_backlog = {}  # Pull mode, target name -> states waiting for that emulator's next frame ticks
+
+# Metrics, recorded on the hot path so they are striped per thread, see metrics.py
+metric_input_seconds = metrics.REGISTRY.histogram(
+    "flaskcontroller_input_seconds", "Time to handle an input from /input or the websocket"
+)
+metric_enqueue_to_send_seconds = metrics.REGISTRY.histogram(
+    "flaskcontroller_enqueue_to_send_seconds", "Time from an input being queued to it being sent", metrics.TICK_BUCKETS
+)
+metric_batch_seconds = metrics.REGISTRY.histogram(
+    "flaskcontroller_batch_seconds", "Time to handle a batch of inputs from /inputs"
+)
+metric_inputs_refused = metrics.REGISTRY.counter(
+    "flaskcontroller_inputs_refused_total", "Inputs refused because the shared ring to the sender process was full"
+)
+metric_rate_limited = metrics.REGISTRY.counter(
+    "flaskcontroller_rate_limited_total", "Requests turned away for going over the rate limit"
+)
+metric_tick_period_seconds = metrics.REGISTRY.histogram(
+    "flaskcontroller_tick_period_seconds", "Time between sends to the emulator", metrics.TICK_BUCKETS
+)
+metric_tick_jitter_seconds = metrics.REGISTRY.histogram(
+    "flaskcontroller_tick_jitter_seconds", "How late each tick fired compared to its deadline"
+)
+# Gauges are read at scrape time, so they follow the objects start_socket_sender() replaces
+metrics.REGISTRY.gauge(
+    "flaskcontroller_socket_connected_seconds",
+    "How long the emulator socket has been connected, 0 if it isn't",
+    lambda: fw_controller.get_connected_time() if fw_controller else 0,
+)
+metrics.REGISTRY.gauge("flaskcontroller_tick_rate", "Configured tick rate", lambda: 1 / tick_scheduler.period)
+metrics.REGISTRY.gauge("flaskcontroller_input_queue_depth", "Inputs waiting to be sent", lambda: len(input_queue))
+metrics.REGISTRY.gauge(
+    "flaskcontroller_input_queue_high_water", "Deepest the input queue has been", lambda: input_queue.high_water
+)
+metrics.REGISTRY.gauge(
+    "flaskcontroller_input_queue_enqueued_total", "Inputs queued", lambda: input_queue.enqueued, "counter"
+)
+metrics.REGISTRY.gauge(
+    "flaskcontroller_input_queue_dropped_total",
+    "Inputs dropped by the overflow policy",
+    lambda: input_queue.dropped,
+    "counter",
+)
+metrics.REGISTRY.gauge(
+    "flaskcontroller_players_active",
+    "Players seen within the player timeout",
+    lambda: presence.count(),  # noqa: PLW0108 presence is replaced on start
+)
+metrics.REGISTRY.gauge("flaskcontroller_players_slots", "Players with a slot in the input table", lambda: len(players))
+metrics.REGISTRY.gauge(
+    "flaskcontroller_status_streams",
+    "Open /status/stream connections",
+    lambda: status_broadcaster.clients if status_broadcaster else 0,
+)
+metrics.REGISTRY.gauge(
+    "flaskcontroller_log_queue_depth",
+    "Log records waiting for the listener thread, 0 if logging isn't queued",
+    lambda: get_queue_handler().get_stats()["depth"] if get_queue_handler() else 0,
+)
+metrics.REGISTRY.gauge(
+    "flaskcontroller_log_queue_dropped_total",
+    "Log records dropped because the queue was full",
+    lambda: get_queue_handler().get_stats()["dropped"] if get_queue_handler() else 0,
+    "counter",
+)
+metrics.REGISTRY.gauge(
+    "flaskcontroller_input_log_queue_depth",
+    "Input feed lines waiting to be written to the console",
+    lambda: input_log_handler.get_stats()["depth"],
+)
+metrics.REGISTRY.gauge(
+    "flaskcontroller_input_log_queue_dropped_total",
+    "Input feed lines dropped because the queue was full",
+    lambda: input_log_handler.get_stats()["dropped"],
+    "counter",
+)
+metrics.REGISTRY.gauge(
+    "flaskcontroller_shared_ring_depth",
+    "Inputs from the web workers waiting for the sender process, 0 if not in multi process mode",
+    lambda: shared_segment.get_stats()["depth"] if shared_segment else 0,
+)
+metrics.REGISTRY.gauge(
+    "flaskcontroller_shared_ring_dropped_total",
+    "Inputs from the web workers dropped because the shared ring was full",
+    lambda: shared_segment.get_stats()["dropped"] if shared_segment else 0,
+    "counter",
+)
 
 app = Flask(__name__)  # Flask app object
 
@@ -60,6 +179,7 @@ class FlaskWebController:
         """Init."""
         self.current_input = 0
         self.sock_connected = False
+        self.connected_since = None  # time.monotonic() when the socket connected
 
     def get_current_input(self) -> int:
         """Get whether socket is connected."""
@@ -76,205 +196,820 @@ class FlaskWebController:
     def set_sock_connected(self) -> None:
         """Get whether socket is connected."""
         self.sock_connected = True
+        self.connected_since = time.monotonic()
 
     def set_sock_disconnected(self) -> None:
         """Get whether socket is connected."""
         self.sock_connected = False
-
+        self.connected_since = None
+
+    def get_connected_time(self) -> float:
+        """Return how long the socket has been connected in seconds, 0 if it isn't."""
+        return time.monotonic() - self.connected_since if self.connected_since is not None else 0.0
+
+
+# This matches up with the button codes in mGBA
+BUTTON_CODES = {
+    "GBA_A": 1,
+    "GBA_B": 2,
+    "GBA_SELECT": 4,
+    "GBA_START": 8,
+    "GBA_RIGHT": 16,
+    "GBA_LEFT": 32,
+    "GBA_UP": 64,
+    "GBA_DOWN": 128,
+    "GBA_R": 256,
+    "GBA_L": 512,
+}
+
+# Valid GB Button states passed from the js, D_ (down) or U_ (up) and a button name, e.g. D_GBA_A
+# Built once at import, input -> (button code, pressed)
+INPUT_TABLE = MappingProxyType(
+    {f"{updown}{button}": (code, updown == "D_") for button, code in BUTTON_CODES.items() for updown in ("D_", "U_")}
+)
+
+# /inputs takes a JSON array of the inputs above, or binary events packed as BATCH_EVENT:
+# the button's bit number (0 is GBA_A) with BATCH_PRESSED set for down, and a client timestamp in ms.
+MAX_BATCH_EVENTS = 256
+MAX_BATCH_BYTES = MAX_BATCH_EVENTS * 16  # Enough for MAX_BATCH_EVENTS of the longest input in a JSON array
+BATCH_CONTENT_TYPE = "application/octet-stream"
+BATCH_EVENT = struct.Struct("<BI")
+BATCH_PRESSED = 0x80
+BINARY_INPUT_TABLE = MappingProxyType(
+    {(code.bit_length() - 1) | (BATCH_PRESSED * pressed): name for name, (code, pressed) in INPUT_TABLE.items()}
+)
+
+# Endpoints a client can flood, checked against the rate limits before anything else happens
+RATE_LIMITED_ENDPOINTS = frozenset(
+    {"flaskcontroller.process_user_input", "flaskcontroller.process_user_inputs", "flaskcontroller.get_status"}
+)
 
 bp = Blueprint("flaskcontroller", __name__)
 
 
+@bp.before_request
+def rate_limit() -> tuple[str, HTTPStatus, dict] | None:
+    """Turn away clients over their rate limit, before any queueing or logging is done for the request.
+
+    Each request costs one token, /inputs charges the rest of its batch once it has been decoded.
+    """
+    if request.endpoint not in RATE_LIMITED_ENDPOINTS:
+        return None
+
+    wait = take_rate_limit(request.headers.get("client-id"), request.remote_addr or "")
+    return rate_limited_response(wait) if wait else None
+
+
+def take_rate_limit(client_id: str | None, address: str, tokens: int = 1) -> float:
+    """Charge tokens to the address's and the client's buckets, shared by HTTP and the websocket.
+
+    The remote address is checked first, so rotating client ids doesn't get around the limit.
+
+    Returns:
+        0 if they are within their limits, otherwise the seconds until they will be.
+    """
+    wait = 0
+    if address_limiter is not None:
+        wait = address_limiter.take(address, tokens)
+    if not wait and client_limiter is not None and client_id is not None:
+        wait = client_limiter.take(client_id, tokens)
+    if wait:
+        metric_rate_limited.inc()
+    return wait
+
+
+def rate_limited_response(wait: float) -> tuple[str, HTTPStatus, dict]:
+    """Return the response for a client over their rate limit."""
+    return "TOO MANY REQUESTS", HTTPStatus.TOO_MANY_REQUESTS, {"Retry-After": str(math.ceil(wait))}
+
+
 @bp.route("/GetStatus", methods=["GET"])
 def get_status() -> Response:
     """Return the status of the app."""
     # This is a 'ping' of sorts used to handle the player_count metric.
     # The js GETs this every x seconds.
-    # The client_dict is a dictionary that stores the client-ids and when they last pinged.
-    # Add current clients client id to the queue
-    current_time = int(time.time())
-    client_dict[request.headers.get("client-id")] = int(time.time())
-    for client in client_dict.copy():
-        # if host hasn't been in contact in 7 seconds, drop it
-        if current_time - 7 > client_dict[client]:
-            del client_dict[client]
+    client_id = request.headers.get("client-id")
+    touch_player(client_id)
 
     # Also returns the status of the mGBA socket connection
-    result = {"sock_connected": fw_controller.get_sock_connected(), "players_connected": len(client_dict)}
-    return jsonify(result)
+    status = get_status_dict()
+    if latency_tracker is not None and client_id is not None:
+        latency = latency_tracker.get_player(client_id)  # This player's own input latency
+        if latency is not None:
+            status["latency"] = latency
+    return jsonify(status)
+
+
+@bp.route("/latency", methods=["GET"])
+def get_latency() -> Response | tuple[str, HTTPStatus]:
+    """Return the input to applied latency percentiles over every player, from the emulator's acks."""
+    if latency_tracker is None:
+        return "LATENCY ACKS ARE OFF, OR THIS ISN'T THE SENDER PROCESS", HTTPStatus.NOT_FOUND
+    return jsonify(latency_tracker.get_stats())
+
+
+@bp.route("/metrics", methods=["GET"])
+def get_metrics() -> Response:
+    """Return the metrics in the Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@bp.route("/status/stream", methods=["GET"])
+def status_stream() -> Response | tuple[str, HTTPStatus]:
+    """Stream status events as they happen, instead of the js polling /GetStatus.
+
+    EventSource can't send headers, so the client id comes from the query string.
+    """
+    client_id = request.args.get("client-id")
+    if status_broadcaster.max_clients == 0:
+        return "STATUS STREAM IS OFF, POLL /GetStatus", HTTPStatus.NOT_FOUND
+    if not status_broadcaster.subscribe():
+        return "TOO MANY STATUS STREAMS, POLL /GetStatus", HTTPStatus.SERVICE_UNAVAILABLE
+
+    def stream() -> bytes:
+        version = 0
+        while True:
+            touch_player(client_id)  # The heartbeat keeps viewers counted, like polling did
+            version, event = status_broadcaster.wait(version)
+            yield event or SSE_HEARTBEAT
+
+    response = Response(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # Stop nginx holding on to events
+    response.call_on_close(status_broadcaster.unsubscribe)
+    return response
+
+
+def touch_player(client_id: str | None) -> None:
+    """Mark a player as active, used for the player count."""
+    if client_id is None:
+        return
+    if shared.process_mode == shared.PROCESS_WORKER:
+        shared_segment.put(shared.EVENT_TOUCH, client_id)  # The sender process keeps the player count
+        return
+    presence.touch(client_id)  # Just this, the socket sender expires players, see expire_players()
+
+
+def release_players(player_ids: list[str]) -> None:
+    """Release the buttons of players that have gone away, so nothing stays stuck down."""
+    for player_id in player_ids:
+        event = players.release(player_id)
+        if event is not None:
+            input_queue.append(event)
+        if latency_tracker is not None:
+            latency_tracker.forget_player(player_id)
+
+
+def get_status_dict() -> dict:
+    """Return the status of the app as a dictionary, shared by /GetStatus and the websocket."""
+    if shared.process_mode == shared.PROCESS_WORKER:
+        # The sender process publishes its status, until it has there is nothing connected as far as we know
+        return shared_segment.read_status() or {"sock_connected": False, "players_connected": 0}
+
+    return {
+        "sock_connected": fw_controller.get_sock_connected(),
+        "players_connected": presence.count(),
+        "input_queue": input_queue.get_stats(),
+        "tick": tick_scheduler.get_stats(),
+        "targets": target_sender.get_stats() if target_sender else [],
+    }
 
 
 @bp.route("/input/<string:da_input>", methods=["POST"])
-def process_user_input(da_input: str) -> str:
+def process_user_input(da_input: str) -> tuple[str, HTTPStatus]:
     """Flask Process User Input (From Javascript)."""
-    message = ""
-
-    # Valid GB Button states passed from the js
-    valid_inputs = [
-        "D_GBA_L",
-        "U_GBA_L",
-        "D_GBA_R",
-        "U_GBA_R",
-        "D_GBA_START",
-        "U_GBA_START",
-        "D_GBA_B",
-        "U_GBA_B",
-        "D_GBA_A",
-        "U_GBA_A",
-        "D_GBA_SELECT",
-        "U_GBA_SELECT",
-        "D_GBA_LEFT",
-        "U_GBA_LEFT",
-        "D_GBA_UP",
-        "U_GBA_UP",
-        "D_GBA_RIGHT",
-        "U_GBA_RIGHT",
-        "D_GBA_DOWN",
-        "U_GBA_DOWN",
-    ]
+    return handle_input(da_input, request.headers.get("client-id"))
+
+
+@bp.route("/inputs", methods=["POST"])
+def process_user_inputs() -> tuple[str, HTTPStatus] | tuple[str, HTTPStatus, dict]:
+    """Flask Process a batch of User Input, from scripts, touch pads or the js coalescing inputs."""
+    start = time.perf_counter()
+    result = handle_inputs(
+        request.get_data(), request.mimetype, request.headers.get("client-id"), request.remote_addr or ""
+    )
+    metric_batch_seconds.observe(time.perf_counter() - start)
+    return result
+
+
+def decode_batch(body: bytes, content_type: str) -> list[str]:
+    """Decode a batch for /inputs into the inputs it contains, raises ValueError if any of it is invalid.
+
+    Args:
+        body: A JSON array of inputs, e.g. ["D_GBA_A", "U_GBA_A"], or binary events, see BATCH_EVENT.
+        content_type: BATCH_CONTENT_TYPE for binary events, anything else is read as JSON.
+    """
+    if content_type == BATCH_CONTENT_TYPE:
+        if len(body) % BATCH_EVENT.size:
+            msg = f"Binary batch isn't a whole number of {BATCH_EVENT.size} byte events"
+            raise ValueError(msg)
+        events = list(BATCH_EVENT.iter_unpack(body))
+        if any(later[1] < earlier[1] for earlier, later in itertools.pairwise(events)):
+            msg = "Binary batch timestamps go backwards"
+            raise ValueError(msg)
+        try:
+            return [BINARY_INPUT_TABLE[code] for code, _ in events]
+        except KeyError as exc:
+            msg = f"Invalid event code: {exc.args[0]}"
+            raise ValueError(msg) from exc
+
+    try:
+        inputs = json.loads(body)
+    except json.JSONDecodeError as exc:
+        msg = f"Invalid JSON: {exc}"
+        raise ValueError(msg) from exc
+    if not isinstance(inputs, list) or not all(isinstance(da_input, str) for da_input in inputs):
+        msg = 'Expected a JSON array of inputs, e.g. ["D_GBA_A", "U_GBA_A"]'
+        raise ValueError(msg)
+    invalid = [da_input for da_input in inputs if da_input not in INPUT_TABLE]
+    if invalid:
+        msg = f"Invalid inputs: {invalid[:5]}"
+        raise ValueError(msg)
+    return inputs
+
+
+def handle_inputs(
+    body: bytes, content_type: str, client_id: str | None, address: str
+) -> tuple[str, HTTPStatus] | tuple[str, HTTPStatus, dict]:
+    """Apply a batch of inputs from a player, in order and all in the same tick.
+
+    The whole batch is validated before any of it is applied, so it is applied all or nothing.
+    Every input in it still reaches the emulator, ["D_GBA_A", "U_GBA_A"] is a tap of A.
+    Each input costs a rate limit token like a request to /input does, address is the client's for that.
+
+    Returns:
+        The response message and HTTP status.
+    """
+    if client_id is None:
+        return "No client ID", HTTPStatus.BAD_REQUEST
+
+    if len(body) > MAX_BATCH_BYTES:
+        return "BATCH TOO LARGE", HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+    try:
+        inputs = decode_batch(body, content_type)
+    except ValueError as exc:
+        return f"INVALID BATCH, DROPPING: {exc}", HTTPStatus.BAD_REQUEST
+
+    if len(inputs) > MAX_BATCH_EVENTS:
+        return "BATCH TOO LARGE", HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+    refused = queue_batch(client_id, [INPUT_TABLE[da_input] for da_input in inputs], address)
+    if refused:
+        return refused
+
+    if input_logger.isEnabledFor(logging.INFO):
+        log_presses(client_id, inputs)
+
+    return "VALID KEYPRESSES", HTTPStatus.OK
+
+
+def queue_batch(
+    client_id: str, decoded_inputs: list[tuple[int, bool]], address: str
+) -> tuple[str, HTTPStatus] | tuple[str, HTTPStatus, dict] | None:
+    """Apply and queue a decoded batch, or hand it to the sender process. Returns the response if it was refused."""
+    if len(decoded_inputs) > 1:
+        wait = take_rate_limit(client_id, address, len(decoded_inputs) - 1)  # The request paid for the first
+        if wait:
+            return rate_limited_response(wait)
+
+    if shared.process_mode == shared.PROCESS_WORKER:
+        # The sender process does the rest
+        written = shared_segment.put_many(shared.EVENT_INPUT, client_id, decoded_inputs)
+        if written < len(decoded_inputs):
+            metric_inputs_refused.inc(len(decoded_inputs) - written)
+            return f"INPUT QUEUE FULL, DROPPED {len(decoded_inputs) - written} INPUTS", HTTPStatus.SERVICE_UNAVAILABLE
+        return None
+
+    events = players.apply_many(client_id, decoded_inputs)
+    if events is None:
+        return "TOO MANY PLAYERS", HTTPStatus.SERVICE_UNAVAILABLE
+    for event in events:
+        input_queue.append(event)
+    touch_player(client_id)
+    return None
+
+
+def log_presses(client_id: str, inputs: list[str]) -> None:
+    """Show the button presses in a batch in the input feed."""
+    for da_input in inputs:
+        if da_input.startswith("D_"):
+            input_logger.info("Player: %s %s", colour_player_id(client_id), da_input[6:])  # Strip the D_GBA_
+
+
+def handle_input(da_input: str, client_id: str | None) -> tuple[str, HTTPStatus]:
+    """Apply an input from a player, shared by the /input endpoint and the websocket.
+
+    Args:
+        da_input: The input, D_ or U_ (down or up) followed by the button name, e.g. D_GBA_A.
+        client_id: The player's client id.
+
+    Returns:
+        The response message and HTTP status.
+    """
+    start = time.perf_counter()
+    result = _apply_input(da_input, client_id)
+    metric_input_seconds.observe(time.perf_counter() - start)
+    return result
+
+
+def handle_websocket_input(da_input: str, client_id: str, address: str) -> tuple[str, HTTPStatus]:
+    """Apply an input from the websocket, charged to the same rate limits as /input, see handle_input()."""
+    if take_rate_limit(client_id, address):
+        return "TOO MANY REQUESTS", HTTPStatus.TOO_MANY_REQUESTS
+    return handle_input(da_input, client_id)
+
+
+def _apply_input(da_input: str, client_id: str | None) -> tuple[str, HTTPStatus]:
+    """Validate, decode and queue an input, see handle_input()."""
+    # One dict lookup validates and decodes the input
+    decoded_input = INPUT_TABLE.get(da_input)
+    if decoded_input is None:
+        return "INVALID KEYPRESS, DROPPING", HTTPStatus.OK
 
-    # This matches up with the button codes in mGBA
-    button_code_dict = {
-        "GBA_A": 1,
-        "GBA_B": 2,
-        "GBA_SELECT": 4,
-        "GBA_START": 8,
-        "GBA_RIGHT": 16,
-        "GBA_LEFT": 32,
-        "GBA_UP": 64,
-        "GBA_DOWN": 128,
-        "GBA_R": 256,
-        "GBA_L": 512,
-    }
+    if client_id is None:
+        return "No client ID", HTTPStatus.BAD_REQUEST
+
+    mask, pressed = decoded_input
 
-    if da_input not in valid_inputs:
-        message = "INVALID KEYPRESS, DROPPING"
-    else:
-        new_input = fw_controller.get_current_input()
-        if da_input[:2] == "D_":
-            msg = "Input! Down: " + da_input[2:]
-            logger.debug(msg)
-            new_input = new_input | button_code_dict[da_input[2:]]
-        elif da_input[:2] == "U_":
-            msg = "Input! Up: " + da_input[2:]
-            logger.debug(msg)
-            new_input = new_input & ~(button_code_dict[da_input[2:]])
+    if logger.isEnabledFor(logging.DEBUG):  # Don't bother formatting if no one will see it
+        logger.debug("Input! %s: %s %s", "Down" if pressed else "Up", da_input[2:], f"{mask:b}".rjust(10, "0"))
 
-        else:
-            logger.warning("How did we get here?")  # pragma: no cover
+    if shared.process_mode == shared.PROCESS_WORKER:
+        # The sender process does the rest
+        if not shared_segment.put(shared.EVENT_INPUT, client_id, mask, pressed):
+            metric_inputs_refused.inc()
+            return "INPUT QUEUE FULL, DROPPING", HTTPStatus.SERVICE_UNAVAILABLE
+    elif not queue_player_input(client_id, mask, pressed):
+        return "TOO MANY PLAYERS", HTTPStatus.SERVICE_UNAVAILABLE
 
-        fw_controller.set_current_input(new_input)
+    # Save some latency and do this last
+    if pressed and input_logger.isEnabledFor(logging.INFO):
+        input_logger.info("Player: %s %s", colour_player_id(client_id), da_input[6:])  # Strip the D_GBA_
 
-        # print input as bytes
-        msg = f"{button_code_dict[da_input[2:]]:b}".rjust(10, "0")
-        logger.debug(msg)
+    return "VALID KEYPRESS", HTTPStatus.OK
 
-        input_queue.append(fw_controller.get_current_input())
 
-        # Save some latency and do this last
-        message = "VALID KEYPRESS"
-        if "client-id" not in request.headers:
-            return "No client ID", HTTPStatus.BAD_REQUEST
+def queue_player_input(client_id: str, mask: int, pressed: bool) -> bool:  # noqa: FBT001
+    """Update a player's state and queue the change, returns False if there are too many players.
 
-        player_id_coloured = colour_player_id(request.headers.get("client-id"))
+    Only this player's state changes here, merging everyone's input is done once per tick by socket_sender.
+    """
+    event = players.apply(client_id, mask, pressed)
+    if event is None:
+        return False
 
-        if "D_GBA_" in da_input:
-            msg = "Player: " + player_id_coloured + " " + da_input.replace("D_GBA_", "")
-            input_logger.info(msg)
+    input_queue.append(event)
+    touch_player(client_id)
+    return True
 
-    return message, HTTPStatus.OK
+
+def drain_shared_input(segment: SharedSegment) -> None:
+    """Apply the input the web worker processes have written to the shared segment."""
+    for kind, client_id, mask, pressed in segment.drain():
+        if kind == shared.EVENT_INPUT:
+            queue_player_input(client_id, mask, pressed)
+        else:
+            touch_player(client_id)
+
+
+def shared_input_pump(segment: SharedSegment) -> None:
+    """In the sender process, move input from the web workers to the input queue and publish the status for them.
+
+    The workers ring the doorbell when they write, so input is picked up straight away, the timeout is
+    just so the status keeps getting published and we notice when to stop.
+    """
+    last_status = 0.0
+    while _run_thread:
+        if shared.doorbell is not None:
+            shared.wait_doorbell(SHARED_STATUS_INTERVAL)
+        else:
+            time.sleep(SERVICE_INTERVAL)
+
+        drain_shared_input(segment)
+
+        now = time.monotonic()
+        if now - last_status >= SHARED_STATUS_INTERVAL:
+            segment.write_status(get_status_dict())
+            last_status = now
+
+    segment.close()
+    logger.info("PyTest stopped shared_input_pump")
 
 
 def socket_sender(fc_conf: dict) -> None:
-    """Connect to mGBA socket and send commands."""
-    loop_count = 0
-    str_max_loop = "∞"
+    """Connect to the emulator socket(s) and send the input every tick.
+
+    One thread and one TargetSender handle every target, each target connects, reconnects and
+    buffers on its own, so a slow or missing emulator doesn't hold up the others.
+    In pull mode there are no ticks of our own, each emulator gets the input when it sends a frame tick.
+    """
+    global target_sender, journal  # noqa: PLW0603 This is needed to avoid pollution.
+    input_ttl = float(fc_conf["app"].get("input_ttl", 0))
+    target_sender = TargetSender(
+        get_targets(fc_conf["app"]),
+        reconnect_delay=float(fc_conf["app"].get("reconnect_delay", RECONNECT_DELAY)),
+        reconnect_max_delay=float(fc_conf["app"].get("reconnect_max_delay", RECONNECT_MAX_DELAY)),
+        socket_options=get_socket_options(fc_conf["app"]),
+        on_message=handle_emulator_message if send_mode == SEND_PULL or latency_tracker is not None else None,
+        on_connect=functools.partial(resume_target, input_ttl=input_ttl),
+    )
+    if send_mode == SEND_PUSH and latency_tracker is not None:
+        input_queue.on_input = target_sender.enable_wake()  # See wait_for_tick()
+    journal = open_journal(fc_conf.get("journal", {}))
+    pull_backlog.clear()
+    fw_controller.set_sock_disconnected()
+
+    last_tick = None
+    last_expire = 0.0
+    config_version = 0
     while _run_thread:
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
-                fw_controller.set_sock_disconnected()
-                while _run_thread and not fw_controller.get_sock_connected():
-                    msg = (
-                        f"Connecting to socket: {fc_conf['app']['socket_address']}:{fc_conf['app']['socket_port']}"
-                        f" Attempt: {loop_count + 1}/{str_max_loop}"
-                    )
-                    logger.info(msg)
-
-                    try:
-                        sock.connect((fc_conf["app"]["socket_address"], fc_conf["app"]["socket_port"]))
-                        fw_controller.set_sock_connected()
-                        logger.info("Connected to socket!")
-                    except ConnectionRefusedError:
-                        logger.error("Socket connection refused")  # noqa: TRY400 Don't want this one too noisy
-                        loop_count += 1
-                        logger.info("Trying again...")
-                        time.sleep(1)
-
-                # While the socket between this program and mGBA is connected
-                # we check to see if there is anything in the input queue
-                # and then send it if there is. This runs at approximately the
-                # tick rate defined. It doesn't take into consideration the processing
-                # time of this block of code lol.
-                while fw_controller.get_sock_connected() and _run_thread:
-                    time.sleep(1 / fc_conf["app"]["tick_rate"])
-                    try:
-                        if input_queue:
-                            in_input = input_queue.pop(0).to_bytes(2, "little", signed=False)
-                            sock.sendall(in_input)
-
-                    except BrokenPipeError:
-                        logger.error("Disconnected from socket, cringe")  # noqa: TRY400 Don't want this one too noisy
-                        fw_controller.set_sock_disconnected()
-        except OSError:
-            logging.exception("OSError when trying to create socket")
-
-        loop_count += 1
-        logging.info("Trying again...")
-        time.sleep(1)
-
-    if not _run_thread:
-        logger.info("PyTest stopped socket_sender")
+        config_version = apply_reloaded_config(config_version)
+        last_expire = expire_players(last_expire)
+        target_sender.connect_due()
+        update_sock_connected(target_sender)
+
+        # Wait for input, but wake up in time to reconnect targets and to keep slow targets sending
+        timeout = SERVICE_INTERVAL if target_sender.needs_service() else IDLE_TIMEOUT
+        next_attempt = target_sender.next_attempt()
+        if next_attempt is not None:
+            timeout = max(0, min(timeout, next_attempt - time.monotonic()))
+
+        if not fw_controller.get_sock_connected():
+            # Nowhere to send, the player table keeps everyone's state for when a target connects,
+            # the queued input is only kept as long as the input TTL so an outage doesn't pile it up
+            input_queue.expire(input_ttl)
+            target_sender.service(timeout)
+            continue
+
+        if send_mode == SEND_PULL:
+            # The emulators set the pace, handle_frame_tick() replies to each frame tick as it is read
+            target_sender.service(timeout)
+            continue
+
+        # The scheduler wakes us as soon as there is input, but won't let us send
+        # more than once per tick at the tick rate defined.
+        if wait_for_tick(timeout):
+            tick = time.monotonic()
+            metric_tick_jitter_seconds.observe(tick_scheduler.last_jitter)
+            if last_tick is not None:
+                metric_tick_period_seconds.observe(tick - last_tick)
+            last_tick = tick
+
+            send_pending_input(target_sender)
+
+        target_sender.service()
+
+    input_queue.on_input = None
+    target_sender.close()
+    if config_watcher:
+        config_watcher.stop()
+    if journal:
+        journal.close()
+        journal = None
+    fw_controller.set_sock_disconnected()
+    logger.info("PyTest stopped socket_sender")
+
+
+def expire_players(last_expire: float) -> float:
+    """Release players that have gone away if it has been EXPIRE_INTERVAL since last_expire, returns when it last ran.
+
+    This is the only place players expire, so /GetStatus and input only ever touch the presence table,
+    and it runs every time around the socket sender loop so it keeps up under continuous input.
+    """
+    now = time.monotonic()
+    if now - last_expire < EXPIRE_INTERVAL:
+        return last_expire
+    release_players(presence.expire())
+    return now
+
+
+def wait_for_tick(timeout: float) -> bool:
+    """Push mode, wait until there is input and a tick is due, returns False if the timeout passed first.
+
+    With latency acks the wait is on the targets' sockets instead of the input queue, an ack is timed when it
+    is read so it has to be read as it arrives, and the input queue wakes the target sender when input comes in.
+    """
+    if input_queue.on_input is None:
+        return tick_scheduler.wait(input_queue, timeout=timeout)
+
+    target_sender.service(tick_scheduler.time_to_tick(input_queue, timeout))
+    return tick_scheduler.time_to_tick(input_queue, timeout) == 0 and tick_scheduler.wait(input_queue, timeout=0)
+
+
+def update_sock_connected(sender: TargetSender) -> None:
+    """Update the connected status when the first target connects or the last one goes away."""
+    if sender.any_connected() == fw_controller.get_sock_connected():
+        return
+    if sender.any_connected():
+        fw_controller.set_sock_connected()
+    else:
+        fw_controller.set_sock_disconnected()
+
+
+def open_journal(journal_conf: dict) -> JournalWriter | None:
+    """Open the journal from the [journal] config, None if journaling is off."""
+    if not journal_conf.get("path"):
+        return None
+    return JournalWriter(
+        journal_conf["path"],
+        max_bytes=int(journal_conf["max_bytes"]),
+        backup_count=int(journal_conf["backup_count"]),
+    )
+
+
+def apply_reloaded_config(config_version: int) -> int:
+    """Apply the config watcher's latest config if it is newer than config_version, returns the version now applied."""
+    if config_watcher is None or config_watcher.latest[0] == config_version:
+        return config_version
+
+    config_version, new_config = config_watcher.latest  # Loaded and validated on the watcher's thread
+    apply_config(new_config["app"])
+    return config_version
+
+
+def apply_config(app_conf: dict) -> None:
+    """Apply a reloaded [app] config, on the socket sender thread, see RELOADABLE_KEYS in config.py.
+
+    A new tick rate takes effect from the next deadline. Targets still in the config keep their
+    connection, removed ones are disconnected and new ones connected like at startup.
+    """
+    tick_rate = float(app_conf["tick_rate"])
+    if tick_rate != 1 / tick_scheduler.period:
+        logger.info("Tick rate changed to: %s", tick_rate)
+        tick_scheduler.set_tick_rate(tick_rate)
+
+    target_sender.set_targets(get_targets(app_conf))
+
+
+def resume_target(target: Target, input_ttl: float) -> bytes | None:
+    """Return what to send a target as soon as it connects, the current state, rather than waiting for new input.
+
+    Called by the TargetSender for every target that connects or reconnects, so a restarted emulator doesn't
+    keep whatever it held before. If other targets are connected it gets the state they were last sent, and
+    the input queued since reaches it along with them on the next tick. If none were, only the latest merged
+    state is sent, not the input queued during the outage, and if there is an input TTL players who haven't
+    changed their input within it have their buttons released first, so nothing held down from before the
+    outage comes back. In pull mode the emulator asks for the state on its next frame.
+    """
+    pull_backlog.pop(target.name, None)  # Left from before it went away
+    outage = not any(other.connected for other in target_sender.targets if other is not target)
+    if outage and input_ttl > 0:
+        for event in players.clear_stale(input_ttl):
+            input_queue.append(event)
+    if send_mode == SEND_PULL:
+        return None
+    if outage:
+        return encode_pending_input()
+
+    state = fw_controller.get_current_input()
+    if protocol_version == PROTOCOL_V2:
+        return frame_encoder.encode_resume(state)
+    return encode_v1(state)
+
+
+def send_pending_input(sender: TargetSender) -> None:
+    """Send the pending input to every target, and record how long each event waited in the queue."""
+    enqueue_times = []
+    drained_events = []
+    seq = frame_encoder.seq  # Of the frame about to be encoded, for the latency acks
+    sender.broadcast(encode_pending_input(enqueue_times, drained_events))
+    sent = time.monotonic()
+    for enqueued in enqueue_times:
+        metric_enqueue_to_send_seconds.observe(sent - enqueued)
+
+    if latency_tracker is not None and drained_events:
+        inputs = get_latency_inputs(drained_events, enqueue_times)
+        for target in sender.targets:
+            if target.connected:
+                latency_tracker.record_sent(target.name, seq, sent, inputs)
+
+
+def handle_emulator_message(target: Target, message: EmulatorMessage) -> bytes | None:
+    """Handle a frame tick or ack read from an emulator, returns the reply to send back, if any."""
+    if message.magic == PULL_MAGIC:
+        return handle_frame_tick(target, message.seq) if send_mode == SEND_PULL else None
+    if latency_tracker is not None:
+        # The emulator has applied the state with this sequence number (the frame number in pull mode)
+        latency_tracker.record_ack(target.name, message.seq, time.monotonic())
+    return None
+
+
+def handle_frame_tick(target: Target, frame: int) -> bytes:
+    """Pull mode, return the reply to an emulator's frame tick, the merged input state for that frame.
+
+    New input can make more than one state (a press and release between two frames), every connected
+    emulator gets them all, one per frame tick. Every frame gets a reply, the journal only gets the
+    states that follow new input.
+    """
+    enqueue_times = []
+    drained_events = []
+    states = merge_pending_input(enqueue_times, drained_events, journal_unchanged=False)
+    sent = time.monotonic()
+    for enqueued in enqueue_times:
+        metric_enqueue_to_send_seconds.observe(sent - enqueued)
+
+    if drained_events:
+        for other in target_sender.targets:
+            if other.connected:
+                pull_backlog.setdefault(other.name, deque(maxlen=PULL_BACKLOG_SIZE)).extend(states)
+    backlog = pull_backlog.get(target.name)
+    state = backlog.popleft() if backlog else states[-1]
+
+    if latency_tracker is not None and drained_events:
+        latency_tracker.record_sent(target.name, frame, sent, get_latency_inputs(drained_events, enqueue_times))
+    return encode_pull_state(frame, state)
+
+
+def get_latency_inputs(drained_events: list[int], enqueue_times: list[float]) -> list[tuple[str, float]]:
+    """Return (player id, time queued) for each drained event, skipping players who have since gone away."""
+    inputs = []
+    for event, enqueued in zip(drained_events, enqueue_times, strict=True):
+        player_id = players.get_player_id(unpack_event(event)[0])
+        if player_id is not None:
+            inputs.append((player_id, enqueued))
+    return inputs
+
+
+def merge_pending_input(
+    enqueue_times: list[float] | None = None,
+    drained_events: list[int] | None = None,
+    *,
+    journal_unchanged: bool = True,
+) -> list[int]:
+    """Drain the input queue and merge every player's input, returns the states to send in order.
+
+    The events in the input queue say that someone's input changed, the states that get sent come from
+    replaying them over the player table, see PlayerInputTable.merge_events(). Usually that is one state,
+    more if someone's input changed and changed back within the tick. If journaling is enabled the states
+    are journaled along with the slot of the player whose input came last.
+
+    Args:
+        enqueue_times: If given, the times the drained events were queued are added to it, for the metrics.
+        drained_events: If given, the drained events are added to it, for the latency acks.
+        journal_unchanged: Journal the state even if no input was drained.
+    """
+    events, drained_times = input_queue.drain_timed()
+    if enqueue_times is not None:
+        enqueue_times.extend(drained_times)
+    if drained_events is not None:
+        drained_events.extend(events)
+    states = players.merge_events(events)
+    fw_controller.set_current_input(states[-1])
+    if journal and (events or journal_unchanged):
+        player_slot = unpack_event(events[-1])[0] if events else NO_PLAYER
+        for state in states:
+            journal.record(state, player_slot)
+    return states
+
+
+def encode_pending_input(enqueue_times: list[float] | None = None, drained_events: list[int] | None = None) -> bytes:
+    """Merge every player's input and encode it for the wire, once per tick, see merge_pending_input().
+
+    Version 2 sends every state in one frame, version 1 sends them back to back, the emulator plays them
+    one per frame either way.
+
+    Args:
+        enqueue_times: If given, the times the drained events were queued are added to it, for the metrics.
+        drained_events: If given, the drained events are added to it, for the latency acks.
+    """
+    states = merge_pending_input(enqueue_times, drained_events)
+    if protocol_version == PROTOCOL_V2:
+        return frame_encoder.encode(states)
+
+    return b"".join(encode_v1(state) for state in states)
+
+
+@functools.cache
+def get_colours() -> tuple[list[str], list[str], str, str]:
+    """Return the foreground colours, background colours, bright and reset codes for colour_player_id.
+
+    colorama is only imported the first time a player id is coloured, it isn't needed to start the app.
+    """
+    import colorama
+
+    fg_colours = [
+        colorama.Fore.BLACK,
+        colorama.Fore.RED,
+        colorama.Fore.GREEN,
+        colorama.Fore.YELLOW,
+        colorama.Fore.BLUE,
+        colorama.Fore.MAGENTA,
+        colorama.Fore.CYAN,
+        colorama.Fore.WHITE,
+    ]
+    bg_colours = [
+        colorama.Back.BLACK,
+        colorama.Back.RED,
+        colorama.Back.GREEN,
+        colorama.Back.YELLOW,
+        colorama.Back.BLUE,
+        colorama.Back.MAGENTA,
+        colorama.Back.CYAN,
+        colorama.Back.WHITE,
+    ]
+    return fg_colours, bg_colours, colorama.Style.BRIGHT, colorama.Style.RESET_ALL
 
 
+@functools.lru_cache(maxsize=PLAYER_ID_CACHE_SIZE)
 def colour_player_id(player_id: str) -> str:
-    """Fun coloured player names."""
+    """Fun coloured player names, cached per id since the same ids come through on every key press."""
     player_id = player_id[:6]
     player_id = player_id.ljust(6, " ")
 
+    fg_colours, bg_colours, bright, reset = get_colours()
     new_player_id = ""
-    split_player_id = [""]
-
-    # Split the player id string into chunks of 3
-    for idx, i in enumerate(player_id):
-        split_player_id[len(split_player_id) - 1] = split_player_id[len(split_player_id) - 1] + i
-        if (idx + 1) % 3 == 0:
-            split_player_id.append("")
 
-    # Colour each chunk based on the sum of its characters
+    # Colour each chunk of 3 characters based on the sum of its characters
     # Uses modulus of the length of the colour array
     # So each string chunk will be coloured the same way
-    for i in split_player_id:
-        fun_number = sum(bytearray(i, "ascii"))
-        fg_pick = fg_colours[(fun_number + fun_number) % len(fg_colours)]
-        bg_pick = bg_colours[(fun_number) % len(bg_colours)]
+    for chunk in (player_id[:3], player_id[3:]):
+        fun_number = sum(chunk.encode(errors="replace"))
+        fg_index = (fun_number + fun_number) % len(fg_colours)
+        bg_index = fun_number % len(bg_colours)
 
-        if fg_colours.index(fg_pick) == bg_colours.index(bg_pick):
-            bg_pick = bg_colours[bg_colours.index(bg_pick) + 1]
+        if fg_index == bg_index:
+            bg_index += 1
 
-        new_player_id = new_player_id + (colorama.Style.BRIGHT + fg_pick + bg_pick + i + colorama.Style.RESET_ALL)
+        new_player_id += bright + fg_colours[fg_index] + bg_colours[bg_index] + chunk
+        new_player_id += reset
 
     return new_player_id
 
 
+def get_limiter(rate_limit_conf: dict, limit: str) -> TokenBucketLimiter | None:
+    """Create the client or address rate limiter from the [rate_limit] config, None if that limit is off."""
+    rate = float(rate_limit_conf[f"{limit}_rate"])
+    if rate == 0:
+        return None
+    return TokenBucketLimiter(rate, float(rate_limit_conf[f"{limit}_burst"]))
+
+
 def start_socket_sender() -> None:
     """Functions to start the socket sender infinite loop."""
-    global fw_controller  # noqa: PLW0603 This is needed to avoid pollution.
+    global fw_controller, input_queue, tick_scheduler  # noqa: PLW0603 This is needed to avoid pollution.
+    global protocol_version, send_mode, frame_encoder, presence, players  # noqa: PLW0603 This is needed to avoid pollution.
+    global status_broadcaster, shared_segment  # noqa: PLW0603 This is needed to avoid pollution.
+    global client_limiter, address_limiter, config_watcher  # noqa: PLW0603 This is needed to avoid pollution.
+    global latency_tracker  # noqa: PLW0603 This is needed to avoid pollution.
     fw_controller = FlaskWebController()
+    input_queue = InputQueue(
+        capacity=int(current_app.config["app"]["input_queue_size"]),
+        overflow=current_app.config["app"]["input_queue_overflow"],
+    )
+    tick_scheduler = TickScheduler(current_app.config["app"]["tick_rate"])
+    protocol_version = int(current_app.config["app"]["protocol_version"])
+    send_mode = current_app.config["app"]["send_mode"]
+    frame_encoder = FrameEncoder()
+    presence = PresenceTracker(
+        timeout=float(current_app.config["app"]["player_timeout"]),
+        max_players=int(current_app.config["app"]["max_players"]),
+    )
+    players = PlayerInputTable(
+        max_players=int(current_app.config["app"]["max_players"]),
+        merge_mode=current_app.config["app"]["merge_mode"],
+    )
+    status_broadcaster = StatusBroadcaster(
+        get_status_dict, max_clients=int(current_app.config["app"]["status_stream_clients"])
+    )
+    client_limiter = get_limiter(current_app.config["rate_limit"], "client")
+    address_limiter = get_limiter(current_app.config["rate_limit"], "address")
+    latency_tracker = None
+
+    if shared_segment:  # Only one per process
+        shared_segment.close()
+        shared_segment = None
+
+    if shared.process_mode == shared.PROCESS_WORKER:
+        # The sender process owns the emulator link, this process only forwards input to it
+        shared_segment = SharedSegment.attach(current_app.config["app"]["shared_memory_name"])
+        logger.info("Web worker forwarding input to the sender process")
+        return
+
+    if shared.process_mode == shared.PROCESS_SENDER:
+        shared_segment = SharedSegment.create(
+            current_app.config["app"]["shared_memory_name"],
+            capacity=int(current_app.config["app"]["input_queue_size"]),
+        )
+
+    if config_watcher:  # Only one per process
+        config_watcher.stop()
+        config_watcher = None
+
+    if current_app.config["app"]["latency_acks"]:
+        latency_tracker = LatencyTracker()
+
     if not current_app.config["app"]["testing"]["dont_run_socket"]:
+        if float(current_app.config["app"]["config_reload_interval"]) > 0:
+            config_watcher = ConfigWatcher(
+                current_app.instance_path, interval=float(current_app.config["app"]["config_reload_interval"])
+            )
+            config_watcher.start()
+
         logger.info("Starting socket sender thread!")
         thread = threading.Thread(target=socket_sender, args=(current_app.config,))
         thread.start()
+        if shared_segment:
+            threading.Thread(target=shared_input_pump, args=(shared_segment,)).start()
     else:
         logger.warning("Not starting socket sender thread.")
@@ -0,0 +1,145 @@
+"""Bounded, thread-safe input queue between the web handlers and the socket sender."""
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_COLLAPSE = "collapse"
+OVERFLOW_POLICIES = [OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_COLLAPSE]
+
+
+class InputQueue:
+    """Fixed capacity ring buffer of input states.
+
+    Many producers (waitress threads) append, one consumer (socket_sender) pops.
+    The time each input was enqueued is kept alongside it, so the consumer can tell how long it waited.
+    The method names follow collections.deque so it can be used like the list it replaced.
+    """
+
+    def __init__(self, capacity: int = 1024, overflow: str = OVERFLOW_DROP_OLDEST) -> None:
+        """Create the queue.
+
+        Args:
+            capacity: Maximum number of inputs held, anything past this is handled per the overflow policy.
+            overflow: What to do when full, one of OVERFLOW_POLICIES.
+        """
+        if capacity < 1:
+            msg = f"Input queue capacity must be at least 1, got: {capacity}"
+            raise ValueError(msg)
+
+        if overflow not in OVERFLOW_POLICIES:
+            msg = f"Invalid input queue overflow policy: {overflow}, expected one of {OVERFLOW_POLICIES}"
+            raise ValueError(msg)
+
+        self.capacity = capacity
+        self.overflow = overflow
+        self._queue = deque()
+        self._enqueue_times = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)  # Lets the consumer sleep until there is input
+        self.on_input = None  # Called when input lands in an empty queue, for a consumer that sleeps elsewhere
+
+        # Counters
+        self.enqueued = 0
+        self.dropped = 0
+        self.expired = 0
+        self.high_water = 0
+
+    def __len__(self) -> int:
+        """Return the current depth of the queue."""
+        return len(self._queue)
+
+    def __bool__(self) -> bool:
+        """Return True if there is anything in the queue."""
+        return len(self._queue) != 0
+
+    def append(self, item: int) -> None:
+        """Add an input to the queue, applying the overflow policy if the queue is full."""
+        now = time.monotonic()
+        with self._lock:
+            self.enqueued += 1
+            if len(self._queue) >= self.capacity:
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                if self.overflow == OVERFLOW_COLLAPSE:
+                    # Only the latest state matters, so throw away everything that is waiting.
+                    self.dropped += len(self._queue)
+                    self._queue.clear()
+                    self._enqueue_times.clear()
+                else:  # OVERFLOW_DROP_OLDEST
+                    self.dropped += 1
+                    self._queue.popleft()
+                    self._enqueue_times.popleft()
+
+            self._queue.append(item)
+            self._enqueue_times.append(now)
+            self.high_water = max(self.high_water, len(self._queue))
+            self._not_empty.notify()
+            was_empty = len(self._queue) == 1
+
+        if was_empty and self.on_input is not None:
+            self.on_input()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until the queue has something in it, return False if the timeout passed first."""
+        with self._not_empty:
+            return self._not_empty.wait_for(lambda: len(self._queue) != 0, timeout)
+
+    def popleft(self) -> int:
+        """Remove and return the oldest input, raises IndexError if the queue is empty."""
+        with self._lock:
+            item = self._queue.popleft()
+            self._enqueue_times.popleft()
+            return item
+
+    def drain(self) -> list[int]:
+        """Remove and return everything in the queue, oldest first."""
+        return self.drain_timed()[0]
+
+    def drain_timed(self) -> tuple[list[int], list[float]]:
+        """Remove and return everything in the queue oldest first, and the time.monotonic() each was enqueued."""
+        with self._lock:
+            items = list(self._queue)
+            enqueue_times = list(self._enqueue_times)
+            self._queue.clear()
+            self._enqueue_times.clear()
+            return items, enqueue_times
+
+    def expire(self, max_age: float) -> int:
+        """Remove inputs that have waited longer than max_age seconds, 0 removes everything.
+
+        Returns:
+            The number of inputs removed.
+        """
+        cutoff = time.monotonic() - max_age
+        with self._lock:
+            expired = 0
+            while self._enqueue_times and self._enqueue_times[0] <= cutoff:
+                self._queue.popleft()
+                self._enqueue_times.popleft()
+                expired += 1
+            self.expired += expired
+            return expired
+
+    def clear(self) -> None:
+        """Empty the queue without counting anything as dropped."""
+        with self._lock:
+            self._queue.clear()
+            self._enqueue_times.clear()
+
+    def get_stats(self) -> dict:
+        """Return the queue counters."""
+        return {
+            "depth": len(self._queue),
+            "capacity": self.capacity,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "expired": self.expired,
+            "high_water": self.high_water,
+        }
@@ -0,0 +1,166 @@
+"""Binary journal of every state sent to the emulator, and a replay tool for it.
+
+A journal file is a 16 byte header then 16 byte records, so it is small and any record can be found by
+its index without reading the rest:
+    Header      <4sHHQ      magic, version, record size, wall clock start (ns since the epoch)
+    Record      <QHxxI      monotonic time (ns), state word, player slot of the last input that went into it
+The player slot is the one from the player table, it identifies a player within a session.
+
+Recording happens on the socket sender thread, so all it does is append to a deque, a writer thread
+packs and writes the records in batches and rotates the file by size like the log file.
+
+Replay journals to an emulator with python -m flaskcontroller.replay, see replay.py.
+"""
+
+import contextlib
+import logging
+import mmap
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from struct import Struct
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FCJL"
+VERSION = 1
+HEADER = Struct("<4sHHQ")
+RECORD = Struct("<QHxxI")
+NO_PLAYER = 0xFFFFFFFF  # The state changed without anyone's input, e.g. a player timing out
+
+JOURNAL_MAX_BYTES = 10000000  # Rotate the journal at this size
+JOURNAL_BACKUP_COUNT = 5  # Rotated journals to keep
+FLUSH_INTERVAL = 0.25  # Seconds between the writer thread's batches
+MAX_PENDING_RECORDS = 100000  # Records waiting for the writer before we start dropping them
+
+metric_records = metrics.REGISTRY.counter("flaskcontroller_journal_records_total", "States written to the journal")
+metric_records_dropped = metrics.REGISTRY.counter(
+    "flaskcontroller_journal_records_dropped_total", "States not journaled because the writer couldn't keep up"
+)
+
+
+class JournalError(Exception):
+    """Error to raise if a file isn't a journal we can read."""
+
+
+class JournalWriter:
+    """Appends records to the journal from a background thread."""
+
+    def __init__(self, path: str, max_bytes: int = JOURNAL_MAX_BYTES, backup_count: int = JOURNAL_BACKUP_COUNT) -> None:
+        """Open the journal and start the writer thread, an existing journal is rotated out of the way."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._pending = deque()  # (monotonic ns, state, player slot), appended by the sender, popped by the writer
+        self._file = None
+        self._size = 0
+        self._stop = threading.Event()
+
+        if os.path.exists(path) and os.path.getsize(path) > HEADER.size:
+            self._rotate()
+        self._open()
+        self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, state: int, player: int = NO_PLAYER) -> None:
+        """Journal a state that was just sent, cheap enough for the tick loop."""
+        if len(self._pending) >= MAX_PENDING_RECORDS:
+            metric_records_dropped.inc()
+            return
+        self._pending.append((time.monotonic_ns(), state, player))
+
+    def flush(self) -> None:
+        """Write everything recorded so far, normally only the writer thread calls this."""
+        batch = []
+        with contextlib.suppress(IndexError):
+            while True:
+                batch.append(self._pending.popleft())
+        if not batch:
+            return
+
+        start = 0
+        while start < len(batch):
+            if self._size + RECORD.size > self.max_bytes:
+                self._rotate()
+                self._open()
+            chunk = batch[start : start + max(1, (self.max_bytes - self._size) // RECORD.size)]
+            self._file.write(b"".join(RECORD.pack(*record) for record in chunk))
+            self._size += len(chunk) * RECORD.size
+            start += len(chunk)
+        self._file.flush()
+        metric_records.inc(len(batch))
+
+    def close(self) -> None:
+        """Stop the writer thread and write what is left."""
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        self._file.close()
+
+    def _run(self) -> None:
+        """Write a batch every FLUSH_INTERVAL until closed."""
+        while not self._stop.wait(FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("Could not write to the journal: %s", self.path)
+
+    def _open(self) -> None:
+        """Start a new journal file."""
+        self._file = open(self.path, "wb")  # noqa: SIM115 Kept open for the writer thread
+        self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, time.time_ns()))
+        self._size = HEADER.size
+        logger.info("Journaling sent states to: %s", self.path)
+
+    def _rotate(self) -> None:
+        """Move journal to journal.1, journal.1 to journal.2 and so on, like RotatingFileHandler."""
+        if self._file:
+            self._file.close()
+        for number in range(self.backup_count - 1, 0, -1):
+            with contextlib.suppress(FileNotFoundError):
+                os.replace(f"{self.path}.{number}", f"{self.path}.{number + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+
+
+def _check_header(path: str, data: bytes | mmap.mmap) -> int:
+    """Check the header at the start of data is one we can read, returns the journal's wall clock start."""
+    if len(data) < HEADER.size:
+        msg = f"{path} is too short to be a journal"
+        raise JournalError(msg)
+
+    magic, version, record_size, started = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        msg = f"{path} isn't a version {VERSION} journal"
+        raise JournalError(msg)
+    return started
+
+
+def read_journal_start(path: str) -> int:
+    """Return the wall clock time (ns since the epoch) a journal was started, from its header.
+
+    The records' monotonic times only compare within a run, this is what places journals against each other.
+    """
+    with open(path, "rb") as file:
+        return _check_header(path, file.read(HEADER.size))
+
+
+@contextlib.contextmanager
+def read_journal(path: str) -> Iterator[Iterator[tuple[int, int, int]]]:
+    """Memory map a journal, yields an iterator of its (monotonic ns, state, player slot) records.
+
+    A record cut short at the end (the app stopped mid write) is ignored.
+    """
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < HEADER.size:
+            _check_header(path, b"")  # Raises, mmap can't map an empty file
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as journal_map:
+            _check_header(path, journal_map)
+            end = HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+            yield (RECORD.unpack_from(journal_map, offset) for offset in range(HEADER.size, end, RECORD.size))
@@ -0,0 +1,140 @@
+"""Input to applied latency, measured with acks from the emulator.
+
+Every state sent that carries someone's input is remembered by target and sequence number (the version 2
+sequence number, or the frame number in pull mode), along with when it was sent and whose input it carried.
+When the emulator acks that sequence number, each input in it gets three latencies:
+    enqueue_to_send   queued by the web request to sent by the socket sender
+    send_to_apply     sent to the ack arriving, the emulator sends the ack on the frame it applies the state
+    enqueue_to_apply  the whole trip, what the player feels
+The ack's arrival stands in for the time the state was applied, so send_to_apply includes the ack's trip back,
+on the same machine or LAN that is well under a frame.
+
+A version 2 frame is measured as a whole. When a tick sends several states in one frame (a tap within the tick),
+the emulator acks each of them with the frame's sequence number, one per emulator frame. Only the first ack
+is recorded, so every input in the frame is timed to the frame's first state being applied, and the
+inputs that landed in its later states were applied a frame or so after that for each state before them.
+"""
+
+import logging
+import threading
+from collections import OrderedDict, deque
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_UNACKED = 1024  # Sent states waiting for an ack before the oldest are given up on
+RECENT_SAMPLES = 4096  # Latest samples kept for the percentiles
+PLAYER_SAMPLES = 32  # Latest samples kept per player, averaged for /GetStatus
+PERCENTILES = [50, 90, 99]
+STAGES = ["enqueue_to_send", "send_to_apply", "enqueue_to_apply"]
+
+metric_send_to_apply_seconds = metrics.REGISTRY.histogram(
+    "flaskcontroller_send_to_apply_seconds",
+    "Seconds from sending a state to the emulator acking it",
+    metrics.TICK_BUCKETS,
+)
+metric_enqueue_to_apply_seconds = metrics.REGISTRY.histogram(
+    "flaskcontroller_enqueue_to_apply_seconds",
+    "Seconds from an input being queued to the emulator acking the state with it",
+    metrics.TICK_BUCKETS,
+)
+
+
+def percentile(ordered: list[float], pct: float) -> float:
+    """Return the pct percentile of a sorted list, nearest rank."""
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class LatencyTracker:
+    """Sent states waiting for an ack, and the latency samples from the ones that got one."""
+
+    def __init__(
+        self, max_unacked: int = MAX_UNACKED, recent_samples: int = RECENT_SAMPLES, player_samples: int = PLAYER_SAMPLES
+    ) -> None:
+        """Create the tracker.
+
+        Args:
+            max_unacked: Most sent states to wait on, the oldest are dropped past this (the emulator missed them).
+            recent_samples: Latest samples kept for get_stats().
+            player_samples: Latest samples kept per player for get_player().
+        """
+        self.max_unacked = max_unacked
+        self.player_samples = player_samples
+        self._unacked = OrderedDict()  # (target, seq) -> (time sent, [(player id, time queued)]), oldest first
+        self._recent = deque(maxlen=recent_samples)  # (enqueue_to_send, send_to_apply, enqueue_to_apply)
+        self._players = {}  # player id -> deque of samples like _recent
+        self._lock = threading.Lock()
+
+        # Stats
+        self.acked = 0
+        self.dropped = 0
+
+    def record_sent(self, target: str, seq: int, sent_at: float, inputs: list[tuple[str, float]]) -> None:
+        """Remember a state (or a version 2 frame) sent to a target, inputs are the (player id, time queued) in it."""
+        if not inputs:
+            return  # Nobody's input, nothing to measure
+        with self._lock:
+            self._unacked[(target, seq)] = (sent_at, inputs)
+            while len(self._unacked) > self.max_unacked:
+                self._unacked.popitem(last=False)
+                self.dropped += 1
+
+    def record_ack(self, target: str, seq: int, acked_at: float) -> bool:
+        """Record the latencies of a state the target has applied, returns False if it wasn't being waited on.
+
+        The emulator acks every state it applies, most carry no new input and are ignored.
+        """
+        with self._lock:
+            sent = self._unacked.pop((target, seq), None)
+            if sent is None:
+                return False
+
+            sent_at, inputs = sent
+            send_to_apply = acked_at - sent_at
+            self.acked += 1
+            for player_id, enqueued in inputs:
+                sample = (sent_at - enqueued, send_to_apply, acked_at - enqueued)
+                self._recent.append(sample)
+                player = self._players.get(player_id)
+                if player is None:
+                    player = self._players[player_id] = deque(maxlen=self.player_samples)
+                player.append(sample)
+
+        metric_send_to_apply_seconds.observe(send_to_apply)
+        for _, enqueued in inputs:
+            metric_enqueue_to_apply_seconds.observe(acked_at - enqueued)
+        return True
+
+    def forget_player(self, player_id: str) -> None:
+        """Drop a player's samples, when they have gone away."""
+        with self._lock:
+            self._players.pop(player_id, None)
+
+    def get_player(self, player_id: str) -> dict | None:
+        """Return a player's average latencies in seconds over their latest samples, None if they have none."""
+        with self._lock:
+            samples = list(self._players.get(player_id, ()))
+        if not samples:
+            return None
+        columns = zip(*samples, strict=True)
+        latency = {stage: sum(column) / len(samples) for stage, column in zip(STAGES, columns, strict=True)}
+        latency["samples"] = len(samples)
+        return latency
+
+    def get_stats(self) -> dict:
+        """Return percentiles of the latest samples over every player, in seconds."""
+        with self._lock:
+            samples = list(self._recent)
+            stats = {"acked": self.acked, "dropped": self.dropped, "unacked": len(self._unacked)}
+
+        stats["samples"] = len(samples)
+        columns = list(zip(*samples, strict=True)) if samples else [[] for _ in STAGES]
+        for stage, column in zip(STAGES, columns, strict=True):
+            ordered = sorted(column)
+            stats[stage] = {f"p{pct}": percentile(ordered, pct) for pct in PERCENTILES}
+            stats[stage]["max"] = ordered[-1] if ordered else 0.0
+        return stats
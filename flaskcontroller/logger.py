@@ -1,12 +1,17 @@
 """Setup the logger functionality for flaskcontroller."""
 
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 from flask import Flask
 
 LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]  # Valid str logging levels.
 LOG_FORMAT = "%(asctime)s:%(levelname)s:%(name)s:%(message)s"  # This is the logging message format that I like.
+LOG_MAX_BYTES = 1000000  # Rotate the log file at this size
+LOG_BACKUP_COUNT = 5  # Rotated log files to keep
+LOG_QUEUE_SIZE = 10000  # Records waiting for the listener thread before we start dropping them
 
 
 # In flask the root logger doesn't have any handlers, its all in app.logger
@@ -19,13 +24,60 @@ LOG_FORMAT = "%(asctime)s:%(levelname)s:%(name)s:%(message)s"  # This is the log
 logger = logging.getLogger(__name__)  # This is where we log to in this module, following the standard of every module.
 
 
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler with a bounded queue, records are dropped (and counted) rather than blocking when it is full.
+
+    The handlers that do the actual I/O live on a QueueListener running in a background thread.
+    """
+
+    def __init__(self, maxsize: int = LOG_QUEUE_SIZE) -> None:
+        """Create the handler with its own bounded queue."""
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self.listener = None
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Put the record on the queue without blocking, count it if there is no room."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self, handlers: list[logging.Handler]) -> None:
+        """Start (or restart) the listener thread with these handlers."""
+        if self.listener:
+            self.listener.stop()
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self) -> None:
+        """Stop the listener thread, processing anything still in the queue."""
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+
+    def close(self) -> None:
+        """Stop the listener and close the handlers it was feeding."""
+        handlers = self.listener.handlers if self.listener else ()
+        self.stop()
+        for handler in handlers:
+            handler.close()
+        super().close()
+
+    def get_stats(self) -> dict:
+        """Return the queue backlog and drop counter."""
+        return {"depth": self.queue.qsize(), "dropped": self.dropped}
+
+
 # Pass in the whole app object to make it obvious we are configuring the logger object within the app object.
 def setup_logger(app: Flask, logging_conf: dict, in_logger: logging.Logger | None = None) -> None:
     """Setup the logger, set configuration per logging_conf.
 
     Args:
         app: The Flask app, needed to get the app's logger object.
-        logging_conf: The logging configuration {"level": "", "path": ""}
+        logging_conf: The logging configuration {"level": "", "path": ""}, optionally with
+            "max_bytes" and "backup_count" for log rotation, and "queued" and "queue_size" to do
+            all the logging I/O on a background thread.
         in_logger: Logger to configure, useful for testing.
     """
     if not in_logger:  # in_logger should only exist when testing with PyTest.
@@ -42,7 +94,16 @@ def setup_logger(app: Flask, logging_conf: dict, in_logger: logging.Logger | Non
 
     # If we are logging to a file
     if not _has_file_handler(in_logger) and logging_conf["path"] != "":
-        _add_file_handler(in_logger, logging_conf["path"])
+        _add_file_handler(
+            in_logger,
+            logging_conf["path"],
+            max_bytes=int(logging_conf.get("max_bytes", LOG_MAX_BYTES)),
+            backup_count=int(logging_conf.get("backup_count", LOG_BACKUP_COUNT)),
+        )
+
+    # Hand the console and file handlers to a listener thread so logging doesn't block on I/O
+    if logging_conf.get("queued", False):
+        _queue_handlers(in_logger, int(logging_conf.get("queue_size", LOG_QUEUE_SIZE)))
 
     # Configure modules that are external and have their own loggers
     logging.getLogger("waitress").setLevel(logging.INFO)  # Prod web server, info has useful info.
@@ -52,14 +113,54 @@ def setup_logger(app: Flask, logging_conf: dict, in_logger: logging.Logger | Non
     logger.info("Logger configuration set!")
 
 
+def get_queue_handler(in_logger: logging.Logger | None = None) -> DroppingQueueHandler | None:
+    """Return the queue handler of a logger (default root), None if logging isn't queued."""
+    if not in_logger:
+        in_logger = logging.getLogger()
+
+    for handler in in_logger.handlers:
+        if isinstance(handler, DroppingQueueHandler):
+            return handler
+    return None
+
+
+def _get_handlers(in_logger: logging.Logger) -> list[logging.Handler]:
+    """Return the handlers of a logger, including ones moved to a queue listener."""
+    handlers = list(in_logger.handlers)
+    queue_handler = get_queue_handler(in_logger)
+    if queue_handler and queue_handler.listener:
+        handlers += queue_handler.listener.handlers
+    return handlers
+
+
 def _has_file_handler(in_logger: logging.Logger) -> bool:
     """Check if logger has a file handler."""
-    return any(isinstance(handler, logging.FileHandler) for handler in in_logger.handlers)
+    return any(isinstance(handler, logging.FileHandler) for handler in _get_handlers(in_logger))
 
 
 def _has_console_handler(in_logger: logging.Logger) -> bool:
     """Check if logger has a console handler."""
-    return any(isinstance(handler, logging.StreamHandler) for handler in in_logger.handlers)
+    return any(isinstance(handler, logging.StreamHandler) for handler in _get_handlers(in_logger))
+
+
+def _queue_handlers(in_logger: logging.Logger, queue_size: int) -> None:
+    """Move the logger's handlers behind a DroppingQueueHandler and its listener thread."""
+    queue_handler = get_queue_handler(in_logger)
+    if not queue_handler:
+        queue_handler = DroppingQueueHandler(queue_size)
+        in_logger.addHandler(queue_handler)
+        atexit.register(queue_handler.stop)  # Flush whatever is left on exit
+        logger.info("Logging through a queue, max size: %s", queue_size)
+
+    new_handlers = [handler for handler in in_logger.handlers if handler is not queue_handler]
+    if not new_handlers:  # Already queued, nothing changed
+        return
+
+    for handler in new_handlers:
+        in_logger.removeHandler(handler)
+
+    old_handlers = list(queue_handler.listener.handlers) if queue_handler.listener else []
+    queue_handler.start(old_handlers + new_handlers)
 
 
 def _add_console_handler(in_logger: logging.Logger) -> None:
@@ -88,10 +189,15 @@ def _set_log_level(in_logger: logging.Logger, log_level: int | str) -> None:
         in_logger.setLevel(log_level)
 
 
-def _add_file_handler(in_logger: logging.Logger, log_path: str) -> None:
-    """Add a file handler to the logger."""
+def _add_file_handler(
+    in_logger: logging.Logger,
+    log_path: str,
+    max_bytes: int = LOG_MAX_BYTES,
+    backup_count: int = LOG_BACKUP_COUNT,
+) -> None:
+    """Add a rotating file handler to the logger."""
     try:
-        file_handler = RotatingFileHandler(log_path, maxBytes=1000000, backupCount=5)
+        file_handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count)
     except IsADirectoryError as exc:
         err = "You are trying to log to a directory, try a file"
         raise IsADirectoryError(err) from exc
@@ -0,0 +1,180 @@
+"""Low overhead metrics, served in the Prometheus text format at /metrics.
+
+Recording happens on the hot path (every input, every tick), so it has to cost next to nothing:
+    Counters and histograms are striped, every thread records into its own cell without taking a lock,
+    the cells are only added up when /metrics is scraped. Threads come and go (waitress recycles them, the
+    socket sender is replaced on restart), so the cells of threads that have exited are folded into one.
+    Histogram buckets are fixed when the histogram is created, recording is a bisect and two adds.
+    Gauges are functions called at scrape time, so there is nothing to record at all.
+"""
+
+import logging
+import threading
+from bisect import bisect_left
+from collections.abc import Callable
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+TICK_BUCKETS = (0.001, 0.002, 0.004, 0.00833, 0.0167, 0.0333, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Striped:
+    """Per thread cells of numbers, summed when read."""
+
+    def __init__(self, size: int) -> None:
+        """Every cell holds size numbers."""
+        self._size = size
+        self._local = threading.local()
+        self._cells = []  # (thread, cell) of every thread that has recorded, and was alive at the last read
+        self._retired = [0] * size  # The cells of threads that have exited, added up
+        self._cells_lock = threading.Lock()  # Only taken the first time a thread records, and when reading
+
+    def _cell(self) -> list:
+        """Return this thread's cell, only the owning thread ever writes to it."""
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = [0] * self._size
+            with self._cells_lock:
+                self._cells.append((threading.current_thread(), cell))
+            self._local.cell = cell
+            return cell
+
+    def _sum(self) -> list:
+        """Add up every thread's cell, folding the cells of threads that have exited into the retired total."""
+        with self._cells_lock:
+            live = []
+            for thread, cell in self._cells:
+                if thread.is_alive():
+                    live.append((thread, cell))
+                else:  # It won't write to its cell again
+                    self._retired = [retired + value for retired, value in zip(self._retired, cell, strict=True)]
+            self._cells = live
+            cells = [self._retired, *(cell for _, cell in live)]
+        return [sum(column) for column in zip(*cells, strict=True)]
+
+
+class Counter(_Striped):
+    """Number that only goes up."""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, description: str) -> None:
+        """Create the counter."""
+        super().__init__(1)
+        self.name = name
+        self.description = description
+
+    def inc(self, amount: float = 1) -> None:
+        """Count something."""
+        self._cell()[0] += amount
+
+    def get(self) -> float:
+        """Return the total."""
+        return self._sum()[0]
+
+    def render(self) -> list[str]:
+        """Return the sample lines."""
+        return [f"{self.name} {self.get()}"]
+
+
+class Histogram(_Striped):
+    """Counts of observed values per bucket, plus their sum."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...]) -> None:
+        """Create the histogram, buckets are the upper bounds in ascending order, +Inf is added."""
+        super().__init__(len(buckets) + 2)  # The buckets, +Inf, then the sum
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float) -> None:
+        """Record a value."""
+        cell = self._cell()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def get(self) -> tuple[list[int], float]:
+        """Return the (non cumulative) count per bucket including +Inf, and the sum."""
+        totals = self._sum()
+        return totals[:-1], totals[-1]
+
+    def render(self) -> list[str]:
+        """Return the sample lines, bucket counts are cumulative like Prometheus expects."""
+        counts, total = self.get()
+        lines = []
+        cumulative = 0
+        for bound, count in zip([*self.buckets, "+Inf"], counts, strict=True):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Value read from a function at scrape time, can also expose a counter that something else keeps."""
+
+    def __init__(self, name: str, description: str, getter: Callable[[], float], metric_type: str = "gauge") -> None:
+        """Create the gauge."""
+        self.name = name
+        self.description = description
+        self.metric_type = metric_type
+        self._getter = getter
+
+    def get(self) -> float:
+        """Return the current value."""
+        return self._getter()
+
+    def render(self) -> list[str]:
+        """Return the sample lines."""
+        return [f"{self.name} {float(self.get())}"]
+
+
+class Registry:
+    """Every metric, in the order they were created."""
+
+    def __init__(self) -> None:
+        """Init."""
+        self._metrics = {}
+
+    def _register(self, metric: Counter | Histogram | Gauge) -> Counter | Histogram | Gauge:
+        """Add a metric, names have to be unique."""
+        if metric.name in self._metrics:
+            msg = f"Metric already registered: {metric.name}"
+            raise ValueError(msg)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        """Create and register a counter."""
+        return self._register(Counter(name, description))
+
+    def histogram(self, name: str, description: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        """Create and register a histogram."""
+        return self._register(Histogram(name, description, buckets))
+
+    def gauge(self, name: str, description: str, getter: Callable[[], float], metric_type: str = "gauge") -> Gauge:
+        """Create and register a gauge."""
+        return self._register(Gauge(name, description, getter, metric_type))
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            try:
+                lines.extend(metric.render())
+            except Exception:  # A broken gauge shouldn't take the whole endpoint down
+                logger.exception("Could not read metric: %s", metric.name)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()  # The app's metrics, served at /metrics
@@ -0,0 +1,92 @@
+"""Run flaskcontroller as one sender process and several web worker processes.
+
+A single waitress process is limited by the GIL, so adding threads stops adding throughput well before
+the cores run out. This runs the web side in as many processes as you like:
+    The sender process (this one) owns the emulator link, the input queue, the player table and the websocket.
+    Each worker process runs waitress on the same port (SO_REUSEPORT, the kernel spreads connections out),
+    and writes the input it gets into a shared memory ring buffer that the sender reads, see shared.py.
+    The sender publishes its status into the same shared memory, so /GetStatus is answered by the workers.
+
+Run from the repo root: python -m flaskcontroller.multiprocess --listen 127.0.0.1:5000 --workers 4
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+
+import waitress
+
+from . import controller, create_app, shared
+from .sender import parse_target
+
+logger = logging.getLogger(__name__)
+
+WORKER_STOP_TIMEOUT = 5  # Seconds to wait for the workers to exit when stopping
+
+
+def bind_shared_socket(listen: str) -> socket.socket:
+    """Bind a listening socket that the other workers can bind too, the kernel balances connections between them."""
+    host, port = parse_target(listen)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def run_worker(listen: str, threads: int, instance_path: str | None, doorbell: object) -> None:
+    """Web worker process, serves requests and forwards input to the sender process."""
+    shared.process_mode = shared.PROCESS_WORKER
+    shared.doorbell = doorbell
+    app = create_app(instance_path=instance_path)
+    waitress.serve(app, sockets=[bind_shared_socket(listen)], threads=threads)
+
+
+def main() -> None:
+    """Start the sender, then the workers, and wait for them."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listen", default="127.0.0.1:5000", help="host:port the workers serve on")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Web worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="waitress threads per worker")
+    parser.add_argument("--instance-path", default=None, help="Where config.toml is, defaults to Flask's")
+    args = parser.parse_args()
+
+    if not hasattr(socket, "SO_REUSEPORT"):
+        sys.exit("Multi process mode needs SO_REUSEPORT, run waitress-serve on its own on this platform")
+
+    # Workers are spawned, not forked, the sender process already has threads running
+    context = multiprocessing.get_context("spawn")
+    shared.process_mode = shared.PROCESS_SENDER
+    shared.doorbell = context.Semaphore(0)
+    create_app(instance_path=args.instance_path)  # Creates the shared memory and starts the socket sender
+
+    workers = [
+        context.Process(
+            target=run_worker,
+            args=(args.listen, args.threads, args.instance_path, shared.doorbell),
+            name=f"flaskcontroller-worker-{number}",
+        )
+        for number in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    logger.info("Started %s web workers on %s", len(workers), args.listen)
+
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        logger.info("Stopping web workers")
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join(WORKER_STOP_TIMEOUT)
+    finally:
+        controller._run_thread = False  # noqa: SLF001 Stop the socket sender, the input pump removes the shared memory
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Per player input state, merged into the one state the emulator gets."""
+
+import logging
+import sys
+import threading
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+MERGE_OR = "or"  # Anarchy, a button is down if anyone is holding it
+MERGE_MAJORITY = "majority"  # Democracy, a button is down if most players holding something are holding it
+MERGE_LATEST = "latest"  # Whoever changed their input last gets the whole controller
+MERGE_MODES = [MERGE_OR, MERGE_MAJORITY, MERGE_LATEST]
+
+N_BUTTONS = 10  # GBA buttons, see the input mapping table in the emulator scripts
+BUTTONS_MASK = (1 << N_BUTTONS) - 1
+LANE_BITS = 16  # Each player's state is a uint16
+MAX_TICK_STATES = 8  # Most states merge_events() returns, the emulator plays them one per frame
+
+
+def pack_event(slot: int, state: int) -> int:
+    """Pack a player slot and their new state into one int for the input queue."""
+    return (slot << LANE_BITS) | state
+
+
+def unpack_event(event: int) -> tuple[int, int]:
+    """Unpack an input queue event into (slot, state)."""
+    return event >> LANE_BITS, event & 0xFFFF
+
+
+class PlayerInputTable:
+    """Button state word per player, stored in a flat array and indexed by an interned player id.
+
+    Requests only touch their own player's word, the merge over every player happens once per tick.
+    """
+
+    def __init__(self, max_players: int = 10000, merge_mode: str = MERGE_OR) -> None:
+        """Create the table.
+
+        Args:
+            max_players: Number of slots, players past this can't send input until someone expires.
+            merge_mode: How to combine every player's state, one of MERGE_MODES.
+        """
+        if merge_mode not in MERGE_MODES:
+            msg = f"Invalid merge mode: {merge_mode}, expected one of {MERGE_MODES}"
+            raise ValueError(msg)
+
+        self.max_players = max_players
+        self.merge_mode = merge_mode
+        self._slots = {}  # player id -> slot
+        self._slot_ids = {}  # slot -> player id, to turn queue events back into players
+        self._free_slots = []
+        self._n_slots = 0  # Slots handed out so far, the merge only looks at these
+        self._states = array("H", bytes(2 * max_players))
+        self._changed_at = array("d", bytes(8 * max_players))  # time.monotonic() of each player's last input
+        self._holding = 0  # Players with at least one button down, the electorate for majority
+        self._last_writer = None
+        self._lock = threading.Lock()
+
+        # Everyone's state as of the last merge_events(), only touched by the socket sender
+        self._merged_states = array("H", bytes(2 * max_players))
+        self._merged_counts = [0] * N_BUTTONS
+        self._merged_holding = 0
+        self._merged = 0
+
+    def __len__(self) -> int:
+        """Return the number of players with a slot."""
+        return len(self._slots)
+
+    def get_state(self, player_id: str) -> int:
+        """Return a player's current state, 0 if they don't have a slot."""
+        slot = self._slots.get(player_id)
+        return 0 if slot is None else self._states[slot]
+
+    def get_player_id(self, slot: int) -> str | None:
+        """Return the id of the player in a slot, None if the slot is free."""
+        return self._slot_ids.get(slot)
+
+    def apply(self, player_id: str, mask: int, pressed: bool) -> int | None:  # noqa: FBT001 Straight from the input
+        """Press or release buttons for a player.
+
+        Returns:
+            The queue event for the change, or None if the table is full.
+        """
+        with self._lock:
+            slot = self._slots.get(player_id)
+            if slot is None:
+                slot = self._intern(player_id)
+                if slot is None:
+                    return None
+
+            return pack_event(slot, self._set_buttons(slot, mask, pressed))
+
+    def apply_many(self, player_id: str, inputs: list[tuple[int, bool]]) -> list[int] | None:
+        """Press or release buttons for a player, for each (mask, pressed) in order, all at once.
+
+        The merge can't happen part way through, so a batch lands in one tick. There is an event for every
+        change, so the tick still sends each of them, see merge_events(), a press and release is a tap.
+
+        Returns:
+            The queue event for each change, or None if the table is full.
+        """
+        with self._lock:
+            slot = self._slots.get(player_id)
+            if slot is None:
+                slot = self._intern(player_id)
+                if slot is None:
+                    return None
+
+            return [pack_event(slot, self._set_buttons(slot, mask, pressed)) for mask, pressed in inputs]
+
+    def _set_buttons(self, slot: int, mask: int, pressed: bool) -> int:  # noqa: FBT001
+        """Press or release buttons in a slot, the lock must be held. Returns the new state."""
+        old_state = self._states[slot]
+        new_state = old_state | mask if pressed else old_state & ~mask
+        self._states[slot] = new_state
+        self._changed_at[slot] = time.monotonic()
+        self._holding += bool(new_state) - bool(old_state)
+        self._last_writer = slot
+        return new_state
+
+    def release(self, player_id: str) -> int | None:
+        """Release every button a player is holding and free their slot.
+
+        Returns:
+            The queue event for the change, or None if the player didn't have a slot.
+        """
+        with self._lock:
+            slot = self._slots.pop(player_id, None)
+            if slot is None:
+                return None
+            del self._slot_ids[slot]
+
+            self._holding -= bool(self._states[slot])
+            self._states[slot] = 0
+            self._free_slots.append(slot)
+            if self._last_writer == slot:
+                self._last_writer = None
+
+        logger.debug("Released player: %s", player_id)
+        return pack_event(slot, 0)
+
+    def clear_stale(self, max_age: float) -> list[int]:
+        """Release the buttons of players who haven't changed their input in max_age seconds, they keep their slot.
+
+        Returns:
+            The queue events for the changes.
+        """
+        cutoff = time.monotonic() - max_age
+        events = []
+        with self._lock:
+            for slot in self._slots.values():
+                if self._states[slot] and self._changed_at[slot] < cutoff:
+                    self._states[slot] = 0
+                    self._holding -= 1
+                    events.append(pack_event(slot, 0))
+
+        if events:
+            logger.info("Released the buttons of %s players with stale input", len(events))
+        return events
+
+    def _intern(self, player_id: str) -> int | None:
+        """Give a player a slot, the lock must be held."""
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        elif self._n_slots < self.max_players:
+            slot = self._n_slots
+            self._n_slots += 1
+        else:
+            logger.warning("Player table full, ignoring input from: %s", player_id)
+            return None
+
+        self._slots[player_id] = slot
+        self._slot_ids[slot] = player_id
+        return slot
+
+    def button_counts(self) -> tuple[list[int], int]:
+        """Count how many players are holding each button.
+
+        Returns:
+            The count for each button, and how many players are holding anything.
+        """
+        with self._lock:
+            n_slots = self._n_slots
+            holding = self._holding
+            states = self._states[:n_slots]
+
+        return count_buttons(states), holding
+
+    def merge(self) -> int:
+        """Combine every player's state into the state for the emulator, per the merge mode."""
+        if self.merge_mode == MERGE_LATEST:
+            with self._lock:
+                return 0 if self._last_writer is None else self._states[self._last_writer]
+
+        counts, holding = self.button_counts()
+        return self._merge_counts(counts, holding, 0)
+
+    def merge_events(self, events: list[int], max_states: int = MAX_TICK_STATES) -> list[int]:
+        """Return the states to send for the queue events drained this tick, the last is the merged state now.
+
+        The events are replayed over everyone's state as of the last call, so a press and release that
+        both land in one tick still come out as a press then a release. The replay is coalesced into the
+        fewest states that keep every change, a new state is only started when a button would change
+        back within the current one. Past max_states the rest are merged into the last state.
+        Only the socket sender calls this, it is the one consumer of the input queue.
+        """
+        view = self._merged_states
+        counts = self._merged_counts
+        holding = self._merged_holding
+        states = []
+        current = self._merged
+        changed = 0  # Buttons that have changed within the current state
+
+        def step(merged: int) -> None:
+            nonlocal current, changed
+            flipped = merged ^ current
+            if flipped & changed and len(states) < max_states - 1:
+                states.append(current)
+                changed = 0
+            changed |= flipped
+            current = merged
+
+        for event in events:
+            slot, state = unpack_event(event)
+            old_state = view[slot]
+            view[slot] = state
+            flipped = (old_state ^ state) & BUTTONS_MASK
+            while flipped:
+                bit = flipped & -flipped  # Lowest flipped bit
+                counts[bit.bit_length() - 1] += 1 if state & bit else -1
+                flipped ^= bit
+            holding += bool(state) - bool(old_state)
+            step(self._merge_counts(counts, holding, state))
+
+        # Finish on the table as it is now, which also covers input the queue dropped or expired
+        with self._lock:
+            self._merged_states = self._states[:]
+            n_slots = self._n_slots
+            self._merged_holding = self._holding
+            latest = 0 if self._last_writer is None else self._states[self._last_writer]
+        self._merged_counts = count_buttons(self._merged_states[:n_slots])
+        self._merged = self._merge_counts(self._merged_counts, self._merged_holding, latest)
+        step(self._merged)
+        states.append(current)
+        return states
+
+    def _merge_counts(self, counts: list[int], holding: int, latest: int) -> int:
+        """Return the merged state from the button counts, or the latest writer's state, per the merge mode."""
+        if self.merge_mode == MERGE_LATEST:
+            return latest
+        if self.merge_mode == MERGE_MAJORITY:
+            return sum(1 << bit for bit, count in enumerate(counts) if count * 2 > holding)
+        return sum(1 << bit for bit, count in enumerate(counts) if count)  # MERGE_OR
+
+
+def count_buttons(states: array) -> list[int]:
+    """Count how many of the states have each button down.
+
+    Every state is a 16 bit lane of one big integer, so each count is a shift, a mask
+    and a popcount over all players at once rather than a loop over players.
+    """
+    lanes = int.from_bytes(states.tobytes(), sys.byteorder)
+    lsb_of_each_lane = ((1 << (LANE_BITS * len(states))) - 1) // 0xFFFF
+    return [((lanes >> bit) & lsb_of_each_lane).bit_count() for bit in range(N_BUTTONS)]
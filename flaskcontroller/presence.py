@@ -0,0 +1,57 @@
+"""Track which players are active, for the player count."""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+    """Time ordered table of player ids and when they were last seen.
+
+    Ids are kept in the order they were last touched, so the ones that have timed out are always at the front.
+    Touching moves an id to the back, O(1), and does nothing else so it is cheap enough for every request.
+    Expiring pops from the front, amortised O(1), and is left to the socket sender thread.
+    """
+
+    def __init__(self, timeout: float = 7, max_players: int = 10000) -> None:
+        """Create the tracker.
+
+        Args:
+            timeout: Seconds without contact before a player is no longer counted.
+            max_players: Most ids to track, the least recently seen are dropped past this when expiring.
+        """
+        self.timeout = timeout
+        self.max_players = max_players
+        self._last_seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, player_id: str) -> bool:
+        """Check if a player is being tracked."""
+        return player_id in self._last_seen
+
+    def touch(self, player_id: str) -> None:
+        """Mark a player as active."""
+        now = time.monotonic()
+        with self._lock:
+            self._last_seen[player_id] = now
+            self._last_seen.move_to_end(player_id)
+
+    def expire(self) -> list[str]:
+        """Drop players that have timed out, and the least recently seen past max_players, returns their ids."""
+        expired = []
+        with self._lock:
+            cutoff = time.monotonic() - self.timeout
+            while self._last_seen:
+                player_id, last_seen = next(iter(self._last_seen.items()))
+                if last_seen >= cutoff and len(self._last_seen) <= self.max_players:
+                    break
+                del self._last_seen[player_id]
+                expired.append(player_id)
+        return expired
+
+    def count(self) -> int:
+        """Return the number of active players as of the last expire(), doesn't do any cleanup."""
+        return len(self._last_seen)
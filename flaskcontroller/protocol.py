@@ -0,0 +1,218 @@
+"""Wire protocol between flaskcontroller and the emulator scripts.
+
+Version 1 is a bare 2 byte little endian input state per send, no framing.
+
+Version 2 batches every state pending in a tick into one frame:
+    Header  <BBIHH  magic (0xFC), version (2), sequence number, number of states, number of entries
+    Entries <HB     input state, how many times in a row it repeats (run length)
+Sequence numbers count up by one per frame (wrapping at 2^32) so a receiver can spot lost or reordered frames.
+
+Pull mode ([app] send_mode = "pull") lets the emulator set the pace instead of the tick rate. Every frame
+the emulator sends a frame tick, and gets back the merged input state for that frame:
+    Frame tick  <BI     magic (0xFD), frame number              emulator to flaskcontroller
+    Pull state  <BIH    magic (0xFD), frame number, input state flaskcontroller to emulator
+
+With [app] latency_acks the emulator acks every state it applies, for the latency telemetry (see latency.py):
+    Ack         <BII    magic (0xFE), sequence number (or pull frame number) of the state, frame it was applied on
+Version 1 states have no sequence number, so acks need version 2 or pull mode.
+"""
+
+import logging
+import struct
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_V1 = 1
+PROTOCOL_V2 = 2
+PROTOCOL_VERSIONS = [PROTOCOL_V1, PROTOCOL_V2]
+
+V1_STATE = struct.Struct("<H")
+V2_MAGIC = 0xFC
+V2_HEADER = struct.Struct("<BBIHH")
+V2_ENTRY = struct.Struct("<HB")
+V2_MAX_RUN = 0xFF
+V2_MAX_STATES = 0xFFFF
+SEQ_MODULO = 2**32
+
+SEND_PUSH = "push"  # Send when there is input, at most once per tick at the tick rate
+SEND_PULL = "pull"  # Send when the emulator asks, once per emulator frame
+SEND_MODES = [SEND_PUSH, SEND_PULL]
+PULL_MAGIC = 0xFD
+FRAME_TICK = struct.Struct("<BI")
+PULL_STATE = struct.Struct("<BIH")
+ACK_MAGIC = 0xFE
+ACK = struct.Struct("<BII")
+EMULATOR_MESSAGES = {PULL_MAGIC: FRAME_TICK, ACK_MAGIC: ACK}  # What the emulator can send us, by magic
+
+
+class ProtocolError(Exception):
+    """Error to raise if received data doesn't follow the protocol."""
+
+
+class EmulatorMessage(NamedTuple):
+    """A frame tick or an ack from the emulator."""
+
+    magic: int  # PULL_MAGIC for a frame tick, ACK_MAGIC for an ack
+    seq: int  # The frame number of a tick, the sequence number (or pull frame number) an ack is for
+    applied_frame: int = 0  # Emulator frame an acked state was applied on
+
+
+class Frame(NamedTuple):
+    """A decoded version 2 frame."""
+
+    seq: int
+    states: list[int]
+
+
+def encode_v1(state: int) -> bytes:
+    """Encode a single input state the original way."""
+    return V1_STATE.pack(state)
+
+
+def encode_tick(frame: int) -> bytes:
+    """Encode a frame tick, what the emulator sends in pull mode."""
+    return FRAME_TICK.pack(PULL_MAGIC, frame % SEQ_MODULO)
+
+
+def encode_pull_state(frame: int, state: int) -> bytes:
+    """Encode the input state for a frame, the reply to a frame tick."""
+    return PULL_STATE.pack(PULL_MAGIC, frame % SEQ_MODULO, state)
+
+
+def encode_ack(seq: int, applied_frame: int) -> bytes:
+    """Encode an ack, what the emulator sends when it applies a state."""
+    return ACK.pack(ACK_MAGIC, seq % SEQ_MODULO, applied_frame % SEQ_MODULO)
+
+
+def run_length_encode(states: list[int]) -> list[tuple[int, int]]:
+    """Collapse repeated states into (state, run length) entries."""
+    entries = []
+    for state in states:
+        if entries and entries[-1][0] == state and entries[-1][1] < V2_MAX_RUN:
+            entries[-1] = (state, entries[-1][1] + 1)
+        else:
+            entries.append((state, 1))
+    return entries
+
+
+class FrameEncoder:
+    """Encode batches of input states into version 2 frames, keeps track of the sequence number."""
+
+    def __init__(self) -> None:
+        """Init, sequence numbers start at 0."""
+        self.seq = 0
+
+    def encode(self, states: list[int]) -> bytes:
+        """Encode states into frames, returned as one bytes object so it can go out in one write.
+
+        Batches larger than a single frame can hold are split over several frames.
+        """
+        out = bytearray()
+        for start in range(0, max(len(states), 1), V2_MAX_STATES):
+            chunk = states[start : start + V2_MAX_STATES]
+            entries = run_length_encode(chunk)
+            out += V2_HEADER.pack(V2_MAGIC, PROTOCOL_V2, self.seq, len(chunk), len(entries))
+            for state, run in entries:
+                out += V2_ENTRY.pack(state, run)
+            self.seq = (self.seq + 1) % SEQ_MODULO
+        return bytes(out)
+
+    def encode_resume(self, state: int) -> bytes:
+        """Encode a state for one receiver joining the stream, with the sequence number of the last frame.
+
+        The sequence number isn't used up, so the receivers already on the stream don't see a gap,
+        and the joining one carries on from it with the next frame.
+        """
+        seq = (self.seq - 1) % SEQ_MODULO
+        return V2_HEADER.pack(V2_MAGIC, PROTOCOL_V2, seq, 1, 1) + V2_ENTRY.pack(state, 1)
+
+
+class FrameDecoder:
+    """Decode a stream of version 2 frames, handles frames split over several reads."""
+
+    def __init__(self) -> None:
+        """Init."""
+        self._buffer = bytearray()
+        self.expected_seq = None
+        self.lost = 0  # Frames we never saw
+        self.reordered = 0  # Frames that arrived after a later one
+
+    def feed(self, data: bytes) -> list[Frame]:
+        """Add received data, return every frame that is now complete.
+
+        Raises ProtocolError for an invalid frame. If there are good frames before it they are returned first,
+        and the next feed() (even with no data) raises.
+        """
+        self._buffer += data
+        frames = []
+
+        while len(self._buffer) >= V2_HEADER.size:
+            magic, version, seq, n_states, n_entries = V2_HEADER.unpack_from(self._buffer)
+            if magic != V2_MAGIC or version != PROTOCOL_V2:
+                if frames:
+                    break  # Hand over the good frames, this is raised next time
+                self._buffer.clear()
+                msg = f"Invalid frame header, magic: {magic:#x}, version: {version}"
+                raise ProtocolError(msg)
+
+            frame_size = V2_HEADER.size + n_entries * V2_ENTRY.size
+            if len(self._buffer) < frame_size:
+                break  # Rest of the frame hasn't arrived yet
+
+            states = []
+            for state, run in V2_ENTRY.iter_unpack(self._buffer[V2_HEADER.size : frame_size]):
+                states.extend([state] * run)
+            if len(states) != n_states:
+                if frames:
+                    break  # Hand over the good frames, this is raised next time
+                del self._buffer[:frame_size]
+                msg = f"Frame {seq} header says {n_states} states, entries hold {len(states)}"
+                raise ProtocolError(msg)
+            del self._buffer[:frame_size]
+
+            self._track_seq(seq)
+            frames.append(Frame(seq, states))
+
+        return frames
+
+    def _track_seq(self, seq: int) -> None:
+        """Count lost and reordered frames from the sequence numbers."""
+        if self.expected_seq is not None and seq != self.expected_seq:
+            gap = (seq - self.expected_seq) % SEQ_MODULO
+            if gap < SEQ_MODULO // 2:
+                self.lost += gap
+                logger.warning("Lost %s frame(s) before frame %s", gap, seq)
+            else:
+                self.reordered += 1
+                logger.warning("Frame %s arrived out of order", seq)
+                return  # Don't move the expected sequence number backwards
+
+        self.expected_seq = (seq + 1) % SEQ_MODULO
+
+
+class EmulatorDecoder:
+    """Decode a stream of frame ticks and acks from an emulator, handles messages split over several reads."""
+
+    def __init__(self) -> None:
+        """Init."""
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[EmulatorMessage]:
+        """Add received data, return every message that is now complete."""
+        self._buffer += data
+        messages = []
+        offset = 0
+        while offset < len(self._buffer):
+            message_struct = EMULATOR_MESSAGES.get(self._buffer[offset])
+            if message_struct is None:
+                magic = self._buffer[offset]
+                self._buffer.clear()
+                msg = f"Invalid message from emulator, magic: {magic:#x}"
+                raise ProtocolError(msg)
+            if len(self._buffer) - offset < message_struct.size:
+                break  # Rest of the message hasn't arrived yet
+            messages.append(EmulatorMessage(*message_struct.unpack_from(self._buffer, offset)))
+            offset += message_struct.size
+        del self._buffer[:offset]
+        return messages
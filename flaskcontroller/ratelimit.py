@@ -0,0 +1,73 @@
+"""Token bucket rate limiting, per client id and per remote address.
+
+Each key gets a bucket of burst tokens that refills at rate tokens per second, a request takes a token
+or is turned away. A request can cost more than one token (a batch of inputs costs one per input), one that
+costs more than the burst is let through on a full bucket and leaves it in debt, so batching can't get more
+through than the rate. Buckets live in an OrderedDict kept in order of last use, so the ones that have been
+idle long enough to be full again (and so are the same as no bucket at all) are always at the front,
+and sweeping them out as we go costs nothing for the buckets still in use.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH = 64  # Most idle buckets swept per call, keeps any one request from paying for a big sweep
+
+
+class TokenBucketLimiter:
+    """Token bucket per key, checking a key is O(1)."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        """Create the limiter.
+
+        Args:
+            rate: Tokens added per second, the sustained requests per second allowed.
+            burst: Most tokens a bucket holds, the requests allowed at once after being idle.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._idle_after = burst / rate  # Seconds for an empty bucket to fill back up
+        self._buckets = OrderedDict()  # key -> [tokens, time.monotonic() of last update], least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of buckets being kept."""
+        return len(self._buckets)
+
+    def take(self, key: str, tokens: float = 1) -> float:
+        """Take tokens for key, at most the burst has to be there for it, the rest is taken as debt.
+
+        Returns:
+            0 if there were enough tokens, otherwise the seconds until there will be.
+        """
+        needed = min(tokens, self.burst)
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._buckets[key] = [self.burst - tokens, now]
+                return 0
+
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < needed:
+                return (needed - bucket[0]) / self.rate
+
+            bucket[0] -= tokens
+            return 0
+
+    def _sweep(self, now: float) -> None:
+        """Forget buckets that have filled back up, the lock must be held."""
+        for _ in range(SWEEP_BATCH):
+            if not self._buckets:
+                return
+            key, (tokens, last) = next(iter(self._buckets.items()))
+            if now - last < max(self._idle_after, (self.burst - tokens) / self.rate):  # Longer if in debt
+                return  # Everything after this was used more recently
+            del self._buckets[key]
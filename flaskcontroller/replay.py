@@ -0,0 +1,102 @@
+"""Replay input journals to an emulator, with the original timing or faster.
+
+python -m flaskcontroller.replay journal.bin.1 journal.bin --target 127.0.0.1:5001 --speed 2
+
+Monotonic timestamps only compare within one run of the app, and each run starts a new journal, so every file is
+timed from its own first record. The gap between files comes from the wall clock start in their headers, capped so
+the downtime between two runs (or a clock that jumped) doesn't stall the replay.
+"""
+
+import argparse
+import logging
+import socket
+import time
+
+from .journal import read_journal, read_journal_start
+from .protocol import PROTOCOL_V2, PROTOCOL_VERSIONS, FrameEncoder, encode_v1
+from .sender import create_socket, parse_target
+
+logger = logging.getLogger(__name__)
+
+MAX_FILE_GAP = 1.0  # Seconds, the longest pause between the last state of one journal and the first of the next
+
+
+def replay(
+    paths: list[str],
+    sock: socket.socket,
+    speed: float = 1,
+    protocol_version: int = 1,
+    *,
+    max_file_gap: float = MAX_FILE_GAP,
+) -> int:
+    """Send the states from journals to an emulator, with the original gaps between them divided by speed.
+
+    Args:
+        paths: Journal files, oldest first.
+        sock: Connected emulator socket.
+        speed: 2 is twice as fast, 0 sends as fast as the socket will take them.
+        protocol_version: The emulator's protocol version.
+        max_file_gap: Cap in journal seconds on the gap between files, taken from their header start times.
+
+    Returns:
+        The number of states sent.
+    """
+    frame_encoder = FrameEncoder()
+    start = time.monotonic()
+    position = 0  # Journal ns since the first record, across files
+    previous_end = None  # Wall clock ns of the previous file's last record
+    sent = 0
+    for path in paths:
+        file_start = read_journal_start(path)
+        if previous_end is not None:
+            position += min(max(file_start - previous_end, 0), int(max_file_gap * 1e9))
+        file_position = position
+        first_time = None
+        with read_journal(path) as records:
+            for timestamp, state, _ in records:
+                if first_time is None:
+                    first_time = timestamp
+                position = file_position + timestamp - first_time
+                if speed > 0:
+                    delay = start + position / 1e9 / speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                sock.sendall(frame_encoder.encode([state]) if protocol_version == PROTOCOL_V2 else encode_v1(state))
+                sent += 1
+        previous_end = file_start + position - file_position
+    return sent
+
+
+def main() -> None:
+    """Replay journals to an emulator."""
+    parser = argparse.ArgumentParser(description="Replay flaskcontroller journals to an emulator")
+    parser.add_argument("paths", nargs="+", help="Journal files, oldest first, e.g. journal.bin.2 journal.bin.1")
+    parser.add_argument("--target", default="127.0.0.1:5001", help="Emulator host:port or unix:/path")
+    parser.add_argument("--speed", type=float, default=1, help="Playback speed, 0 for as fast as possible")
+    parser.add_argument("--protocol-version", type=int, default=1, choices=PROTOCOL_VERSIONS)
+    parser.add_argument(
+        "--max-file-gap",
+        type=float,
+        default=MAX_FILE_GAP,
+        help="Longest pause in journal seconds between one file and the next, e.g. across a restart",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    address, port = parse_target(args.target)
+    with create_socket(unix=port is None) as sock:
+        sock.connect(address if port is None else (address, port))
+        start = time.monotonic()
+        sent = replay(
+            args.paths,
+            sock,
+            speed=args.speed,
+            protocol_version=args.protocol_version,
+            max_file_gap=args.max_file_gap,
+        )
+    logger.info("Replayed %s states in %.2fs", sent, time.monotonic() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Tick scheduler for the socket sender, wakes on input but never sends faster than the tick rate."""
+
+import logging
+import time
+
+from .input_queue import InputQueue
+
+logger = logging.getLogger(__name__)
+
+
+class TickScheduler:
+    """Event driven scheduler with absolute monotonic deadlines.
+
+    An idle sender sleeps on the input queue and fires as soon as input arrives.
+    While input keeps coming, ticks are spaced one period apart on deadlines computed from the
+    previous deadline (not from when the loop finished), so the rate doesn't drift. That includes a loop
+    that comes back a little after the deadline, it fires straight away and stays on the chain. Only one that
+    is a whole period or more late (idle, or stalled) starts a new chain from now.
+    Jitter is how late a tick fired compared to its deadline.
+    """
+
+    def __init__(self, tick_rate: float) -> None:
+        """Create the scheduler.
+
+        Args:
+            tick_rate: Maximum ticks per second, generally the emulator frame rate or a multiple of it.
+        """
+        self.period = 0.0
+        self.set_tick_rate(tick_rate)
+        self._next_deadline = 0.0
+
+        # Stats
+        self.ticks = 0
+        self.last_jitter = 0.0
+        self.max_jitter = 0.0
+        self._total_jitter = 0.0
+
+    def set_tick_rate(self, tick_rate: float) -> None:
+        """Set the tick rate, takes effect from the next deadline."""
+        tick_rate = float(tick_rate)
+        if tick_rate <= 0:
+            msg = f"Tick rate must be greater than 0, got: {tick_rate}"
+            raise ValueError(msg)
+
+        self.period = 1 / tick_rate
+
+    def wait(self, input_queue: InputQueue, timeout: float | None = None) -> bool:
+        """Block until there is input to send and the next tick is due.
+
+        Args:
+            input_queue: The queue to wait on.
+            timeout: How long to wait for input, so the caller can check if it should stop.
+
+        Returns:
+            True if a tick is due and there is input, False if the timeout passed with nothing to send.
+        """
+        if not input_queue.wait(timeout):
+            return False
+
+        deadline = self._next_deadline
+        woken = time.monotonic()
+        if woken < deadline:  # Busy, wait for the deadline
+            time.sleep(deadline - woken)
+            fired = time.monotonic()
+            jitter = fired - deadline
+        else:  # Due already, fire now
+            fired = woken
+            jitter = fired - deadline if fired - deadline < self.period else 0.0  # Idle isn't late
+
+        if fired - deadline < self.period:  # Chain off the previous deadline so the rate doesn't drift
+            self._next_deadline = deadline + self.period
+        else:  # Idle, or stalled for a whole period, start a new chain of deadlines from now
+            self._next_deadline = fired + self.period
+
+        self.ticks += 1
+        self.last_jitter = jitter
+        self.max_jitter = max(self.max_jitter, jitter)
+        self._total_jitter += jitter
+
+        return True
+
+    def time_to_tick(self, input_queue: InputQueue, timeout: float) -> float:
+        """Return how long wait() would block for, timeout if there is no input, otherwise until the next deadline.
+
+        For a caller that waits somewhere else (e.g. on sockets) and then calls wait() with a timeout of 0.
+        """
+        if not input_queue:
+            return timeout
+        return max(0.0, self._next_deadline - time.monotonic())
+
+    def get_stats(self) -> dict:
+        """Return the tick and jitter stats, jitter is in seconds."""
+        return {
+            "ticks": self.ticks,
+            "period": self.period,
+            "last_jitter": self.last_jitter,
+            "max_jitter": self.max_jitter,
+            "mean_jitter": self._total_jitter / self.ticks if self.ticks else 0.0,
+        }
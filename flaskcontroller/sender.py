@@ -0,0 +1,469 @@
+"""Sends every tick's input to one or more emulator targets from a single thread.
+
+Each target has its own non-blocking connection, send buffer and reconnect timer, and a selector
+tells us when a connection has finished connecting or has room for more data.
+A target that can't keep up has its oldest unsent frames dropped, it never holds up the others.
+
+Targets are "host:port" for TCP, or "unix:/path/to/socket" for an emulator or bridge on the same host.
+TCP connections have Nagle's algorithm turned off by default, our frames are tiny and every one should
+go out straight away, and keepalive on so a half open connection is noticed and reconnected.
+
+Given an on_connect, every target that connects (or reconnects) is sent whatever frame it returns first,
+so it starts from the current state rather than waiting for the next input to change it.
+
+Given an on_message, connected targets are read from as well. Every frame tick (pull mode) or ack of an
+applied state (latency telemetry) an emulator sends is handed to on_message, and whatever frame it returns
+is sent back to that emulator. After enable_wake(), wake() lets another thread cut a service() wait short,
+so the socket sender can wait on the targets' sockets and still notice new input straight away.
+"""
+
+import contextlib
+import errno
+import logging
+import random
+import selectors
+import socket
+import time
+from collections import deque
+from collections.abc import Callable
+
+from . import metrics
+from .protocol import PULL_MAGIC, EmulatorDecoder, EmulatorMessage, ProtocolError
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY = 1  # Seconds before the first retry of a target, doubled for every failure after that
+RECONNECT_MAX_DELAY = 30  # Most seconds between retries
+UNIX_PREFIX = "unix:"
+
+# Socket options, see get_socket_options()
+DEFAULT_SOCKET_OPTIONS = {
+    "nodelay": True,  # TCP_NODELAY
+    "keepalive": True,  # SO_KEEPALIVE
+    "keepalive_idle": 10,  # Seconds idle before the first keepalive probe
+    "keepalive_interval": 5,  # Seconds between probes
+    "keepalive_count": 3,  # Unanswered probes before the connection is dropped
+    "sndbuf": 0,  # SO_SNDBUF in bytes, 0 leaves the OS default
+}
+MAX_PENDING_FRAMES = 64  # Unsent frames a target can have before the oldest are dropped
+RECV_SIZE = 4096  # Bytes per read of frame ticks and acks, ones that arrive together are handled together
+
+metric_connect_attempts = metrics.REGISTRY.counter(
+    "flaskcontroller_socket_connect_attempts_total", "Attempts to connect to an emulator target"
+)
+metric_connects = metrics.REGISTRY.counter(
+    "flaskcontroller_socket_connects_total", "Successful connections to an emulator target"
+)
+metric_frames_dropped = metrics.REGISTRY.counter(
+    "flaskcontroller_target_frames_dropped_total", "Frames dropped because a target couldn't keep up"
+)
+
+
+def parse_target(target: str) -> tuple[str, int | None]:
+    """Parse a "host:port" or "unix:/path" target, raises ValueError if it isn't one.
+
+    Returns:
+        (host, port), or (path, None) for a unix socket.
+    """
+    if target.startswith(UNIX_PREFIX):
+        path = target[len(UNIX_PREFIX) :]
+        if not path:
+            msg = f"Invalid target: {target}, expected unix:/path/to/socket"
+            raise ValueError(msg)
+        return path, None
+
+    host, sep, port = target.rpartition(":")
+    if not sep or not host or not port.isdigit():
+        msg = f"Invalid target: {target}, expected host:port"
+        raise ValueError(msg)
+    return host, int(port)
+
+
+def backoff_delay(failures: int, base: float = RECONNECT_DELAY, ceiling: float = RECONNECT_MAX_DELAY) -> float:
+    """Return how long to wait before the next connection attempt, after failures failed attempts in a row.
+
+    Exponential backoff with jitter, somewhere between half and all of base * 2^(failures - 1) capped at
+    ceiling, so a restarted emulator doesn't get every instance reconnecting at the same moment.
+    """
+    delay = min(ceiling, base * 2 ** min(failures - 1, 32))  # Capped exponent, 2^1000 would be silly
+    return delay / 2 + random.uniform(0, delay / 2)  # noqa: S311 Not for crypto
+
+
+def get_socket_options(app_conf: dict) -> dict:
+    """Return the socket options from the [app] config, the socket_ settings, with defaults for any missing."""
+    return {key: app_conf.get(f"socket_{key}", default) for key, default in DEFAULT_SOCKET_OPTIONS.items()}
+
+
+def create_socket(*, unix: bool, options: dict | None = None) -> socket.socket:
+    """Create a TCP or unix socket and set the socket options on it, doesn't connect."""
+    options = DEFAULT_SOCKET_OPTIONS if options is None else options
+    if unix:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if options["nodelay"]:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if options["keepalive"]:
+            _set_keepalive(sock, options)
+
+    if options["sndbuf"]:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, int(options["sndbuf"]))
+    return sock
+
+
+def _set_keepalive(sock: socket.socket, options: dict) -> None:
+    """Turn keepalive on, with the timings where the platform lets us set them."""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    idle_option = getattr(socket, "TCP_KEEPIDLE", getattr(socket, "TCP_KEEPALIVE", None))  # macOS calls it this
+    for option, value in [
+        (idle_option, options["keepalive_idle"]),
+        (getattr(socket, "TCP_KEEPINTVL", None), options["keepalive_interval"]),
+        (getattr(socket, "TCP_KEEPCNT", None), options["keepalive_count"]),
+    ]:
+        if option is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, option, int(value))
+
+
+def get_targets(app_conf: dict) -> list[tuple[str, int | None]]:
+    """Return the targets from the [app] config, socket_address:socket_port if no targets are set."""
+    targets = app_conf.get("targets")
+    if not targets:
+        return [(app_conf["socket_address"], int(app_conf["socket_port"]))]
+    return [parse_target(target) for target in targets]
+
+
+class Target:
+    """One emulator connection and the frames waiting to go out on it."""
+
+    def __init__(self, address: str, port: int | None) -> None:
+        """Create the target, doesn't connect. A port of None means address is the path of a unix socket."""
+        self.address = address
+        self.port = port
+        self.sock = None
+        self.connecting = False
+        self.connected = False
+        self.events = 0  # Selector events registered for, 0 when not registered
+        self.decoder = EmulatorDecoder()  # Frame ticks and acks read from the emulator
+        self.next_attempt = 0.0  # time.monotonic() of the next connection attempt
+        self.failures = 0  # Connection attempts that failed in a row, for the backoff
+        self._pending = deque()  # (frame, time queued), the first one may be partly sent
+        self._sent_of_first = 0  # Bytes of the first pending frame already sent
+
+        # Stats
+        self.attempts = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frame_ticks = 0
+        self.applied_frame = None  # Emulator frame of the latest ack
+
+    @property
+    def name(self) -> str:
+        """Return host:port, or unix:/path."""
+        return f"{UNIX_PREFIX}{self.address}" if self.port is None else f"{self.address}:{self.port}"
+
+    def has_pending(self) -> bool:
+        """Return True if there are frames waiting to be sent."""
+        return len(self._pending) != 0
+
+    def queue(self, frame: bytes) -> None:
+        """Add a frame to send, dropping the oldest unsent frames if too many are waiting."""
+        self._pending.append((frame, time.monotonic()))
+        while len(self._pending) > MAX_PENDING_FRAMES:
+            # A partly sent frame has to be finished, or the emulator would get half a state
+            del self._pending[1 if self._sent_of_first else 0]
+            self.frames_dropped += 1
+            metric_frames_dropped.inc()
+
+    def send_pending(self) -> None:
+        """Send pending frames until they are all gone or the socket is full, raises OSError if the send fails."""
+        while self._pending:
+            frame = self._pending[0][0]
+            try:
+                self._sent_of_first += self.sock.send(frame[self._sent_of_first :])
+            except BlockingIOError:
+                return  # Socket is full, the selector will tell us when there is room
+            if self._sent_of_first < len(frame):
+                return
+            self._pending.popleft()
+            self._sent_of_first = 0
+            self.frames_sent += 1
+
+    def reset(self) -> None:
+        """Forget the connection and anything that wasn't sent on it."""
+        self.sock = None
+        self.connecting = False
+        self.connected = False
+        self.events = 0
+        self.decoder = EmulatorDecoder()
+        self._pending.clear()
+        self._sent_of_first = 0
+
+    def get_stats(self) -> dict:
+        """Return the status of this target, lag is how long the oldest unsent frame has been waiting."""
+        return {
+            "target": self.name,
+            "connected": self.connected,
+            "attempts": self.attempts,
+            "failures": self.failures,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "frame_ticks": self.frame_ticks,
+            "applied_frame": self.applied_frame,
+            "pending_frames": len(self._pending),
+            "lag": time.monotonic() - self._pending[0][1] if self._pending else 0.0,
+        }
+
+
+class TargetSender:
+    """Non-blocking connections to every target, driven by the socket sender thread."""
+
+    def __init__(  # noqa: PLR0913 The callbacks are keyword only
+        self,
+        targets: list[tuple[str, int | None]],
+        reconnect_delay: float = RECONNECT_DELAY,
+        reconnect_max_delay: float = RECONNECT_MAX_DELAY,
+        socket_options: dict | None = None,
+        *,
+        on_message: Callable[[Target, EmulatorMessage], bytes | None] | None = None,
+        on_connect: Callable[[Target], bytes | None] | None = None,
+    ) -> None:
+        """Create the sender, connections are made by connect_due().
+
+        Args:
+            targets: (host, port) of every emulator, or (path, None) for unix sockets, see parse_target().
+            reconnect_delay: Seconds before the first retry of a target, doubled for every failure after that.
+            reconnect_max_delay: Most seconds between retries.
+            socket_options: See get_socket_options(), the defaults if not given.
+            on_message: Called with the target and every frame tick or ack read from it, returns the frame
+                to send back, if any. Nothing is read from targets if not given.
+            on_connect: Called with every target as it connects, returns the frame to send it first, if any.
+        """
+        self.targets = [Target(address, port) for address, port in targets]
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.socket_options = DEFAULT_SOCKET_OPTIONS if socket_options is None else socket_options
+        self.on_message = on_message
+        self.on_connect = on_connect
+        self._selector = selectors.DefaultSelector()
+        self._wake_reader = None  # See enable_wake()
+        self._wake_writer = None
+
+    def any_connected(self) -> bool:
+        """Return True if at least one target is connected."""
+        return any(target.connected for target in self.targets)
+
+    def needs_service(self) -> bool:
+        """Return True if a target is waiting on the selector, to finish connecting or to send."""
+        return any(target.events & selectors.EVENT_WRITE for target in self.targets)
+
+    def next_attempt(self) -> float | None:
+        """Return the time.monotonic() of the next connection attempt, None if nothing is waiting to reconnect."""
+        waiting = [target.next_attempt for target in self.targets if target.sock is None]
+        return min(waiting) if waiting else None
+
+    def get_stats(self) -> list[dict]:
+        """Return the status of every target."""
+        return [target.get_stats() for target in self.targets]
+
+    def set_targets(self, targets: list[tuple[str, int | None]]) -> None:
+        """Change the targets, ones still in the list keep their connection, removed ones are disconnected."""
+        current = {(target.address, target.port): target for target in self.targets}
+        new_targets = []
+        for address, port in targets:
+            target = current.pop((address, port), None)
+            if target is None:
+                target = Target(address, port)
+                logger.info("Added target: %s", target.name)
+            new_targets.append(target)
+
+        for target in current.values():
+            logger.info("Removed target: %s", target.name)
+            self._disconnect(target)
+        self.targets = new_targets
+
+    def connect_due(self) -> None:
+        """Start connecting to every target that is disconnected and due another attempt."""
+        now = time.monotonic()
+        for target in self.targets:
+            if target.sock is None and now >= target.next_attempt:
+                self._connect(target)
+
+    def broadcast(self, frame: bytes) -> None:
+        """Queue a frame for every connected target and send as much as each will take right now."""
+        for target in self.targets:
+            if target.connected:
+                target.queue(frame)
+                self._flush(target)
+
+    def enable_wake(self) -> Callable[[], None]:
+        """Set up wake(), with a socket pair the selector watches alongside the targets, returns wake."""
+        if self._wake_reader is None:
+            self._wake_reader, self._wake_writer = socket.socketpair()
+            self._wake_reader.setblocking(False)  # noqa: FBT003
+            self._wake_writer.setblocking(False)  # noqa: FBT003
+            self._selector.register(self._wake_reader, selectors.EVENT_READ, None)
+        return self.wake
+
+    def wake(self) -> None:
+        """Return from a service() wait straight away, or from the next one if it isn't waiting. Thread safe."""
+        if self._wake_writer is None:
+            return
+        with contextlib.suppress(OSError):  # Full of wakes that haven't been read yet, or closed
+            self._wake_writer.send(b"\x00")
+
+    def service(self, timeout: float = 0) -> None:
+        """Handle finished connects, frame ticks, acks and targets with room to send, waiting up to timeout for them.
+
+        A wake() also ends the wait.
+        """
+        if not self._selector.get_map():
+            time.sleep(timeout)  # Nothing to wait for, but the caller still wants to wait
+            return
+
+        for key, events in self._selector.select(timeout):
+            target = key.data
+            if target is None:  # Woken
+                with contextlib.suppress(BlockingIOError):
+                    self._wake_reader.recv(RECV_SIZE)
+                continue
+            if target.sock is not key.fileobj:
+                continue  # Disconnected by an earlier event
+            if target.connecting:
+                self._finish_connect(target)
+                continue
+            if events & selectors.EVENT_READ:
+                self._receive(target)
+            if target.connected:
+                self._flush(target)
+
+    def close(self) -> None:
+        """Close every connection."""
+        for target in self.targets:
+            self._disconnect(target)
+        self._selector.close()
+        if self._wake_reader is not None:
+            self._wake_reader.close()
+            self._wake_writer.close()
+
+    def _connect(self, target: Target) -> None:
+        """Start a non-blocking connect."""
+        target.attempts += 1
+        metric_connect_attempts.inc()
+        logger.info("Connecting to socket: %s Attempt: %s/∞", target.name, target.attempts)
+
+        try:
+            target.sock = create_socket(unix=target.port is None, options=self.socket_options)
+            target.sock.setblocking(False)  # noqa: FBT003
+            target.sock.connect(target.address if target.port is None else (target.address, target.port))
+        except BlockingIOError:  # Connecting, the selector tells us when it is done
+            target.connecting = True
+            self._watch(target)
+        except (ConnectionRefusedError, FileNotFoundError):  # Nothing listening on the port or unix socket
+            logger.error("Socket connection refused")  # noqa: TRY400 Don't want this one too noisy
+            self._retry(target)
+        except OSError:
+            logger.exception("OSError when trying to create socket")
+            self._retry(target)
+        else:
+            self._set_connected(target)
+
+    def _finish_connect(self, target: Target) -> None:
+        """The selector says a connect is done, find out if it worked."""
+        error = target.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        target.connecting = False
+        if error == 0:
+            self._set_connected(target)
+            return
+
+        if error == errno.ECONNREFUSED:
+            logger.error("Socket connection refused")
+        else:
+            logger.error("Could not connect to %s: %s", target.name, errno.errorcode.get(error, error))
+        self._retry(target)
+
+    def _set_connected(self, target: Target) -> None:
+        """Mark a target connected, and send it the on_connect frame."""
+        target.connected = True
+        target.failures = 0
+        metric_connects.inc()
+        logger.info("Connected to socket! %s", target.name)
+        frame = self.on_connect(target) if self.on_connect is not None else None
+        if frame:
+            target.queue(frame)
+            self._flush(target)
+        else:
+            self._watch(target)
+
+    def _retry(self, target: Target) -> None:
+        """Close a target and schedule its next connection attempt, backing off while it keeps failing."""
+        self._disconnect(target)
+        target.failures += 1
+        delay = backoff_delay(target.failures, self.reconnect_delay, self.reconnect_max_delay)
+        target.next_attempt = time.monotonic() + delay
+        logger.info("Trying again... in %.1fs", delay)
+
+    def _disconnect(self, target: Target) -> None:
+        """Close a target's connection."""
+        if target.sock is not None:
+            if target.events:
+                self._selector.unregister(target.sock)
+            target.sock.close()
+        target.reset()
+
+    def _watch(self, target: Target) -> None:
+        """Only have the selector watch a target while it is connecting or has data waiting, or for frame ticks."""
+        events = 0
+        if target.connecting or target.has_pending():
+            events |= selectors.EVENT_WRITE
+        if target.connected and self.on_message is not None:
+            events |= selectors.EVENT_READ
+
+        if events == target.events:
+            return
+        if not target.events:
+            self._selector.register(target.sock, events, target)
+        elif not events:
+            self._selector.unregister(target.sock)
+        else:
+            self._selector.modify(target.sock, events, target)
+        target.events = events
+
+    def _receive(self, target: Target) -> None:
+        """Read a target's frame ticks and acks and queue any replies, reconnect it if the connection is gone."""
+        try:
+            data = target.sock.recv(RECV_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:  # ConnectionResetError...
+            data = b""
+        if not data:
+            logger.error("Disconnected from socket, cringe")
+            self._retry(target)
+            return
+
+        try:
+            messages = target.decoder.feed(data)
+        except ProtocolError:
+            logger.exception("Bad message from %s", target.name)
+            self._retry(target)
+            return
+
+        for message in messages:
+            if message.magic == PULL_MAGIC:
+                target.frame_ticks += 1
+            else:
+                target.applied_frame = message.applied_frame
+            reply = self.on_message(target, message)
+            if reply:
+                target.queue(reply)
+
+    def _flush(self, target: Target) -> None:
+        """Send what a target has waiting, reconnect it if the connection is gone."""
+        try:
+            target.send_pending()
+        except OSError:  # BrokenPipeError, ConnectionResetError...
+            logger.error("Disconnected from socket, cringe")  # noqa: TRY400 Don't want this one too noisy
+            self._retry(target)
+            return
+        self._watch(target)
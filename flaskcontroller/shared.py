@@ -0,0 +1,212 @@
+"""Shared memory between the sender process and the web worker processes, for multi process deployments.
+
+In the default single process mode none of this is used. With python -m flaskcontroller.multiprocess
+one sender process owns the emulator link, and the web workers hand it their input through a ring
+buffer in a multiprocessing.shared_memory segment. The sender publishes its status into the same
+segment for the workers to serve.
+
+Segment layout:
+    Header          <4sII       magic, version, ring capacity
+    Counters        <QQQQI      head (events written), tail (events read), dropped, status sequence, status length
+    Status          STATUS_SIZE bytes of json, written by the sender under a sequence lock
+    Ring            capacity slots of <BBH32s, event kind, pressed, button mask, player id
+Workers take a file lock to write to the ring, the sender is the only reader so it doesn't need one.
+"""
+
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import struct
+import tempfile
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # Imported when a segment is created or attached, single process mode doesn't need it
+    from multiprocessing import shared_memory
+
+logger = logging.getLogger(__name__)
+
+PROCESS_SINGLE = "single"  # Everything in one process, the default
+PROCESS_SENDER = "sender"  # Owns the emulator link, reads input from the workers
+PROCESS_WORKER = "worker"  # Serves requests, writes input for the sender
+PROCESS_MODES = [PROCESS_SINGLE, PROCESS_SENDER, PROCESS_WORKER]
+
+process_mode = PROCESS_SINGLE  # Set by the multiprocess launcher before create_app()
+doorbell = None  # multiprocessing.Semaphore from the launcher, workers release it so the sender wakes up straight away
+
+EVENT_INPUT = 1
+EVENT_TOUCH = 2  # A player is still around, for the player count
+
+MAGIC = b"FCSM"
+VERSION = 1
+HEADER = struct.Struct("<4sII")
+COUNTERS = struct.Struct("<QQQQI")
+COUNTERS_OFFSET = 16
+STATUS_OFFSET = 64
+STATUS_SIZE = 16384
+RING_OFFSET = STATUS_OFFSET + STATUS_SIZE
+SLOT = struct.Struct("<BBH32s")
+MAX_ID_BYTES = 32  # Longer player ids are cut short
+STATUS_READ_TRIES = 100
+
+
+def wait_doorbell(timeout: float) -> None:
+    """In the sender, wait until a worker rings the doorbell or the timeout passes.
+
+    Workers ring once per write, and the drain that follows a wake picks up every write so far, so the
+    rings left over are taken too. Otherwise the count would keep growing and wake the sender for nothing.
+    """
+    if doorbell.acquire(timeout=timeout):
+        while doorbell.acquire(False):  # noqa: FBT003 Positional, multiprocessing and threading name it differently
+            pass
+
+
+class SharedSegmentError(Exception):
+    """Error to raise if the shared memory segment is missing or isn't ours."""
+
+
+def _lock_path(name: str) -> str:
+    """Return the path of the lock file workers take to write to the ring."""
+    return os.path.join(tempfile.gettempdir(), f"{name}.lock")
+
+
+class SharedSegment:
+    """The ring buffer and status in shared memory, see the module docstring for the layout."""
+
+    def __init__(self, shm: "shared_memory.SharedMemory", *, owner: bool) -> None:
+        """Wrap an existing segment, use create() or attach()."""
+        self._shm = shm
+        self._buf = shm.buf
+        self.name = shm.name
+        self.owner = owner
+        magic, version, self.capacity = HEADER.unpack_from(self._buf)
+        if magic != MAGIC or version != VERSION:
+            msg = f"Shared memory segment {shm.name} isn't a flaskcontroller version {VERSION} segment"
+            raise SharedSegmentError(msg)
+        self._lock_fd = os.open(_lock_path(self.name), os.O_RDWR | os.O_CREAT, 0o600)
+
+    @classmethod
+    def create(cls, name: str, capacity: int) -> "SharedSegment":
+        """Create the segment, in the sender process. A leftover segment with the same name is replaced."""
+        from multiprocessing import shared_memory
+
+        size = RING_OFFSET + capacity * SLOT.size
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            logger.warning("Replacing leftover shared memory segment: %s", name)
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+
+        HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, capacity)
+        COUNTERS.pack_into(shm.buf, COUNTERS_OFFSET, 0, 0, 0, 0, 0)
+        logger.info("Created shared memory segment: %s, ring capacity: %s", name, capacity)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedSegment":
+        """Attach to the sender's segment, in a worker process."""
+        import multiprocessing
+        from multiprocessing import resource_tracker, shared_memory
+
+        try:
+            shm = shared_memory.SharedMemory(name)
+        except FileNotFoundError as exc:
+            msg = f"No shared memory segment called {name}, is the sender process running?"
+            raise SharedSegmentError(msg) from exc
+
+        # Only the sender should remove the segment, don't let this process's resource tracker do it on exit.
+        # Processes started by multiprocessing share their parent's tracker, the sender's registration has to stay.
+        if multiprocessing.parent_process() is None:
+            with contextlib.suppress(Exception):
+                resource_tracker.unregister(shm._name, "shared_memory")  # noqa: SLF001
+
+        return cls(shm, owner=False)
+
+    def close(self) -> None:
+        """Detach, the sender also removes the segment."""
+        if self._buf is None:
+            return
+        self._buf = None
+        self._shm.close()
+        os.close(self._lock_fd)
+        if self.owner:
+            with contextlib.suppress(FileNotFoundError):
+                self._shm.unlink()
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(_lock_path(self.name))
+
+    def _counters(self) -> tuple[int, int, int, int, int]:
+        """Return (head, tail, dropped, status sequence, status length)."""
+        return COUNTERS.unpack_from(self._buf, COUNTERS_OFFSET)
+
+    def put(self, kind: int, player_id: str, mask: int = 0, pressed: bool = False) -> bool:  # noqa: FBT001, FBT002
+        """Write an event for the sender, returns False if the ring was full and the event was dropped."""
+        return self.put_many(kind, player_id, [(mask, pressed)]) == 1
+
+    def put_many(self, kind: int, player_id: str, inputs: list[tuple[int, bool]]) -> int:
+        """Write an event for each (mask, pressed) in one go, so the sender reads them all together.
+
+        Returns:
+            How many were written, the ones that didn't fit in the ring are dropped.
+        """
+        raw_id = player_id.encode(errors="replace")[:MAX_ID_BYTES]
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            head, tail, dropped, _, _ = self._counters()
+            written = min(len(inputs), self.capacity - (head - tail))
+            for index, (mask, pressed) in enumerate(inputs[:written]):
+                offset = RING_OFFSET + ((head + index) % self.capacity) * SLOT.size
+                SLOT.pack_into(self._buf, offset, kind, pressed, mask, raw_id)
+            if written < len(inputs):
+                struct.pack_into("<Q", self._buf, COUNTERS_OFFSET + 16, dropped + len(inputs) - written)
+            # Publish after the slots are written, tail belongs to the sender so it is left alone
+            struct.pack_into("<Q", self._buf, COUNTERS_OFFSET, head + written)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+        if written and doorbell is not None:
+            doorbell.release()
+        return written
+
+    def drain(self) -> list[tuple[int, str, int, bool]]:
+        """Read every waiting event, (kind, player id, mask, pressed). Only the sender calls this."""
+        head, tail, _, _, _ = self._counters()
+        events = []
+        for index in range(tail, head):
+            kind, pressed, mask, raw_id = SLOT.unpack_from(self._buf, RING_OFFSET + (index % self.capacity) * SLOT.size)
+            events.append((kind, raw_id.rstrip(b"\0").decode(errors="replace"), mask, bool(pressed)))
+        struct.pack_into("<Q", self._buf, COUNTERS_OFFSET + 8, head)  # Hand the slots back to the writers
+        return events
+
+    def write_status(self, status: dict) -> None:
+        """Publish the status for the workers. Only the sender calls this."""
+        data = json.dumps(status).encode()
+        if len(data) > STATUS_SIZE:
+            logger.warning("Status too large for shared memory (%s bytes), not published", len(data))
+            return
+
+        sequence = self._counters()[3]
+        struct.pack_into("<Q", self._buf, COUNTERS_OFFSET + 24, sequence + 1)  # Odd, readers wait
+        self._buf[STATUS_OFFSET : STATUS_OFFSET + len(data)] = data
+        struct.pack_into("<I", self._buf, COUNTERS_OFFSET + 32, len(data))
+        struct.pack_into("<Q", self._buf, COUNTERS_OFFSET + 24, sequence + 2)  # Even, done
+
+    def read_status(self) -> dict | None:
+        """Return the status the sender last published, None if it hasn't yet."""
+        for _ in range(STATUS_READ_TRIES):
+            _, _, _, sequence, length = self._counters()
+            if sequence % 2:
+                continue  # Sender is part way through writing
+            data = bytes(self._buf[STATUS_OFFSET : STATUS_OFFSET + length])
+            if self._counters()[3] == sequence:
+                return json.loads(data) if sequence else None
+        return None
+
+    def get_stats(self) -> dict:
+        """Return the ring counters."""
+        head, tail, dropped, _, _ = self._counters()
+        return {"depth": head - tail, "capacity": self.capacity, "enqueued": head, "dropped": dropped}
@@ -16,55 +16,93 @@ var inputdict = {
     39: ["GBA_RIGHT", false],
 };
 
+function showLatency(t0, t1) {
+    var frames = ((t1 - t0) * (1 / 60)).toFixed();
+
+    if (frames < 1) {
+        document.getElementById("HTTP_LATENCY").innerHTML = `＜1 frame`;
+        document.getElementById("HTTP_LATENCY").style.color = "#CCFFCC";
+    } else if (frames == 1) {
+        document.getElementById("HTTP_LATENCY").innerHTML = `　${frames} frame`;
+        document.getElementById("HTTP_LATENCY").style.color = "#CCFFCC";
+    } else if (frames < 4) {
+        document.getElementById("HTTP_LATENCY").innerHTML = `　${frames} frames`;
+        document.getElementById("HTTP_LATENCY").style.color = "#CCFFCC";
+    } else if (frames < 10) {
+        document.getElementById("HTTP_LATENCY").innerHTML = `　${frames} frames`;
+        document.getElementById("HTTP_LATENCY").style.color = "#FFCCCC";
+    } else {
+        document.getElementById("HTTP_LATENCY").innerHTML = `${frames} frames`;
+        document.getElementById("HTTP_LATENCY").style.color = "#FFCCCC";
+    }
+}
+
 function postkey(key, updown) {
     var t0;
-    var t1;
-    var frames;
 
     key = updown + inputdict[key][0];
 
     t0 = performance.now();
 
+    // Use the websocket if we have one, it saves a whole HTTP request per input
+    if (inputsocket && inputsocket.readyState == WebSocket.OPEN) {
+        inputsocketsent.push(t0);
+        inputsocket.send(key);
+        return;
+    }
+
+    // Send everything pressed within one animation frame in one request
+    if (coalesceinputs) {
+        if (pendinginputs.length == 0) {
+            window.requestAnimationFrame(postkeys);
+        }
+        pendinginputs.push(key);
+        return;
+    }
+
     fetch(`input/${key}`, {
         method: "POST",
         headers: {
             "client-id": clientid,
         },
     })
-        .then((response) => {
-            console.log("Sent:", key, "| Response code:", response.status);
-            if (response.status == "200") {
-                t1 = performance.now();
-                frames = ((t1 - t0) * (1 / 60)).toFixed();
-
-                if (frames < 1) {
-                    document.getElementById("HTTP_LATENCY").innerHTML = `＜1 frame`;
-                    document.getElementById("HTTP_LATENCY").style.color = "#CCFFCC";
-                } else if (frames == 1) {
-                    document.getElementById("HTTP_LATENCY").innerHTML = `　${frames} frame`;
-                    document.getElementById("HTTP_LATENCY").style.color = "#CCFFCC";
-                } else if (frames < 4) {
-                    document.getElementById("HTTP_LATENCY").innerHTML = `　${frames} frames`;
-                    document.getElementById("HTTP_LATENCY").style.color = "#CCFFCC";
-                } else if (frames < 10) {
-                    document.getElementById("HTTP_LATENCY").innerHTML = `　${frames} frames`;
-                    document.getElementById("HTTP_LATENCY").style.color = "#FFCCCC";
-                } else {
-                    document.getElementById("HTTP_LATENCY").innerHTML = `${frames} frames`;
-                    document.getElementById("HTTP_LATENCY").style.color = "#FFCCCC";
-                }
-            } else {
-                document.getElementById("HTTP_LATENCY").style.color = "#FFCCCC";
-                document.getElementById("HTTP_LATENCY").innerHTML = "Something is wrong";
-            }
-        })
-        .catch((error) => {
-            console.error("Could not ProcessUserInput to webserver: ", error);
-            document.getElementById("HTTP_LATENCY").style.color = "#FFCCCC";
-            document.getElementById("HTTP_LATENCY").innerHTML = "Cannot reach webserver";
-            document.getElementById("FLASK_MGBA_STATS").innerHTML = `???`;
-            document.getElementById("FLASK_MGBA_STATS").style.color = "#C8C8C8";
-        });
+        .then((response) => inputResponse(key, t0, response))
+        .catch(inputFailed);
+}
+
+function postkeys() {
+    var keys = pendinginputs;
+    var t0 = performance.now();
+    pendinginputs = [];
+
+    fetch("inputs", {
+        method: "POST",
+        headers: {
+            "client-id": clientid,
+            "Content-Type": "application/json",
+        },
+        body: JSON.stringify(keys),
+    })
+        .then((response) => inputResponse(keys, t0, response))
+        .catch(inputFailed);
+}
+
+function inputResponse(key, t0, response) {
+    console.log("Sent:", key, "| Response code:", response.status);
+    if (response.status == "200") {
+        showLatency(t0, performance.now());
+    } else {
+        document.getElementById("HTTP_LATENCY").style.color = "#FFCCCC";
+        document.getElementById("HTTP_LATENCY").innerHTML = "Something is wrong";
+    }
+}
+
+function inputFailed(error) {
+    console.error("Could not ProcessUserInput to webserver: ", error);
+    document.getElementById("HTTP_LATENCY").style.color = "#FFCCCC";
+    document.getElementById("HTTP_LATENCY").innerHTML = "Cannot reach webserver";
+    document.getElementById("FLASK_MGBA_STATS").innerHTML = `???`;
+    document.getElementById("FLASK_MGBA_STATS").style.color = "#C8C8C8";
 }
 
 // Get Keypress
@@ -111,7 +149,26 @@ function makeid() {
     return result;
 }
 
+function showStatus(data) {
+    if (data.sock_connected) {
+        document.getElementById("FLASK_MGBA_STATS").innerHTML = `Connected`;
+        document.getElementById("FLASK_MGBA_STATS").style.color = "#CCFFCC";
+    } else {
+        document.getElementById("FLASK_MGBA_STATS").innerHTML = `Disconnected`;
+        document.getElementById("FLASK_MGBA_STATS").style.color = "#FFCCCC";
+    }
+    document.getElementById("PLAYER_COUNT").innerHTML = `${data.players_connected}`;
+}
+
 function getUpdate() {
+    // The websocket or the status stream push status to us, no need to poll
+    if (inputsocket && inputsocket.readyState == WebSocket.OPEN) {
+        return;
+    }
+    if (statusstream && statusstream.readyState == EventSource.OPEN) {
+        return;
+    }
+
     fetch("GetStatus", {
         method: "GET",
         headers: {
@@ -127,14 +184,7 @@ function getUpdate() {
         .then((data) => {
             // Do something with the data
             // console.log(data)
-            if (data.sock_connected) {
-                document.getElementById("FLASK_MGBA_STATS").innerHTML = `Connected`;
-                document.getElementById("FLASK_MGBA_STATS").style.color = "#CCFFCC";
-            } else {
-                document.getElementById("FLASK_MGBA_STATS").innerHTML = `Disconnected`;
-                document.getElementById("FLASK_MGBA_STATS").style.color = "#FFCCCC";
-            }
-            document.getElementById("PLAYER_COUNT").innerHTML = `${data.players_connected}`;
+            showStatus(data);
         })
         .catch((error) => {
             console.error("Could not GetStatus from webserver: ", error);
@@ -146,10 +196,79 @@ function getUpdate() {
         });
 }
 
+function connectStatusStream() {
+    if (document.body.dataset.statusStream != "1") {
+        return; // Not enabled on the server, keep polling
+    }
+    if (!window.EventSource) {
+        return; // Old browser, keep polling
+    }
+
+    statusstream = new EventSource(`status/stream?client-id=${encodeURIComponent(clientid)}`);
+    statusstream.addEventListener("status", function (event) {
+        showStatus(JSON.parse(event.data));
+    });
+    statusstream.onerror = function () {
+        // EventSource retries by itself if the connection drops, it gives up if the server turned us away (e.g. full)
+        if (statusstream.readyState == EventSource.CLOSED) {
+            console.log("Status stream unavailable, polling until it reconnects");
+            statusstream = null;
+            setTimeout(connectStatusStream, 60000);
+        }
+    };
+}
+
+// ### WEBSOCKET ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ###
+
+function connectWebSocket() {
+    var port = document.body.dataset.websocketPort;
+    if (!port || port == "0") {
+        connectStatusStream(); // Not enabled on the server, stick to HTTP, with the status stream if that is on
+        return;
+    }
+
+    var scheme = location.protocol == "https:" ? "wss" : "ws";
+    inputsocket = new WebSocket(`${scheme}://${location.hostname}:${port}/ws?client-id=${encodeURIComponent(clientid)}`);
+    inputsocketsent = [];
+
+    inputsocket.onmessage = function (event) {
+        var data = JSON.parse(event.data);
+        if (data.type == "ack") {
+            // Acks come back in the order the inputs were sent
+            var t0 = inputsocketsent.shift();
+            console.log("Sent:", data.input, "| Response code:", data.status);
+            if (data.status == 200 && t0 !== undefined) {
+                showLatency(t0, performance.now());
+            }
+        } else if (data.type == "status") {
+            showStatus(data);
+        }
+    };
+
+    inputsocket.onclose = function () {
+        console.log("Websocket closed, using HTTP until it reconnects");
+        inputsocket = null;
+        setTimeout(connectWebSocket, 5000);
+    };
+}
+
 function customid() {
     clientid = prompt("Enter six character username:");
+    if (inputsocket) {
+        inputsocket.close(); // Reconnects with the new id
+    }
+    if (statusstream) {
+        statusstream.close();
+        connectStatusStream();
+    }
 }
 
 var clientid = makeid(); // This should be a const but its fun to let players use the js console to set their names
+var inputsocket = null;
+var inputsocketsent = []; // Send times of inputs waiting for an ack
+var coalesceinputs = new URLSearchParams(window.location.search).has("coalesce"); // Open the page with ?coalesce
+var pendinginputs = []; // Inputs waiting for the next animation frame when coalescing
+var statusstream = null;
 setInterval(getUpdate, 5000);
 getUpdate();
+window.addEventListener("load", connectWebSocket);
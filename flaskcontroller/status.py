@@ -0,0 +1,93 @@
+"""Server-Sent Events status stream, so viewers are told when the status changes instead of polling for it."""
+
+import json
+import logging
+import threading
+import time
+from collections.abc import Callable
+
+logger = logging.getLogger(__name__)
+
+STATUS_INTERVAL = 0.5  # Seconds between checking if the status has changed
+HEARTBEAT_INTERVAL = 5  # Seconds between heartbeats, less than the player timeout since they keep viewers counted
+SSE_HEARTBEAT = b": heartbeat\n\n"  # A comment line, EventSource ignores it but it keeps proxies from timing out
+
+
+def format_event(event: str, data: str) -> bytes:
+    """Format a Server-Sent Event."""
+    return f"event: {event}\ndata: {data}\n\n".encode()
+
+
+class StatusBroadcaster:
+    """Shares the latest status event between every stream.
+
+    There is no thread of its own, whichever stream wakes up first checks the status (at most once per
+    interval), and if the connection state or player count changed it serialises the event once and
+    wakes every other stream to send it.
+    """
+
+    def __init__(self, status_getter: Callable[[], dict], max_clients: int, interval: float = STATUS_INTERVAL) -> None:
+        """Create the broadcaster.
+
+        Args:
+            status_getter: Returns the status dictionary.
+            max_clients: Most streams at once, each one holds a web server thread for as long as it is open.
+            interval: Seconds between checking if the status has changed.
+        """
+        self._status_getter = status_getter
+        self.max_clients = max_clients
+        self.interval = interval
+        self.clients = 0
+        self.version = 0  # Goes up by one every time the status changes
+        self._event = b""
+        self._status_key = None
+        self._last_check = None
+        self._changed = threading.Condition()
+
+    def subscribe(self) -> bool:
+        """Take a stream slot, returns False if they are all in use."""
+        with self._changed:
+            if self.clients >= self.max_clients:
+                return False
+            self.clients += 1
+            return True
+
+    def unsubscribe(self) -> None:
+        """Give a stream slot back."""
+        with self._changed:
+            self.clients -= 1
+
+    def _refresh(self) -> None:
+        """Check the status if it is time to, the lock must be held."""
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.interval:
+            return
+        self._last_check = now
+
+        status = self._status_getter()
+        status_key = (status["sock_connected"], status["players_connected"])
+        if status_key == self._status_key:
+            return
+
+        self._status_key = status_key
+        self._event = format_event("status", json.dumps(status))  # Serialised once for everyone
+        self.version += 1
+        self._changed.notify_all()
+
+    def wait(self, version: int, timeout: float = HEARTBEAT_INTERVAL) -> tuple[int, bytes]:
+        """Wait for a status newer than version.
+
+        Returns:
+            The new version and its event, or the same version and b"" if nothing changed before the timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                self._refresh()
+                if self.version != version:
+                    return self.version, self._event
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return version, b""
+                self._changed.wait(min(remaining, self.interval))
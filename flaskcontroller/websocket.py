@@ -0,0 +1,372 @@
+"""Optional WebSocket input channel, one persistent connection per player instead of a POST per key.
+
+Flask/waitress are WSGI so they can't hold a WebSocket open, instead this runs a small asyncio server
+(RFC 6455, standard library only) on its own port and thread next to the controller blueprint.
+
+Browsers connect to ws://<host>:<websocket_port>/ws?client-id=<id> and send the same inputs as /input,
+e.g. "D_GBA_A", one per text message, each costing a token from the same rate limits as a request to /input.
+Each input is acked, and status is pushed when it changes:
+    {"type": "ack", "input": "D_GBA_A", "message": "VALID KEYPRESS", "status": 200}
+    {"type": "status", "sock_connected": true, "players_connected": 3, ...}
+"""
+
+import asyncio
+import base64
+import contextlib
+import hashlib
+import json
+import logging
+import struct
+import threading
+from collections.abc import Callable
+from urllib.parse import parse_qs, urlsplit
+
+from flask import current_app
+
+from . import controller, shared
+
+logger = logging.getLogger(__name__)
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"  # From RFC 6455, used to build Sec-WebSocket-Accept
+WS_PATH = "/ws"
+MAX_MESSAGE_SIZE = 4096  # Inputs are tiny, anything bigger is someone being silly
+STATUS_INTERVAL = 1  # Seconds between checking if the status has changed
+STATUS_SEND_TIMEOUT = 1  # Seconds a client gets to take a status push before it is disconnected
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# Close codes, from RFC 6455
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_INVALID_DATA = 1007  # e.g. a text message that isn't UTF-8
+CLOSE_TOO_BIG = 1009
+
+websocket_server = None  # The running server, if enabled
+
+
+class WebSocketError(Exception):
+    """Error to raise if a client breaks the WebSocket protocol, close_code is what to close the connection with."""
+
+    def __init__(self, msg: str, close_code: int = CLOSE_PROTOCOL_ERROR) -> None:
+        """Init."""
+        super().__init__(msg)
+        self.close_code = close_code
+
+
+def accept_key(key: str) -> str:
+    """Build the Sec-WebSocket-Accept header value from the client's Sec-WebSocket-Key."""
+    digest = hashlib.sha1((key + WS_GUID).encode(), usedforsecurity=False).digest()
+    return base64.b64encode(digest).decode()
+
+
+def encode_frame(opcode: int, payload: bytes) -> bytes:
+    """Encode a single unmasked (server to client) frame."""
+    length = len(payload)
+    if length < 126:  # noqa: PLR2004 Lengths are encoded differently depending on size
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 2**16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def unmask(payload: bytes, mask: bytes) -> bytes:
+    """Unmask a client frame payload, XORs the whole thing at once as big integers."""
+    length = len(payload)
+    full_mask = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(full_mask, "big")).to_bytes(length, "big")
+
+
+class WebSocketConnection:
+    """A single client connection, after the handshake."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, client_id: str) -> None:
+        """Init."""
+        self.reader = reader
+        self.writer = writer
+        self.client_id = client_id
+
+    async def _read_frame(self) -> tuple[bool, int, bytes]:
+        """Read one frame, returns (fin, opcode, payload)."""
+        first, second = await self.reader.readexactly(2)
+        fin = bool(first & 0x80)
+        opcode = first & 0x0F
+        length = second & 0x7F
+
+        if length == 126:  # noqa: PLR2004
+            (length,) = struct.unpack("!H", await self.reader.readexactly(2))
+        elif length == 127:  # noqa: PLR2004
+            (length,) = struct.unpack("!Q", await self.reader.readexactly(8))
+
+        if length > MAX_MESSAGE_SIZE:
+            msg = f"Message too large: {length} bytes"
+            raise WebSocketError(msg, CLOSE_TOO_BIG)
+
+        if not second & 0x80:
+            msg = "Client frames must be masked"
+            raise WebSocketError(msg)
+
+        mask = await self.reader.readexactly(4)
+        payload = unmask(await self.reader.readexactly(length), mask)
+        return fin, opcode, payload
+
+    async def recv(self) -> str | bytes | None:
+        """Receive a whole message, answering pings along the way. Returns None when the client closes."""
+        message = b""
+        message_opcode = None
+        while True:
+            fin, opcode, payload = await self._read_frame()
+
+            if opcode == OP_CLOSE:
+                await self.send(OP_CLOSE, payload[:2])
+                return None
+            if opcode == OP_PING:
+                await self.send(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+
+            if opcode != OP_CONTINUATION:
+                message_opcode = opcode
+            message += payload
+            if len(message) > MAX_MESSAGE_SIZE:
+                msg = f"Message too large: {len(message)} bytes"
+                raise WebSocketError(msg, CLOSE_TOO_BIG)
+
+            if fin:
+                return self._decode(message) if message_opcode == OP_TEXT else message
+
+    def _decode(self, message: bytes) -> str:
+        """Decode a text message, raises WebSocketError if it isn't UTF-8 like RFC 6455 says it must be."""
+        try:
+            return message.decode()
+        except UnicodeDecodeError as exc:
+            msg = f"Text message isn't UTF-8: {exc}"
+            raise WebSocketError(msg, CLOSE_INVALID_DATA) from exc
+
+    async def send(self, opcode: int, payload: bytes) -> None:
+        """Send a frame."""
+        self.writer.write(encode_frame(opcode, payload))
+        await self.writer.drain()
+
+    async def send_text(self, text: str) -> None:
+        """Send a text message."""
+        await self.send(OP_TEXT, text.encode())
+
+
+async def handshake(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> str | None:
+    """Do the HTTP upgrade handshake, returns the client id or None if the request was rejected."""
+    request = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+    request_line, *header_lines = request.split("\r\n")
+
+    headers = {}
+    for line in header_lines:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        method, target, _ = request_line.split(" ")
+    except ValueError:
+        method, target = "", ""
+
+    url = urlsplit(target)
+    client_id = parse_qs(url.query).get("client-id", [None])[0]
+
+    if (
+        method != "GET"
+        or url.path != WS_PATH
+        or headers.get("upgrade", "").lower() != "websocket"
+        or "sec-websocket-key" not in headers
+        or not client_id
+    ):
+        writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+        return None
+
+    writer.write(
+        b"HTTP/1.1 101 Switching Protocols\r\n"
+        b"Upgrade: websocket\r\n"
+        b"Connection: Upgrade\r\n"
+        b"Sec-WebSocket-Accept: " + accept_key(headers["sec-websocket-key"]).encode() + b"\r\n\r\n"
+    )
+    await writer.drain()
+    return client_id
+
+
+class WebSocketServer:
+    """Asyncio WebSocket server running in its own thread."""
+
+    def __init__(
+        self,
+        address: str,
+        port: int,
+        input_handler: Callable[[str, str, str], tuple[str, int]],
+        status_getter: Callable[[], dict],
+        player_toucher: Callable[[str], None],
+    ) -> None:
+        """Create the server, doesn't start it.
+
+        Args:
+            address: Address to listen on.
+            port: Port to listen on, 0 picks a free one.
+            input_handler: Called with (input, client_id, remote address) for every input, returns (message, HTTP
+                status). It is the one to enforce rate limits, the HTTP ones don't see the websocket.
+            status_getter: Returns the status dictionary to push to clients.
+            player_toucher: Called with the client id to keep connected players counted.
+        """
+        self.address = address
+        self.port = port
+        self._input_handler = input_handler
+        self._status_getter = status_getter
+        self._player_toucher = player_toucher
+        self._connections = set()
+        self._last_status = None
+        self._loop = None
+        self._stop = None
+        self._ready = threading.Event()
+
+    def start(self) -> None:
+        """Start serving in a background thread, returns once the server is listening."""
+        thread = threading.Thread(target=self._run, daemon=True, name="websocket_server")
+        thread.start()
+        self._ready.wait()
+
+    def stop(self) -> None:
+        """Stop the server from any thread."""
+        if self._loop and self._stop:
+            with contextlib.suppress(RuntimeError):  # Loop already closed, nothing to stop
+                self._loop.call_soon_threadsafe(self._stop.set)
+
+    def _run(self) -> None:
+        """Thread entry point."""
+        try:
+            asyncio.run(self._serve())
+        except OSError:
+            logger.exception("Could not start websocket server on %s:%s", self.address, self.port)
+        finally:
+            self._ready.set()  # Don't leave start() waiting if we failed
+
+    async def _serve(self) -> None:
+        """Listen, push status, and wait to be stopped."""
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+
+        server = await asyncio.start_server(self._handle_client, self.address, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        logger.info("Websocket server listening on %s:%s", self.address, self.port)
+        self._ready.set()
+
+        status_task = asyncio.create_task(self._status_loop())
+        async with server:
+            await self._stop.wait()
+
+        status_task.cancel()
+        logger.info("Websocket server stopped")
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Handle a client from handshake to close."""
+        connection = None
+        try:
+            client_id = await handshake(reader, writer)
+            if client_id is None:
+                return
+
+            connection = WebSocketConnection(reader, writer, client_id)
+            address = (writer.get_extra_info("peername") or ("",))[0]
+            self._connections.add(connection)
+            self._player_toucher(client_id)
+            await connection.send_text(self._status_message(self._status_getter()))
+
+            while (da_input := await connection.recv()) is not None:
+                if isinstance(da_input, bytes):
+                    da_input = da_input.decode(errors="replace")
+                message, status = self._input_handler(da_input, client_id, address)
+                ack = {"type": "ack", "input": da_input, "message": message, "status": int(status)}
+                await connection.send_text(json.dumps(ack))
+
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass  # Client went away, nothing to tell them
+        except WebSocketError as exc:
+            logger.warning("Websocket client error: %s", exc)
+            with contextlib.suppress(ConnectionError):  # Tell them why, if they are still listening
+                await connection.send(OP_CLOSE, struct.pack("!H", exc.close_code))
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    def _status_message(self, status: dict) -> str:
+        """Serialise a status push."""
+        return json.dumps({"type": "status", **status})
+
+    async def _status_loop(self) -> None:
+        """Keep connected players counted, push the status to everyone when it changes."""
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL)
+
+            for connection in list(self._connections):
+                self._player_toucher(connection.client_id)
+
+            status = self._status_getter()
+            status_key = (status["sock_connected"], status["players_connected"])
+            if status_key == self._last_status:
+                continue
+            self._last_status = status_key
+
+            await self._broadcast(self._status_message(status))  # Serialised once for everyone
+
+    async def _broadcast(self, message: str) -> None:
+        """Send a message to every client at once, so a slow one doesn't hold up the rest."""
+        await asyncio.gather(*(self._send_status(connection, message) for connection in list(self._connections)))
+
+    async def _send_status(self, connection: WebSocketConnection, message: str) -> None:
+        """Send a status push to one client, disconnecting them if they don't take it within STATUS_SEND_TIMEOUT."""
+        try:
+            await asyncio.wait_for(connection.send_text(message), STATUS_SEND_TIMEOUT)
+        except ConnectionError:
+            pass  # Going away, _handle_client() tidies up
+        except asyncio.TimeoutError:  # noqa: UP041 Not the builtin one until Python 3.11
+            logger.warning("Websocket client %s isn't reading, disconnecting", connection.client_id)
+            connection.writer.close()
+
+
+def get_websocket_port() -> int:
+    """Return the port the websocket server is listening on, 0 if it isn't running."""
+    if websocket_server:
+        return websocket_server.port
+
+    # Web workers don't run the websocket server, the sender process does
+    app_conf = current_app.config["app"]
+    if shared.process_mode == shared.PROCESS_WORKER and app_conf["websocket_enabled"]:
+        return int(app_conf["websocket_port"])
+
+    return 0
+
+
+def start_websocket_server() -> None:
+    """Start the websocket server if it is enabled in the config, needs the app context."""
+    global websocket_server  # noqa: PLW0603 Same pattern as the socket sender.
+
+    if websocket_server:  # Only one per process, the port is shared
+        websocket_server.stop()
+        websocket_server = None
+
+    app_conf = current_app.config["app"]
+    if not app_conf["websocket_enabled"] or shared.process_mode == shared.PROCESS_WORKER:
+        return
+
+    websocket_server = WebSocketServer(
+        address=app_conf["websocket_address"],
+        port=int(app_conf["websocket_port"]),
+        input_handler=controller.handle_websocket_input,
+        status_getter=controller.get_status_dict,
+        player_toucher=controller.touch_player,
+    )
+    websocket_server.start()
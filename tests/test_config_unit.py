@@ -1,5 +1,6 @@
 """Unit testing for the config module."""
 
+import logging
 import os
 
 import pytest
@@ -128,3 +129,127 @@ def test_config_dictionary_not_in_schema(tmp_path, caplog: pytest.LogCaptureFixt
     conf._warn_unexpected_keys(DEFAULT_CONFIG, test_config, "<root>")
     assert "Config entry key <root>[TEST_CONFIG_ROOT_ENTRY_NOT_IN_SCHEMA] not in schema" in caplog.text
     assert "Config entry key [app][TEST_CONFIG_APP_ENTRY_NOT_IN_SCHEMA] not in schema" in caplog.text
+
+
+def test_config_app_validation(tmp_path, get_test_config):
+    """TEST: Invalid [app] settings fail validation."""
+    from flaskcontroller.config import ConfigValidationError
+
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["input_queue_overflow"] = "INVALID"
+    test_config["app"]["input_queue_size"] = 0
+    test_config["app"]["tick_rate"] = 0
+    test_config["app"]["protocol_version"] = 3
+    test_config["app"]["merge_mode"] = "INVALID"
+    test_config["app"]["status_stream_clients"] = -1
+    test_config["app"]["targets"] = ["127.0.0.1:5001", "nope"]
+    test_config["app"]["reconnect_delay"] = 5
+    test_config["app"]["reconnect_max_delay"] = 1
+    test_config["app"]["input_ttl"] = -1
+    test_config["app"]["socket_keepalive_count"] = 0
+    test_config["app"]["socket_sndbuf"] = -1
+    test_config["rate_limit"] = {"client_rate": -1, "address_rate": 10, "address_burst": 0}
+
+    with pytest.raises(ConfigValidationError) as exc_info:
+        flaskcontroller.config.FlaskControllerConfig(instance_path=tmp_path, config=test_config)
+
+    assert "input_queue_overflow" in str(exc_info.value)
+    assert "input_queue_size" in str(exc_info.value)
+    assert "tick_rate" in str(exc_info.value)
+    assert "protocol_version" in str(exc_info.value)
+    assert "merge_mode" in str(exc_info.value)
+    assert "status_stream_clients" in str(exc_info.value)
+    assert "invalid target: nope" in str(exc_info.value)
+    assert "reconnect_max_delay" in str(exc_info.value)
+    assert "input_ttl" in str(exc_info.value)
+    assert "socket_keepalive_count" in str(exc_info.value)
+    assert "socket_sndbuf" in str(exc_info.value)
+    assert "['rate_limit']['client_rate']" in str(exc_info.value)
+    assert "['rate_limit']['address_burst']" in str(exc_info.value)
+
+
+def test_config_send_validation(tmp_path, get_test_config):
+    """TEST: Latency acks need states with a sequence number, version 2 or pull mode."""
+    from flaskcontroller.config import ConfigValidationError
+
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["latency_acks"] = True
+    with pytest.raises(ConfigValidationError, match="latency_acks"):
+        flaskcontroller.config.FlaskControllerConfig(instance_path=tmp_path, config=test_config)
+
+    for app_conf in [{"protocol_version": 2}, {"send_mode": "pull"}]:
+        test_config = get_test_config("testing_true_valid.toml")
+        test_config["app"].update({"latency_acks": True, **app_conf})
+        flaskcontroller.config.FlaskControllerConfig(instance_path=tmp_path, config=test_config)
+
+    # TEST: Only push and pull
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["send_mode"] = "INVALID"
+    with pytest.raises(ConfigValidationError, match="send_mode"):
+        flaskcontroller.config.FlaskControllerConfig(instance_path=tmp_path, config=test_config)
+
+
+def test_config_write_only_when_changed(tmp_path, mocker: pytest_mock.plugin.MockerFixture):
+    """TEST: Missing keys are written once, keeping the file's comments, an unchanged config isn't written again."""
+    tmp_f = tmp_path / "config.toml"
+    tmp_f.write_text("# My comment\n[app]\ntick_rate = 60 # Matches my game\n\n[app.testing]\ndont_run_socket = true\n")
+
+    conf = flaskcontroller.config.FlaskControllerConfig(instance_path=tmp_path)
+    assert conf["app"]["tick_rate"] == 60  # noqa: PLR2004
+    contents = tmp_f.read_text()
+    assert "# My comment" in contents
+    assert "tick_rate = 60 # Matches my game" in contents
+    assert "[rate_limit]" in contents  # Defaults were added
+
+    # TEST: Loading it again neither writes nor parses it again
+    mtime = tmp_f.stat().st_mtime_ns
+    flaskcontroller.config.FlaskControllerConfig(instance_path=tmp_path)
+    parse = mocker.spy(flaskcontroller.config.tomlkit, "parse")
+    conf = flaskcontroller.config.FlaskControllerConfig(instance_path=tmp_path)
+    assert tmp_f.stat().st_mtime_ns == mtime
+    assert parse.call_count == 0
+
+    # TEST: The cached config is a copy, changing one doesn't change the next
+    conf["app"]["tick_rate"] = 1
+    assert flaskcontroller.config.FlaskControllerConfig(instance_path=tmp_path)["app"]["tick_rate"] == 60  # noqa: PLR2004
+
+    # TEST: A changed file is parsed again
+    tmp_f.write_text(contents.replace("tick_rate = 60", "tick_rate = 30"))
+    assert flaskcontroller.config.FlaskControllerConfig(instance_path=tmp_path)["app"]["tick_rate"] == 30  # noqa: PLR2004
+    assert parse.call_count == 1
+
+
+def test_config_watcher(tmp_path, caplog: pytest.LogCaptureFixture):
+    """TEST: The watcher loads a changed config, but not an unchanged or invalid one."""
+    from flaskcontroller.config import ConfigWatcher
+
+    caplog.set_level(logging.INFO)
+    tmp_f = tmp_path / "config.toml"
+    tmp_f.write_text("[app]\ntick_rate = 60\n\n[app.testing]\ndont_run_socket = true\n")
+    watcher = ConfigWatcher(instance_path=tmp_path)
+    assert watcher.latest[0] == 0
+    assert not watcher.poll()
+
+    # TEST: Saved without changes, nothing to apply
+    os.utime(tmp_f, ns=(0, 0))
+    assert not watcher.poll()
+    assert watcher.latest[0] == 0
+
+    # TEST: An invalid config is logged and ignored
+    contents = tmp_f.read_text()
+    tmp_f.write_text(contents.replace("tick_rate = 60", "tick_rate = 0"))
+    assert not watcher.poll()
+    assert "can't be loaded, keeping the running config" in caplog.text
+    tmp_f.write_text(contents.replace("tick_rate = 60", "tick_rate = [oops"))
+    assert not watcher.poll()
+
+    # TEST: A valid change is loaded, the keys that need a restart are logged
+    tmp_f.write_text(
+        contents.replace("tick_rate = 60", "tick_rate = 30").replace("max_players = 10000", "max_players = 5")
+    )
+    assert watcher.poll()
+    version, config = watcher.latest
+    assert version == 1
+    assert config["app"]["tick_rate"] == 30  # noqa: PLR2004
+    assert "Config changed, applying: ['app']['tick_rate']" in caplog.text
+    assert "Config changed, restart to apply: ['app']['max_players']" in caplog.text
@@ -29,7 +29,7 @@ def stop_run_thread(seconds=1.5):
     controller._run_thread = False
 
 
-def test_os_error(monkeypatch, caplog):
+def test_os_error(app, monkeypatch, caplog):
     """Test OSError on Socket creation."""
 
     def socket_fail(*args, **kwargs) -> None:
@@ -43,7 +43,7 @@ def test_os_error(monkeypatch, caplog):
     thread = threading.Thread(target=stop_run_thread)
     thread.start()
 
-    controller.socket_sender({})
+    controller.socket_sender({"app": {"socket_address": "127.0.0.1", "socket_port": "9999", "tick_rate": 120}})
 
     thread.join()
 
@@ -72,6 +72,12 @@ class MockSocketConnectionRefusedError:
     def setsockopt(self, *args, **kwargs):
         """Mocked."""
 
+    def setblocking(self, *args, **kwargs):
+        """Mocked."""
+
+    def close(self):
+        """Mocked."""
+
     def connect(self, *args, **kwargs):
         """Mocked Exception."""
         raise ConnectionRefusedError
@@ -124,6 +130,16 @@ class MockSocketBrokenPipeError:
     def connect(self, *args, **kwargs):
         """Mocked."""
 
+    def setblocking(self, *args, **kwargs):
+        """Mocked."""
+
+    def close(self):
+        """Mocked."""
+
+    def send(self, *args, **kwargs):
+        """Mocked Error."""
+        raise BrokenPipeError
+
     def sendall(self, *args, **kwargs):
         """Mocked Error."""
         raise BrokenPipeError
@@ -156,3 +172,199 @@ def test_connection_broken_pipe_error(tmp_path, get_test_config, mocker, caplog)
     # TEST: Script continues
     with caplog.at_level(logging.INFO):
         assert "Attempt: 2/∞" in caplog.text
+
+
+def test_encode_pending_input(monkeypatch):
+    """TEST: The merged input is sent once per tick, framed when using protocol version 2."""
+    from flaskcontroller.input_queue import InputQueue
+    from flaskcontroller.players import PlayerInputTable
+    from flaskcontroller.protocol import PROTOCOL_V1, PROTOCOL_V2, FrameDecoder, FrameEncoder
+
+    monkeypatch.setattr(controller, "fw_controller", controller.FlaskWebController())
+    monkeypatch.setattr(controller, "input_queue", InputQueue())
+    monkeypatch.setattr(controller, "players", PlayerInputTable())
+    for player_id, mask in [("A", 1), ("B", 2), ("B", 8)]:
+        controller.input_queue.append(controller.players.apply(player_id, mask, pressed=True))
+
+    # TEST: Version 1
+    assert controller.encode_pending_input() == b"\x0b\x00"
+    assert not controller.input_queue
+    assert controller.fw_controller.get_current_input() == 11  # noqa: PLR2004
+
+    # TEST: Version 2
+    monkeypatch.setattr(controller, "protocol_version", PROTOCOL_V2)
+    monkeypatch.setattr(controller, "frame_encoder", FrameEncoder())
+    controller.release_players(["B"])
+    frames = FrameDecoder().feed(controller.encode_pending_input())
+    assert frames[0].states == [1]
+
+    # TEST: A press and release in the same tick are both sent, in one frame
+    for pressed in [True, False]:
+        controller.input_queue.append(controller.players.apply("B", 2, pressed=pressed))
+    frames = FrameDecoder().feed(controller.encode_pending_input())
+    assert frames[0].states == [3, 1]
+
+    # TEST: And back to back in version 1
+    monkeypatch.setattr(controller, "protocol_version", PROTOCOL_V1)
+    for pressed in [True, False]:
+        controller.input_queue.append(controller.players.apply("B", 2, pressed=pressed))
+    assert controller.encode_pending_input() == b"\x03\x00\x01\x00"
+
+
+def test_player_table_full(client, monkeypatch):
+    """TEST: Input from a player that doesn't fit in the player table is refused."""
+    from http import HTTPStatus
+
+    from flaskcontroller.players import PlayerInputTable
+
+    monkeypatch.setattr(controller, "players", PlayerInputTable(max_players=0))
+
+    response = client.post("/input/D_GBA_A", headers={"client-id": "TEST"})
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+
+def test_input_table():
+    """TEST: Every button has a down and an up input that decodes to its button code."""
+    assert len(controller.INPUT_TABLE) == 2 * len(controller.BUTTON_CODES)
+    assert controller.INPUT_TABLE["D_GBA_A"] == (1, True)
+    assert controller.INPUT_TABLE["U_GBA_L"] == (512, False)
+
+
+def test_input_debug_logging(client, caplog):
+    """TEST: Inputs are logged at debug level when it is enabled."""
+    with caplog.at_level(logging.DEBUG, logger=controller.logger.name):
+        client.post("/input/D_GBA_L", headers={"client-id": "TEST"})
+        client.post("/input/U_GBA_L", headers={"client-id": "TEST"})
+
+    assert "Input! Down: GBA_L 1000000000" in caplog.text
+    assert "Input! Up: GBA_L" in caplog.text
+
+
+def test_colour_player_id_cached():
+    """TEST: Coloured player ids are computed once per id."""
+    controller.colour_player_id.cache_clear()
+
+    first = controller.colour_player_id("CACHED")
+    assert controller.colour_player_id("CACHED") is first
+    assert controller.colour_player_id.cache_info().hits == 1
+
+    # TEST: Ids that aren't ascii are fine too
+    assert "🎮" in controller.colour_player_id("🎮🎮🎮🎮")
+
+
+def test_input_feed_off_request_thread(client):
+    """TEST: The input feed goes through a queue and is written to the console by the listener thread."""
+    import io
+
+    from flaskcontroller.logger import DroppingQueueHandler
+
+    assert controller.input_log_handler in controller.input_logger.handlers
+    assert isinstance(controller.input_log_handler, DroppingQueueHandler)
+
+    console = io.StringIO()
+    old_stream = controller.console_handler.setStream(console)
+    try:
+        client.post("/input/D_GBA_SELECT", headers={"client-id": "FEED"})
+
+        for _ in range(100):
+            if "SELECT" in console.getvalue():
+                break
+            time.sleep(0.01)
+    finally:
+        controller.console_handler.setStream(old_stream)
+
+    assert "SELECT" in console.getvalue()
+
+
+def test_status_stream(client, tmp_path, get_test_config):
+    """TEST: /status/stream sends the status straight away, counts the viewer, and has a limited number of slots."""
+    from http import HTTPStatus
+
+    import flaskcontroller
+
+    # TEST: Off by default, the page doesn't connect and keeps polling
+    assert client.get("/status/stream").status_code == HTTPStatus.NOT_FOUND
+    assert b'data-status-stream="0"' in client.get("/").data
+
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["status_stream_clients"] = 2
+    client = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path).test_client()
+    assert b'data-status-stream="1"' in client.get("/").data
+
+    response = client.get("/status/stream?client-id=VIEWER")
+    assert response.status_code == HTTPStatus.OK
+    assert response.mimetype == "text/event-stream"
+
+    event = next(response.response).decode()
+    assert event.startswith("event: status\n")
+    assert '"players_connected": 1' in event
+    assert "VIEWER" in controller.presence
+
+    # TEST: Each stream holds a web server thread, so past the limit clients are told to poll
+    streams = [response]
+    streams.extend(client.get("/status/stream") for _ in range(controller.status_broadcaster.max_clients - 1))
+    response = client.get("/status/stream")
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+    # TEST: Closed streams give their slot back
+    for stream in streams:
+        stream.close()
+    assert controller.status_broadcaster.clients == 0
+
+
+def test_metrics(client):
+    """TEST: /metrics serves the controller metrics in the Prometheus text format."""
+    client.post("/input/D_GBA_A", headers={"client-id": "METRICS"})
+    controller.encode_pending_input()
+
+    response = client.get("/metrics")
+    assert response.content_type == "text/plain; version=0.0.4; charset=utf-8"
+
+    text = response.data.decode()
+    assert "# TYPE flaskcontroller_input_seconds histogram" in text
+    assert "flaskcontroller_players_active 1.0" in text
+    assert "flaskcontroller_input_queue_depth 0.0" in text
+    assert "flaskcontroller_socket_connected_seconds 0.0" in text
+    assert "Could not read metric" not in text
+
+
+def test_batch_inputs(client):
+    """TEST: /inputs applies a JSON or binary batch in order, all or nothing."""
+    from http import HTTPStatus
+
+    response = client.post("/inputs", json=["D_GBA_A", "D_GBA_B", "U_GBA_A"], headers={"client-id": "BATCH"})
+    assert response.status_code == HTTPStatus.OK
+    assert response.text == "VALID KEYPRESSES"
+    assert controller.players.get_state("BATCH") == 0b10  # noqa: PLR2004
+    assert len(controller.input_queue) == 3  # noqa: PLR2004 One event per input, the tick loop wakes up the same
+
+    # TEST: Binary events, button bit number with 0x80 for down, then a client timestamp in ms
+    body = b"".join(
+        controller.BATCH_EVENT.pack(code, timestamp) for code, timestamp in [(0x83, 10), (0x01, 12), (0x03, 12)]
+    )
+    response = client.post(
+        "/inputs", data=body, content_type=controller.BATCH_CONTENT_TYPE, headers={"client-id": "BINARY"}
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert controller.players.get_state("BINARY") == 0
+
+    # TEST: One bad input and none of the batch is applied
+    for data, content_type in [
+        (b'["D_GBA_START", "D_GBA_NOPE"]', "application/json"),
+        (b'{"input": "D_GBA_START"}', "application/json"),
+        (b"[", "application/json"),
+        (controller.BATCH_EVENT.pack(0x83, 0) + controller.BATCH_EVENT.pack(0x8A, 1), controller.BATCH_CONTENT_TYPE),
+        (controller.BATCH_EVENT.pack(0x83, 5) + controller.BATCH_EVENT.pack(0x03, 1), controller.BATCH_CONTENT_TYPE),
+        (b"\x83\x00", controller.BATCH_CONTENT_TYPE),
+    ]:
+        response = client.post("/inputs", data=data, content_type=content_type, headers={"client-id": "BAD"})
+        assert response.status_code == HTTPStatus.BAD_REQUEST, data
+        assert response.text.startswith("INVALID BATCH")
+    assert controller.players.get_state("BAD") == 0
+
+    # TEST: Batches are limited in size, and need a client id
+    response = client.post(
+        "/inputs", json=["D_GBA_A"] * (controller.MAX_BATCH_EVENTS + 1), headers={"client-id": "BIG"}
+    )
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    assert client.post("/inputs", json=["D_GBA_A"]).status_code == HTTPStatus.BAD_REQUEST
@@ -0,0 +1,121 @@
+"""Unit test the generic_keyboard bridge in _emulator, decoding states and turning them into key presses."""
+
+import importlib.util
+import os
+import struct
+
+import pytest
+
+from flaskcontroller.protocol import FrameEncoder
+
+GENERIC_KEYBOARD_PATH = os.path.join("_emulator", "generic_keyboard", "generic_keyboard.py")
+KEYS = ["q", "w", "e", "r", "t", "y", "u", "i", "o", "p"]
+
+
+@pytest.fixture(scope="module")
+def generic_keyboard() -> object:
+    """Import generic_keyboard.py, it is a script rather than part of a package."""
+    spec = importlib.util.spec_from_file_location("generic_keyboard", GENERIC_KEYBOARD_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_keyboard(generic_keyboard: object) -> tuple[object, list]:
+    """Return a Keyboard that records (key, pressed) instead of pressing keys, and the list it records to."""
+    events = []
+    keyboard = generic_keyboard.Keyboard(
+        KEYS, press=lambda key: events.append((key, True)), release=lambda key: events.append((key, False))
+    )
+    return keyboard, events
+
+
+@pytest.mark.parametrize("read_size", [1, 3, 5, 64])
+def test_state_decoder_partial_reads(generic_keyboard, read_size: int):
+    """TEST: States split over reads of any size come out whole and in order."""
+    sent = [0x001, 0x3FF, 0x000, 0x201, 0x100]
+    data = b"".join(struct.pack("<H", state) for state in sent)
+
+    decoder = generic_keyboard.StateDecoder()
+    received = []
+    for start in range(0, len(data), read_size):
+        received.extend(decoder.feed(data[start : start + read_size]))
+
+    assert received == sent
+
+
+def test_state_decoder_keeps_partial(generic_keyboard):
+    """TEST: Half a state is held until the rest arrives."""
+    decoder = generic_keyboard.StateDecoder()
+    assert decoder.feed(b"\x01\x00\x03") == [1]
+    assert decoder.feed(b"") == []
+    assert decoder.feed(b"\x02") == [0x203]
+
+
+@pytest.mark.parametrize("read_size", [1, 3, 11, 64])
+def test_frame_decoder_partial_reads(generic_keyboard, read_size: int):
+    """TEST: Version 2 frames split over reads of any size come out as their states, runs expanded, in order."""
+    sent = [[0x001, 0x000], [0x3FF, 0x3FF, 0x3FF], [0x200]]
+    encoder = FrameEncoder()
+    data = b"".join(encoder.encode(states) for states in sent)
+
+    decoder = generic_keyboard.FrameDecoder()
+    received = []
+    for start in range(0, len(data), read_size):
+        received.extend(decoder.feed(data[start : start + read_size]))
+
+    assert received == [state for states in sent for state in states]
+
+
+def test_frame_decoder_bad_header(generic_keyboard):
+    """TEST: Version 1 states sent to a version 2 bridge are an error, not garbage key presses."""
+    decoder = generic_keyboard.FrameDecoder()
+    with pytest.raises(ValueError, match="protocol_version = 2"):
+        decoder.feed(b"\x01\x00" * 10)
+
+
+def test_keyboard_xor_diff(generic_keyboard):
+    """TEST: Only the buttons that changed are pressed or released."""
+    keyboard, events = make_keyboard(generic_keyboard)
+
+    keyboard.apply(0b101)
+    assert events == [("q", True), ("e", True)]
+
+    events.clear()
+    keyboard.apply(0b101)  # Nothing changed
+    assert events == []
+
+    keyboard.apply(0b110)
+    assert events == [("q", False), ("w", True)]
+
+    # TEST: Bits without a key are ignored
+    events.clear()
+    keyboard.apply(0b110 | 1 << len(KEYS))
+    assert events == []
+    assert keyboard.state == 0b110  # noqa: PLR2004
+
+
+def test_receiver_disconnect_releases(generic_keyboard):
+    """TEST: When an upstream goes away the keys only it was holding are released."""
+    keyboard, events = make_keyboard(generic_keyboard)
+    receiver = generic_keyboard.Receiver(keyboard)
+
+    # TEST: One upstream, its states are applied in order
+    receiver.receive("ONE", [0b1, 0b11])
+    assert events == [("q", True), ("w", True)]
+
+    # TEST: Two upstreams, the keys held are the OR of both
+    events.clear()
+    receiver.receive("TWO", [0b110])
+    assert events == [("e", True)]
+    assert keyboard.state == 0b111  # noqa: PLR2004
+
+    # TEST: What only ONE held is released, w is still held by TWO
+    events.clear()
+    receiver.disconnect("ONE")
+    assert events == [("q", False)]
+
+    events.clear()
+    receiver.disconnect("TWO")
+    assert sorted(events) == [("e", False), ("w", False)]
+    assert keyboard.state == 0
@@ -0,0 +1,124 @@
+"""Unit test the input queue module."""
+
+import threading
+import time
+
+import pytest
+
+from flaskcontroller.input_queue import (
+    OVERFLOW_COLLAPSE,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_DROP_OLDEST,
+    InputQueue,
+)
+
+
+def test_input_queue_fifo():
+    """TEST: Inputs come out in the order they went in."""
+    input_queue = InputQueue(capacity=8)
+
+    assert not input_queue
+
+    for i in range(5):
+        input_queue.append(i)
+
+    assert input_queue
+    assert len(input_queue) == 5  # noqa: PLR2004
+    assert input_queue.popleft() == 0
+    assert input_queue.drain() == [1, 2, 3, 4]
+    assert not input_queue
+
+    with pytest.raises(IndexError):
+        input_queue.popleft()
+
+
+def test_input_queue_on_input():
+    """TEST: on_input is called when input lands in an empty queue, not for every input."""
+    input_queue = InputQueue()
+    calls = []
+    input_queue.on_input = lambda: calls.append(len(input_queue))
+
+    input_queue.append(1)
+    input_queue.append(2)
+    assert calls == [1]
+
+    input_queue.drain()
+    input_queue.append(3)
+    assert calls == [1, 1]
+
+
+@pytest.mark.parametrize(
+    ("overflow", "expected", "expected_dropped"),
+    [
+        (OVERFLOW_DROP_OLDEST, [2, 3, 4], 2),
+        (OVERFLOW_DROP_NEWEST, [0, 1, 2], 2),
+        (OVERFLOW_COLLAPSE, [3, 4], 3),
+    ],
+)
+def test_input_queue_overflow(overflow: str, expected: list, expected_dropped: int):
+    """TEST: Each overflow policy keeps the right inputs and counts the drops."""
+    input_queue = InputQueue(capacity=3, overflow=overflow)
+
+    for i in range(5):
+        input_queue.append(i)
+
+    stats = input_queue.get_stats()
+    items, enqueue_times = input_queue.drain_timed()
+    assert items == expected
+    assert len(enqueue_times) == len(expected)  # TEST: The enqueue times are dropped along with their inputs
+    assert enqueue_times == sorted(enqueue_times)
+    assert stats["dropped"] == expected_dropped
+    assert stats["enqueued"] == 5  # noqa: PLR2004
+    assert stats["high_water"] == 3  # noqa: PLR2004
+
+
+def test_input_queue_expire():
+    """TEST: Only inputs older than the age limit are expired, and they are counted."""
+    input_queue = InputQueue(capacity=8)
+    input_queue.append(1)
+    input_queue.append(2)
+    time.sleep(0.05)
+    input_queue.append(3)
+
+    assert input_queue.expire(0.04) == 2  # noqa: PLR2004
+    assert input_queue.drain() == [3]
+
+    # TEST: An age limit of 0 expires everything
+    input_queue.append(4)
+    assert input_queue.expire(0) == 1
+    assert not input_queue
+    assert input_queue.get_stats()["expired"] == 3  # noqa: PLR2004
+    assert input_queue.get_stats()["dropped"] == 0
+
+
+def test_input_queue_invalid_args():
+    """TEST: Bad capacity or overflow policy raises ValueError."""
+    with pytest.raises(ValueError, match="capacity"):
+        InputQueue(capacity=0)
+
+    with pytest.raises(ValueError, match="overflow policy"):
+        InputQueue(overflow="INVALID")
+
+
+def test_input_queue_many_producers():
+    """TEST: Nothing is lost or duplicated with many producer threads."""
+    n_threads = 8
+    n_items = 1000
+    input_queue = InputQueue(capacity=n_threads * n_items)
+
+    def producer(offset: int) -> None:
+        for i in range(n_items):
+            input_queue.append(offset + i)
+
+    threads = [threading.Thread(target=producer, args=(t * n_items,)) for t in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(input_queue.drain()) == list(range(n_threads * n_items))
+    assert input_queue.get_stats()["dropped"] == 0
+
+    input_queue.append(1)
+    input_queue.clear()
+    assert len(input_queue) == 0
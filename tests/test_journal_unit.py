@@ -0,0 +1,151 @@
+"""Unit test the input journal and replay."""
+
+import socket
+import time
+
+import pytest
+
+import flaskcontroller.replay
+from flaskcontroller import controller, journal
+from flaskcontroller.journal import HEADER, NO_PLAYER, RECORD, JournalError, JournalWriter, read_journal
+from flaskcontroller.protocol import encode_v1
+from flaskcontroller.replay import replay
+
+
+def write_journal(path, records, started=0) -> None:
+    """Write a journal by hand, so the timestamps are known."""
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(journal.MAGIC, journal.VERSION, RECORD.size, started))
+        file.writelines(RECORD.pack(*record) for record in records)
+
+
+def test_journal_writer(tmp_path):
+    """TEST: Recorded states come back out in order, with their player slot."""
+    path = str(tmp_path / "journal.bin")
+    writer = JournalWriter(path)
+    writer.record(0b1, 3)
+    writer.record(0b11, 4)
+    writer.record(0)
+    writer.close()
+
+    with read_journal(path) as journal_records:
+        records = list(journal_records)
+    assert [(state, player) for _, state, player in records] == [(0b1, 3), (0b11, 4), (0, NO_PLAYER)]
+    assert records[0][0] <= records[1][0] <= records[2][0]
+
+
+def test_journal_rotation(tmp_path):
+    """TEST: Journals are rotated by size, keeping backup_count old ones, an existing journal isn't overwritten."""
+    path = str(tmp_path / "journal.bin")
+    write_journal(path, [(1, 1, 1)])
+
+    writer = JournalWriter(path, max_bytes=HEADER.size + RECORD.size * 4, backup_count=2)
+    for state in range(14):
+        writer.record(state)
+    writer.close()
+
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["journal.bin", "journal.bin.1", "journal.bin.2"]
+    states = []
+    for name in ["journal.bin.2", "journal.bin.1", "journal.bin"]:
+        with read_journal(str(tmp_path / name)) as records:
+            states.extend(state for _, state, _ in records)
+    assert states == list(range(4, 14))  # The old journal and the first full file were rotated out
+
+
+def test_read_journal(tmp_path):
+    """TEST: Only journals can be read, a record cut short at the end is ignored."""
+    path = tmp_path / "journal.bin"
+    write_journal(path, [(1, 2, 3), (4, 5, 6)])
+    with open(path, "ab") as file:
+        file.write(b"\x00" * (RECORD.size // 2))
+    with read_journal(str(path)) as records:
+        assert list(records) == [(1, 2, 3), (4, 5, 6)]
+
+    path.write_bytes(b"not a journal, but long enough")
+    with pytest.raises(JournalError, match="isn't a version"), read_journal(str(path)):
+        pass
+
+    path.write_bytes(b"short")
+    with pytest.raises(JournalError, match="too short"), read_journal(str(path)):
+        pass
+
+
+def test_replay(tmp_path):
+    """TEST: Replay sends every state, with the original gaps divided by the speed."""
+    first = tmp_path / "journal.bin.1"
+    second = tmp_path / "journal.bin"
+    write_journal(first, [(0, 0b1, 0), (100_000_000, 0b10, 0)])
+    write_journal(second, [(200_000_000, 0, NO_PLAYER)], started=200_000_000)  # Rotated mid run
+
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        start = time.monotonic()
+        assert replay([str(first), str(second)], sender, speed=4) == 3  # noqa: PLR2004
+        assert time.monotonic() - start >= 0.05  # noqa: PLR2004 200ms of journal at 4x
+        assert receiver.recv(64) == encode_v1(0b1) + encode_v1(0b10) + encode_v1(0)
+
+        # TEST: Speed 0 is as fast as possible
+        start = time.monotonic()
+        replay([str(first), str(second)], sender, speed=0)
+        assert time.monotonic() - start < 0.05  # noqa: PLR2004
+
+
+class FakeClock:
+    """Stands in for the time module in replay, sleeping just moves the clock on."""
+
+    def __init__(self) -> None:
+        """Start at 0 seconds."""
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        """Return the fake time."""
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        """Move the clock on."""
+        self.now += seconds
+
+
+def test_replay_across_runs(tmp_path, monkeypatch):
+    """TEST: Each file is timed from its own first record, the gap between runs comes from the headers, capped."""
+    clock = FakeClock()
+    monkeypatch.setattr(flaskcontroller.replay, "time", clock)
+    hour = 3600 * 10**9
+    first = tmp_path / "journal.bin.2"
+    second = tmp_path / "journal.bin.1"
+    third = tmp_path / "journal.bin"
+    write_journal(first, [(5 * hour, 0b1, 0), (5 * hour + 100_000_000, 0b10, 0)], started=hour)
+    # TEST: Rebooted an hour later, monotonic time went backwards
+    write_journal(second, [(1_000, 0b100, 0), (300_001_000, 0b1000, 0)], started=2 * hour)
+    # TEST: Restarted 200ms after the last state
+    write_journal(third, [(hour, 0, NO_PLAYER)], started=2 * hour + 500_000_000)
+
+    sent_at = []
+
+    class FakeSocket:
+        def sendall(self, _) -> None:
+            """Note when each state was sent."""
+            sent_at.append(clock.now)
+
+    assert replay([str(first), str(second), str(third)], FakeSocket(), speed=2, max_file_gap=1) == 5  # noqa: PLR2004
+
+    # 0, +100ms, +1s capped, +300ms, +200ms, all halved
+    assert sent_at == pytest.approx([0, 0.05, 0.55, 0.7, 0.8])
+
+
+def test_sent_states_journaled(app, tmp_path):
+    """TEST: Every state the socket sender encodes is journaled with the last player to change it."""
+    path = str(tmp_path / "sent.bin")
+    controller.journal = JournalWriter(path)
+    try:
+        client = app.test_client()
+        client.post("/input/D_GBA_A", headers={"client-id": "FIRST"})
+        client.post("/input/D_GBA_B", headers={"client-id": "SECOND"})
+        controller.encode_pending_input()
+        controller.encode_pending_input()  # Nothing changed, still sent and journaled
+    finally:
+        controller.journal.close()
+        controller.journal = None
+
+    with read_journal(path) as records:
+        assert [(state, player) for _, state, player in records] == [(0b11, 1), (0b11, NO_PLAYER)]
@@ -0,0 +1,170 @@
+"""Unit test the input to applied latency tracker."""
+
+import contextlib
+import socket
+import threading
+import time
+
+import pytest
+
+from flaskcontroller import controller
+from flaskcontroller.latency import LatencyTracker, percentile
+from flaskcontroller.protocol import FrameDecoder, encode_ack
+
+
+def test_latency_samples():
+    """TEST: An acked state gives each input it carried its enqueue to send, send to apply and total latency."""
+    tracker = LatencyTracker()
+    tracker.record_sent("emu", 7, 10.0, [("A", 9.5), ("B", 9.75)])
+
+    assert tracker.record_ack("emu", 7, 10.25)
+    assert tracker.get_player("A") == {
+        "enqueue_to_send": 0.5,
+        "send_to_apply": 0.25,
+        "enqueue_to_apply": 0.75,
+        "samples": 1,
+    }
+    assert tracker.get_player("B")["enqueue_to_apply"] == 0.5  # noqa: PLR2004
+    assert tracker.get_player("NOBODY") is None
+
+    # TEST: Acks for states that carried no input, or were already acked, are ignored
+    tracker.record_sent("emu", 8, 11.0, [])
+    assert not tracker.record_ack("emu", 8, 11.1)
+    assert not tracker.record_ack("emu", 7, 11.1)
+
+    # TEST: Sequence numbers are per target
+    tracker.record_sent("other", 9, 12.0, [("A", 12.0)])
+    assert not tracker.record_ack("emu", 9, 12.1)
+    assert tracker.record_ack("other", 9, 12.25)
+    assert tracker.get_player("A")["samples"] == 2  # noqa: PLR2004
+
+    # TEST: Players that go away are forgotten
+    tracker.forget_player("A")
+    assert tracker.get_player("A") is None
+
+
+def test_latency_stats():
+    """TEST: Percentiles over every player's latest samples."""
+    tracker = LatencyTracker(recent_samples=100)
+    for seq in range(200):
+        tracker.record_sent("emu", seq, 1.0, [(f"P{seq}", 1.0)])
+        tracker.record_ack("emu", seq, 1.0 + seq / 1000)
+
+    stats = tracker.get_stats()
+    assert stats["acked"] == 200  # noqa: PLR2004
+    assert stats["samples"] == 100  # noqa: PLR2004 Only the latest
+    assert stats["send_to_apply"]["p50"] == pytest.approx(0.149)
+    assert stats["send_to_apply"]["max"] == pytest.approx(0.199)
+    assert stats["enqueue_to_send"]["p99"] == 0
+
+    # TEST: Nothing to report yet
+    assert LatencyTracker().get_stats()["enqueue_to_apply"] == {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+    assert percentile([1, 2, 3, 4], 50) == 2  # noqa: PLR2004
+
+
+def test_unacked_limit():
+    """TEST: States the emulator never acks are given up on, oldest first."""
+    tracker = LatencyTracker(max_unacked=2)
+    for seq in range(3):
+        tracker.record_sent("emu", seq, 1.0, [("A", 1.0)])
+
+    assert not tracker.record_ack("emu", 0, 2.0)
+    assert tracker.record_ack("emu", 2, 2.0)
+    assert tracker.get_stats()["dropped"] == 1
+
+
+def test_push_mode_acks(tmp_path, get_test_config):
+    """TEST: Version 2 frames are acked by sequence number, and the latency shows up in /latency."""
+    import flaskcontroller
+
+    server = socket.create_server(("127.0.0.1", 0))
+    server.settimeout(5)
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["targets"] = [f"127.0.0.1:{server.getsockname()[1]}"]
+    test_config["app"].update({"protocol_version": 2, "latency_acks": True})
+    app = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+    client = app.test_client()
+
+    controller._run_thread = True
+    thread = threading.Thread(target=controller.socket_sender, args=(app.config,))
+    thread.start()
+    try:
+        conn, _ = server.accept()
+        conn.settimeout(0.05)
+        deadline = time.monotonic() + 5
+        while not controller.get_status_dict()["sock_connected"]:  # Input from before then isn't sent
+            assert time.monotonic() < deadline, "Timed out"
+            time.sleep(0.01)
+        client.post("/input/D_GBA_B", headers={"client-id": "PUSHED"})
+
+        # Ack every frame like the emulator script does, until the one with the input has been acked
+        decoder = FrameDecoder()
+        while client.get("/latency").json["acked"] == 0:
+            assert time.monotonic() < deadline, "Timed out"
+            with contextlib.suppress(TimeoutError):  # Nothing new, the ack may not have been read yet
+                for frame in decoder.feed(conn.recv(4096)):
+                    conn.sendall(encode_ack(frame.seq, 1))
+
+        assert client.get("/GetStatus", headers={"client-id": "PUSHED"}).json["latency"]["samples"] == 1
+        conn.close()
+    finally:
+        controller._run_thread = False
+        thread.join()
+        server.close()
+
+
+def test_push_mode_acks_read_promptly(tmp_path, get_test_config):
+    """TEST: In push mode acks are read as they arrive, not when the sender next wakes up for input."""
+    import flaskcontroller
+
+    server = socket.create_server(("127.0.0.1", 0))
+    server.settimeout(5)
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["targets"] = [f"127.0.0.1:{server.getsockname()[1]}"]
+    test_config["app"].update({"protocol_version": 2, "latency_acks": True})
+    app = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+    client = app.test_client()
+
+    def emulator(conn: socket.socket) -> None:
+        """Ack every frame as soon as it arrives, until the sender hangs up."""
+        decoder = FrameDecoder()
+        with contextlib.suppress(OSError):
+            while data := conn.recv(4096):
+                for frame in decoder.feed(data):
+                    conn.sendall(encode_ack(frame.seq, 1))
+
+    controller._run_thread = True
+    thread = threading.Thread(target=controller.socket_sender, args=(app.config,))
+    thread.start()
+    try:
+        conn, _ = server.accept()
+        emulator_thread = threading.Thread(target=emulator, args=(conn,))
+        emulator_thread.start()
+        deadline = time.monotonic() + 5
+        while not controller.get_status_dict()["sock_connected"]:  # Input from before then isn't sent
+            assert time.monotonic() < deadline, "Timed out"
+            time.sleep(0.01)
+
+        # Each input arrives with the sender idle, so nothing else would wake it to read the ack
+        presses = 3
+        for press in range(presses):
+            client.post(f"/input/{'D' if press % 2 == 0 else 'U'}_GBA_B", headers={"client-id": "PROMPT"})
+            time.sleep(0.3)
+        while client.get("/latency").json["acked"] < presses:
+            assert time.monotonic() < deadline, "Timed out"
+            time.sleep(0.01)
+
+        assert client.get("/latency").json["send_to_apply"]["max"] < controller.IDLE_TIMEOUT / 2
+        conn.shutdown(socket.SHUT_RDWR)
+        emulator_thread.join()
+        conn.close()
+    finally:
+        controller._run_thread = False
+        thread.join()
+        server.close()
+
+
+def test_latency_off(client):
+    """TEST: Without latency acks there is no latency to report."""
+    assert client.get("/latency").status_code == 404  # noqa: PLR2004
+    assert "latency" not in client.get("/GetStatus", headers={"client-id": "NOACKS"}).json
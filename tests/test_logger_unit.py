@@ -89,3 +89,44 @@ def test_set_log_level(log_level_in: str | int, log_level_expected: int, logger)
     # TEST: Logger ends up with correct values
     _set_log_level(logger, log_level_in)
     assert logger.getEffectiveLevel() == log_level_expected
+
+
+def test_queued_logging(logger, tmp_path, app: Flask):
+    """TEST: Queued logging moves the handlers behind a queue and a listener thread."""
+    log_path = os.path.join(tmp_path, "test.log")
+    logging_conf = {"path": log_path, "level": "INFO", "queued": True, "queue_size": 10}
+
+    flaskcontroller.logger.setup_logger(app, logging_conf, logger)
+    queue_handler = flaskcontroller.logger.get_queue_handler(logger)
+
+    # TEST: Only the queue handler is left on the logger, the console and file handlers are on the listener
+    assert logger.handlers == [queue_handler]
+    assert len(queue_handler.listener.handlers) == 2  # noqa: PLR2004 A console and a file handler are expected
+
+    # TEST: Setting up again doesn't add more handlers
+    flaskcontroller.logger.setup_logger(app, logging_conf, logger)
+    assert logger.handlers == [queue_handler]
+    assert len(queue_handler.listener.handlers) == 2  # noqa: PLR2004
+
+    # TEST: Records make it to the file once the listener has caught up
+    logger.warning("Queued message")
+    queue_handler.stop()
+    with open(log_path) as log_file:
+        assert "Queued message" in log_file.read()
+
+    # TEST: With nothing taking records off the queue, records past the queue size are dropped and counted
+    for i in range(15):
+        logger.warning("Message %s", i)
+    assert queue_handler.get_stats() == {"depth": 10, "dropped": 5}
+
+
+def test_log_rotation_config(logger, tmp_path, app: Flask):
+    """TEST: Log rotation size and count come from the logging config."""
+    from logging.handlers import RotatingFileHandler
+
+    logging_conf = {"path": os.path.join(tmp_path, "test.log"), "level": "INFO", "max_bytes": 100, "backup_count": 2}
+    flaskcontroller.logger.setup_logger(app, logging_conf, logger)
+
+    file_handler = next(handler for handler in logger.handlers if isinstance(handler, RotatingFileHandler))
+    assert file_handler.maxBytes == 100  # noqa: PLR2004
+    assert file_handler.backupCount == 2  # noqa: PLR2004
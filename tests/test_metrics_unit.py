@@ -0,0 +1,78 @@
+"""Unit test the metrics module."""
+
+import threading
+
+import pytest
+
+from flaskcontroller.metrics import Counter, Histogram, Registry
+
+
+def test_counter_threads():
+    """TEST: Every thread counts into its own cell, the total adds them all up."""
+    counter = Counter("test_total", "Test counter")
+
+    def count() -> None:
+        for _ in range(1000):
+            counter.inc()
+
+    threads = [threading.Thread(target=count) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counter.inc(0.5)
+    assert len(counter._cells) == 5  # noqa: PLR2004 Four threads and this one
+    assert counter.get() == 4000.5  # noqa: PLR2004
+
+    # TEST: The cells of threads that have exited are folded into one, so they don't pile up
+    assert len(counter._cells) == 1
+    counter.inc()
+    assert counter.get() == 4001.5  # noqa: PLR2004
+
+
+def test_histogram():
+    """TEST: Values land in the right bucket, rendered cumulatively with +Inf, sum and count."""
+    histogram = Histogram("test_seconds", "Test histogram", (0.1, 1))
+
+    # TEST: Bucket bounds are inclusive, like Prometheus
+    for value in [0.05, 0.1, 0.5, 1, 5]:
+        histogram.observe(value)
+
+    counts, total = histogram.get()
+    assert counts == [2, 2, 1]
+    assert total == pytest.approx(6.65)
+
+    assert histogram.render() == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1"} 4',
+        'test_seconds_bucket{le="+Inf"} 5',
+        f"test_seconds_sum {total}",
+        "test_seconds_count 5",
+    ]
+
+
+def test_registry(caplog):
+    """TEST: The registry renders every metric in the Prometheus text format."""
+    registry = Registry()
+    counter = registry.counter("test_total", "Test counter")
+    registry.gauge("test_gauge", "Test gauge", lambda: 3)
+    registry.gauge("test_broken", "Broken gauge", lambda: 1 / 0)
+    counter.inc(2)
+
+    assert registry.render() == (
+        "# HELP test_total Test counter\n"
+        "# TYPE test_total counter\n"
+        "test_total 2\n"
+        "# HELP test_gauge Test gauge\n"
+        "# TYPE test_gauge gauge\n"
+        "test_gauge 3.0\n"
+        "# HELP test_broken Broken gauge\n"
+        "# TYPE test_broken gauge\n"
+    )
+    # TEST: A broken gauge is logged, not raised
+    assert "Could not read metric: test_broken" in caplog.text
+
+    # TEST: Names are unique
+    with pytest.raises(ValueError, match="already registered"):
+        registry.counter("test_total", "Again")
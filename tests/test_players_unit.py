@@ -0,0 +1,186 @@
+"""Unit test the players module."""
+
+import random
+import time
+
+import pytest
+
+from flaskcontroller.players import (
+    MAX_TICK_STATES,
+    MERGE_LATEST,
+    MERGE_MAJORITY,
+    MERGE_MODES,
+    MERGE_OR,
+    N_BUTTONS,
+    PlayerInputTable,
+    pack_event,
+    unpack_event,
+)
+
+GBA_A = 1
+GBA_B = 2
+GBA_START = 8
+
+
+def test_pack_event():
+    """TEST: Events survive packing."""
+    assert unpack_event(pack_event(1234, 0x3FF)) == (1234, 0x3FF)
+
+
+def test_players_have_their_own_state():
+    """TEST: One player releasing a button doesn't release it for someone else."""
+    players = PlayerInputTable()
+
+    players.apply("A", GBA_A, pressed=True)
+    players.apply("B", GBA_A, pressed=True)
+    players.apply("B", GBA_A, pressed=False)
+
+    assert players.get_state("A") == GBA_A
+    assert players.get_state("B") == 0
+    assert players.get_state("NOBODY") == 0
+    assert players.merge() == GBA_A
+
+
+def test_release_frees_buttons_and_slot():
+    """TEST: Releasing a player lets go of their buttons and their slot gets reused."""
+    players = PlayerInputTable(max_players=2)
+
+    players.apply("A", GBA_START, pressed=True)
+    players.apply("B", GBA_B, pressed=True)
+
+    # TEST: No room for a third player
+    assert players.apply("C", GBA_A, pressed=True) is None
+
+    assert unpack_event(players.release("A")) == (0, 0)
+    assert players.release("A") is None
+    assert players.merge() == GBA_B
+
+    # TEST: The freed slot is reused
+    assert unpack_event(players.apply("C", GBA_A, pressed=True)) == (0, GBA_A)
+    assert len(players) == 2  # noqa: PLR2004
+
+    # TEST: Queue events can be turned back into players
+    assert players.get_player_id(0) == "C"
+    assert players.get_player_id(1) == "B"
+    players.release("B")
+    assert players.get_player_id(1) is None
+
+
+def test_clear_stale():
+    """TEST: Players who haven't changed their input in a while have their buttons released, but keep their slot."""
+    players = PlayerInputTable()
+    players.apply("STALE", GBA_A, pressed=True)
+    players.apply("IDLE", GBA_B, pressed=True)
+    players.apply("IDLE", GBA_B, pressed=False)
+    time.sleep(0.05)
+    players.apply("FRESH", GBA_START, pressed=True)
+
+    events = players.clear_stale(0.04)
+    assert [unpack_event(event) for event in events] == [(0, 0)]  # Only STALE was holding anything
+    assert players.merge() == GBA_START
+    assert len(players) == 3  # noqa: PLR2004
+
+    # TEST: The majority electorate is kept right
+    players.merge_mode = MERGE_MAJORITY
+    assert players.merge() == GBA_START
+
+
+def test_merge_majority():
+    """TEST: A button is down when most players holding something hold it."""
+    players = PlayerInputTable(merge_mode=MERGE_MAJORITY)
+
+    players.apply("A", GBA_A | GBA_B, pressed=True)
+    players.apply("B", GBA_A, pressed=True)
+    players.apply("C", GBA_START, pressed=True)
+    players.apply("D", GBA_A, pressed=True)
+    players.apply("D", GBA_A, pressed=False)  # Not holding anything, doesn't get a say
+
+    assert players.merge() == GBA_A
+
+
+def test_merge_latest():
+    """TEST: The player who changed their input last gets the controller."""
+    players = PlayerInputTable(merge_mode=MERGE_LATEST)
+    assert players.merge() == 0
+
+    players.apply("A", GBA_A, pressed=True)
+    players.apply("B", GBA_B, pressed=True)
+    assert players.merge() == GBA_B
+
+    players.release("B")
+    assert players.merge() == 0
+
+
+@pytest.mark.parametrize("merge_mode", [MERGE_OR, MERGE_MAJORITY])
+def test_merge_matches_loop(merge_mode: str):
+    """TEST: The bitwise reduction gives the same answer as looping over every player."""
+    players = PlayerInputTable(merge_mode=merge_mode)
+    states = {}
+    for i in range(300):
+        state = random.getrandbits(N_BUTTONS)
+        players.apply(str(i), state, pressed=True)
+        states[str(i)] = state
+
+    holding = sum(1 for state in states.values() if state)
+    expected = 0
+    for bit in range(N_BUTTONS):
+        count = sum(1 for state in states.values() if state & (1 << bit))
+        if (merge_mode == MERGE_OR and count) or (merge_mode == MERGE_MAJORITY and count * 2 > holding):
+            expected |= 1 << bit
+
+    assert players.merge() == expected
+
+
+def test_merge_events():
+    """TEST: Input that changes and changes back within a tick still comes out, in the fewest states."""
+    players = PlayerInputTable()
+
+    # TEST: A press and release in one tick is a press then a release
+    events = [players.apply("A", GBA_A, pressed=True), players.apply("A", GBA_A, pressed=False)]
+    assert players.merge_events(events) == [GBA_A, 0]
+
+    # TEST: Changes to different buttons don't need states of their own
+    events = [players.apply("A", GBA_A, pressed=True), players.apply("B", GBA_B, pressed=True)]
+    assert players.merge_events(events) == [GBA_A | GBA_B]
+
+    # TEST: A double tap is two taps
+    events = [players.apply("C", GBA_START, pressed=pressed) for pressed in [True, False, True, False]]
+    assert players.merge_events(events) == [GBA_A | GBA_B | GBA_START, GBA_A | GBA_B] * 2
+
+    # TEST: Nothing new, the merged state now
+    assert players.merge_events([]) == [GBA_A | GBA_B]
+
+    # TEST: Past the limit the rest are merged into the last state, which is always the merged state now
+    events = [players.apply("A", GBA_START, pressed=pressed) for pressed in [True, False] * MAX_TICK_STATES]
+    states = players.merge_events(events)
+    assert len(states) == MAX_TICK_STATES
+    assert states[-1] == players.merge()
+
+
+def test_merge_events_dropped():
+    """TEST: Events the input queue dropped don't leave the replay behind the table."""
+    players = PlayerInputTable()
+    players.apply("A", GBA_A, pressed=True)  # Never drained
+    events = [players.apply("B", GBA_B, pressed=True)]
+    assert players.merge_events(events) == [GBA_A | GBA_B]
+
+    events = [players.apply("A", GBA_A, pressed=False), players.apply("A", GBA_A, pressed=True)]
+    assert players.merge_events(events) == [GBA_B, GBA_A | GBA_B]
+
+
+@pytest.mark.parametrize("merge_mode", MERGE_MODES)
+def test_merge_events_matches_merge(merge_mode: str):
+    """TEST: Whatever the merge mode, the replay ends on the same state as merge()."""
+    players = PlayerInputTable(merge_mode=merge_mode)
+    for _ in range(20):
+        events = [
+            players.apply(str(random.randrange(10)), 1 << random.randrange(N_BUTTONS), random.random() < 0.5)  # noqa: PLR2004
+            for _ in range(random.randrange(5))
+        ]
+        assert players.merge_events(events)[-1] == players.merge()
+
+
+def test_invalid_merge_mode():
+    """TEST: Bad merge mode raises ValueError."""
+    with pytest.raises(ValueError, match="merge mode"):
+        PlayerInputTable(merge_mode="INVALID")
@@ -0,0 +1,69 @@
+"""Unit test the presence module."""
+
+import threading
+import time
+
+from flaskcontroller.presence import PresenceTracker
+
+
+def test_presence_count_and_expiry():
+    """TEST: Players are counted until they time out."""
+    presence = PresenceTracker(timeout=0.05)
+
+    presence.touch("A")
+    presence.touch("B")
+    presence.touch("A")  # Touching again doesn't count twice
+    assert presence.count() == 2  # noqa: PLR2004
+    assert "A" in presence
+
+    time.sleep(0.1)
+    presence.touch("C")
+    assert presence.count() == 3  # noqa: PLR2004 Touching doesn't expire anyone, it has to stay cheap
+
+    assert presence.expire() == ["B", "A"]
+    assert presence.count() == 1
+    assert "A" not in presence
+
+
+def test_presence_expire_oldest_first():
+    """TEST: expire() only drops the players that have timed out, and says who they were."""
+    presence = PresenceTracker(timeout=0.1)
+
+    presence.touch("A")
+    presence.touch("B")
+    time.sleep(0.07)
+    presence.touch("A")  # A is fresh again, B is not
+    time.sleep(0.07)
+
+    assert presence.expire() == ["B"]
+    assert presence.count() == 1
+
+
+def test_presence_max_players():
+    """TEST: The least recently seen players are dropped past the cap."""
+    presence = PresenceTracker(max_players=3)
+
+    for player_id in ["A", "B", "C"]:
+        presence.touch(player_id)
+    presence.touch("A")
+    presence.touch("D")
+
+    assert presence.expire() == ["B"]
+    assert presence.count() == 3  # noqa: PLR2004
+
+
+def test_presence_threads():
+    """TEST: Touching from many threads at once is safe."""
+    presence = PresenceTracker(max_players=1000)
+
+    def toucher(offset: int) -> None:
+        for i in range(1000):
+            presence.touch(str(offset + i % 100))
+
+    threads = [threading.Thread(target=toucher, args=(t * 100,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert presence.count() == 800  # noqa: PLR2004
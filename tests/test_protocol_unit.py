@@ -0,0 +1,169 @@
+"""Unit test the wire protocol module, no emulator needed."""
+
+import pytest
+
+from flaskcontroller.protocol import (
+    V2_HEADER,
+    V2_MAX_RUN,
+    V2_MAX_STATES,
+    EmulatorDecoder,
+    EmulatorMessage,
+    FrameDecoder,
+    FrameEncoder,
+    ProtocolError,
+    encode_ack,
+    encode_pull_state,
+    encode_tick,
+    encode_v1,
+    run_length_encode,
+)
+
+
+def test_encode_v1():
+    """TEST: Version 1 is the bare 2 byte little endian state."""
+    assert encode_v1(512) == b"\x00\x02"
+    assert encode_v1(1) == b"\x01\x00"
+
+
+def test_run_length_encode():
+    """TEST: Repeated states collapse, runs are capped so they fit in a byte."""
+    assert run_length_encode([]) == []
+    assert run_length_encode([1, 1, 1, 2, 1]) == [(1, 3), (2, 1), (1, 1)]
+    assert run_length_encode([7] * (V2_MAX_RUN + 1)) == [(7, V2_MAX_RUN), (7, 1)]
+
+
+@pytest.mark.parametrize(
+    "states",
+    [
+        [],
+        [1],
+        [1, 1, 1, 1, 8, 8, 0],
+        list(range(1024)),
+        [3] * 1000,
+    ],
+)
+def test_round_trip(states: list):
+    """TEST: Whatever goes into the encoder comes out of the decoder."""
+    encoder = FrameEncoder()
+    decoder = FrameDecoder()
+
+    frames = decoder.feed(encoder.encode(states))
+
+    assert len(frames) == 1
+    assert frames[0].seq == 0
+    assert frames[0].states == states
+
+
+def test_repeated_states_are_compact():
+    """TEST: A batch of the same state is a single entry on the wire."""
+    data = FrameEncoder().encode([5] * 100)
+    assert len(data) == V2_HEADER.size + 3
+
+
+def test_large_batch_is_split():
+    """TEST: Batches bigger than one frame are split, but still returned as one write."""
+    states = [i % 1024 for i in range(V2_MAX_STATES + 10)]
+    frames = FrameDecoder().feed(FrameEncoder().encode(states))
+
+    assert [frame.seq for frame in frames] == [0, 1]
+    assert frames[0].states + frames[1].states == states
+
+
+def test_partial_reads():
+    """TEST: Frames split over reads of any size are reassembled."""
+    encoder = FrameEncoder()
+    data = encoder.encode([1, 2, 3]) + encoder.encode([4, 4]) + encoder.encode([0])
+
+    decoder = FrameDecoder()
+    frames = []
+    for i in range(len(data)):
+        frames += decoder.feed(data[i : i + 1])
+
+    assert [frame.states for frame in frames] == [[1, 2, 3], [4, 4], [0]]
+    assert decoder.lost == 0
+    assert decoder.reordered == 0
+
+
+def test_lost_and_reordered_frames():
+    """TEST: Gaps and out of order sequence numbers are counted."""
+    encoder = FrameEncoder()
+    first = encoder.encode([1])
+    second = encoder.encode([2])
+    third = encoder.encode([3])
+    fourth = encoder.encode([4])
+
+    decoder = FrameDecoder()
+    decoder.feed(first + third)
+    assert decoder.lost == 1
+
+    decoder.feed(second)
+    assert decoder.reordered == 1
+
+    assert decoder.feed(fourth)[0].seq == 3  # noqa: PLR2004
+    assert decoder.lost == 1
+
+
+def test_sequence_wraps():
+    """TEST: The sequence number wraps without looking like lost frames."""
+    encoder = FrameEncoder()
+    encoder.seq = 2**32 - 1
+
+    decoder = FrameDecoder()
+    frames = decoder.feed(encoder.encode([1]) + encoder.encode([2]))
+
+    assert [frame.seq for frame in frames] == [2**32 - 1, 0]
+    assert decoder.lost == 0
+
+
+def test_encode_resume():
+    """TEST: A resume frame repeats the last sequence number, a receiver joining there sees no gap either."""
+    encoder = FrameEncoder()
+    sent = encoder.encode([1])
+    resume = encoder.encode_resume(1)
+    after = encoder.encode([3])
+
+    on_stream = FrameDecoder()
+    on_stream.feed(sent + after)
+    joining = FrameDecoder()
+    assert [tuple(frame) for frame in joining.feed(resume + after)] == [(0, [1]), (1, [3])]
+    assert on_stream.lost == joining.lost == 0
+
+
+def test_invalid_data():
+    """TEST: Data that isn't a frame raises ProtocolError."""
+    with pytest.raises(ProtocolError, match="Invalid frame header"):
+        FrameDecoder().feed(b"\x00" * V2_HEADER.size)
+
+    # Header claims two states, the entry only has one.
+    data = V2_HEADER.pack(0xFC, 2, 0, 2, 1) + b"\x01\x00\x01"
+    with pytest.raises(ProtocolError, match="header says"):
+        FrameDecoder().feed(data)
+
+    # TEST: Good frames before a bad one in the same read are returned, the bad one raises on the next feed
+    encoder = FrameEncoder()
+    good = encoder.encode([1]) + encoder.encode([2])
+    for bad, match in [(data, "header says"), (b"\x00" * V2_HEADER.size, "Invalid frame header")]:
+        decoder = FrameDecoder()
+        assert [frame.states for frame in decoder.feed(good + bad)] == [[1], [2]]
+        with pytest.raises(ProtocolError, match=match):
+            decoder.feed(b"")
+        assert decoder.feed(good) != []  # The bad frame is gone, decoding carries on
+
+
+def test_emulator_messages():
+    """TEST: Frame ticks and acks are decoded however the reads split them, and replies carry the frame they answer."""
+    data = encode_tick(1) + encode_ack(9, 100) + encode_tick(2) + encode_tick(2**32 + 3)
+    decoder = EmulatorDecoder()
+    messages = [message for start in range(0, len(data), 3) for message in decoder.feed(data[start : start + 3])]
+    assert messages == [
+        EmulatorMessage(0xFD, 1),
+        EmulatorMessage(0xFE, 9, 100),
+        EmulatorMessage(0xFD, 2),
+        EmulatorMessage(0xFD, 3),
+    ]
+
+    assert encode_pull_state(7, 0b101) == b"\xfd\x07\x00\x00\x00\x05\x00"
+
+    # TEST: Anything else is a ProtocolError
+    with pytest.raises(ProtocolError, match="Invalid message from emulator"):
+        EmulatorDecoder().feed(b"\x01\x00\x00\x00\x00")
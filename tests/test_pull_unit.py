@@ -0,0 +1,150 @@
+"""Unit test pull mode, where the emulator asks for the input every frame."""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from flaskcontroller import controller
+from flaskcontroller.protocol import PULL_STATE, encode_ack, encode_tick
+
+
+class PullEmulator:
+    """Emulator stand-in for pull mode, accepts one connection then sends a frame tick when told to."""
+
+    def __init__(self):
+        """Listen on a free port."""
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        self.server.settimeout(5)
+        self.conn = None
+
+    def accept(self) -> None:
+        """Wait for flaskcontroller to connect."""
+        self.conn, _ = self.server.accept()
+        self.conn.settimeout(5)
+
+    def frame(self, frame: int) -> int:
+        """Send a frame tick and return the state flaskcontroller replies with."""
+        self.conn.sendall(encode_tick(frame))
+        reply_frame, state = self.read_reply()
+        assert reply_frame == frame
+        return state
+
+    def read_reply(self) -> tuple[int, int]:
+        """Read one reply, returns (frame, state)."""
+        reply = b""
+        while len(reply) < PULL_STATE.size:
+            data = self.conn.recv(PULL_STATE.size - len(reply))
+            assert data, "Disconnected"
+            reply += data
+        _, reply_frame, state = PULL_STATE.unpack(reply)
+        return reply_frame, state
+
+    def close(self):
+        """Close everything."""
+        if self.conn:
+            self.conn.close()
+        self.server.close()
+
+
+@pytest.fixture()
+def pull_app(request, tmp_path, get_test_config):
+    """App in pull mode with the socket sender running, connected to a PullEmulator, [app] settings as the param."""
+    import flaskcontroller
+
+    emulator = PullEmulator()
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["targets"] = [f"127.0.0.1:{emulator.port}"]
+    test_config["app"]["send_mode"] = "pull"
+    test_config["app"]["tick_rate"] = 1  # Pull mode doesn't use it, a slow tick would show if it did
+    test_config["app"].update(getattr(request, "param", {}))
+    app = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+
+    controller._run_thread = True
+    thread = threading.Thread(target=controller.socket_sender, args=(app.config,))
+    thread.start()
+    try:
+        emulator.accept()
+        yield app, emulator
+    finally:
+        controller._run_thread = False
+        thread.join()
+        emulator.close()
+
+
+def test_pull_mode(pull_app):
+    """TEST: Every frame tick gets exactly one reply, the merged state at that frame."""
+    app, emulator = pull_app
+    client = app.test_client()
+
+    assert emulator.frame(1) == 0
+    client.post("/input/D_GBA_A", headers={"client-id": "PULLA"})
+    client.post("/input/D_GBA_B", headers={"client-id": "PULLB"})
+    assert emulator.frame(2) == 0b11  # noqa: PLR2004
+    assert emulator.frame(3) == 0b11  # noqa: PLR2004 Held, and nothing new queued
+
+    # TEST: Several presses between two frames, the frame gets the state after all of them
+    client.post("/inputs", json=["U_GBA_A", "D_GBA_UP", "U_GBA_B"], headers={"client-id": "PULLA"})
+    client.post("/input/U_GBA_B", headers={"client-id": "PULLB"})
+    assert emulator.frame(4) == 0b1000000  # noqa: PLR2004
+
+    # TEST: Nothing is pushed without a frame tick
+    client.post("/input/D_GBA_START", headers={"client-id": "PULLB"})
+    emulator.conn.settimeout(0.2)
+    with pytest.raises(TimeoutError):
+        emulator.conn.recv(1)
+    emulator.conn.settimeout(5)
+
+    # TEST: Ticks sent together are each answered, in order
+    emulator.conn.sendall(encode_tick(5) + encode_tick(6))
+    assert emulator.read_reply() == (5, 0b1001000)
+    assert emulator.read_reply() == (6, 0b1001000)
+    assert controller.get_status_dict()["targets"][0]["frame_ticks"] == 6  # noqa: PLR2004
+
+    # TEST: A press and release between two frames is pressed for a frame then released
+    client.post("/inputs", json=["D_GBA_A", "U_GBA_A"], headers={"client-id": "PULLA"})
+    assert emulator.frame(7) == 0b1001001  # noqa: PLR2004
+    assert emulator.frame(8) == 0b1001000  # noqa: PLR2004
+
+
+def test_pull_mode_bad_tick(pull_app):
+    """TEST: An emulator that sends something other than frame ticks is disconnected."""
+    _, emulator = pull_app
+    assert emulator.frame(1) == 0
+
+    emulator.conn.sendall(b"\x00" * 5)
+    assert emulator.conn.recv(1) == b""
+
+
+@pytest.mark.parametrize("pull_app", [{"latency_acks": True}], indirect=True)
+def test_pull_mode_latency(pull_app):
+    """TEST: The emulator acking the frame it applied a state on gives the player their input latency."""
+    app, emulator = pull_app
+    client = app.test_client()
+
+    assert emulator.frame(1) == 0  # Connected, input from before then isn't sent
+    client.post("/input/D_GBA_A", headers={"client-id": "ACKED"})
+    assert emulator.frame(2) == 1
+    emulator.conn.sendall(encode_ack(2, 1000))
+
+    deadline = time.monotonic() + 5
+    while "latency" not in (status := client.get("/GetStatus", headers={"client-id": "ACKED"}).json):
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+    assert status["latency"]["samples"] == 1
+    assert 0 < status["latency"]["send_to_apply"] < status["latency"]["enqueue_to_apply"]
+    assert status["targets"][0]["applied_frame"] == 1000  # noqa: PLR2004
+
+    # TEST: Other players don't get anyone else's latency, everyone's is in /latency
+    assert "latency" not in client.get("/GetStatus", headers={"client-id": "OTHER"}).json
+    latency = client.get("/latency").json
+    assert latency["acked"] == 1
+    assert latency["enqueue_to_apply"]["max"] == status["latency"]["enqueue_to_apply"]
+
+    # TEST: Acks of frames that carried no new input are ignored
+    assert emulator.frame(3) == 1
+    emulator.conn.sendall(encode_ack(3, 1001))
+    assert emulator.frame(4) == 1  # The ack has been read by now
+    assert client.get("/latency").json["acked"] == 1
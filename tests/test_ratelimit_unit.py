@@ -0,0 +1,131 @@
+"""Unit test the rate limiter."""
+
+from http import HTTPStatus
+
+from flaskcontroller import controller, ratelimit
+from flaskcontroller.ratelimit import TokenBucketLimiter
+
+
+class FakeClock:
+    """Stand in for time.monotonic, moved on by hand."""
+
+    def __init__(self) -> None:
+        """Start at 0."""
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        """Return the time."""
+        return self.now
+
+
+def test_token_bucket(monkeypatch):
+    """TEST: A key gets its burst at once, then tokens at the rate, other keys aren't affected."""
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+
+    assert [limiter.take("FLOOD") for _ in range(3)] == [0, 0, 0]
+    assert limiter.take("FLOOD") == 0.5  # noqa: PLR2004 Half a second until the next token
+    assert limiter.take("OTHER") == 0
+
+    clock.now = 0.5
+    assert limiter.take("FLOOD") == 0
+    assert limiter.take("FLOOD") > 0
+
+    # TEST: A bucket never fills past the burst
+    clock.now = 100
+    assert [limiter.take("FLOOD") for _ in range(4)][-1] > 0
+
+
+def test_token_bucket_tokens(monkeypatch):
+    """TEST: A request can cost several tokens, one bigger than the burst goes through on a full bucket as debt."""
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    limiter = TokenBucketLimiter(rate=2, burst=4)
+
+    assert limiter.take("BATCH", 3) == 0
+    assert limiter.take("BATCH", 2) == 0.5  # noqa: PLR2004 One token left, half a second until the second
+
+    # TEST: Batching doesn't get more through than the rate, the 6 tokens past the burst take 3 seconds to pay back
+    clock.now = 100
+    assert limiter.take("BATCH", 10) == 0
+    clock.now = 103
+    assert limiter.take("BATCH") > 0
+    clock.now = 103.5
+    assert limiter.take("BATCH") == 0
+
+    # TEST: A bucket in debt isn't swept until it has filled back up
+    clock.now = 200
+    limiter.take("DEBT", 20)
+    clock.now = 203
+    limiter.take("OTHER")
+    assert limiter.take("DEBT") > 0
+
+
+def test_token_bucket_sweep(monkeypatch):
+    """TEST: Buckets that have filled back up are forgotten, ones still in use are kept."""
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    limiter = TokenBucketLimiter(rate=1, burst=2)
+
+    for number in range(ratelimit.SWEEP_BATCH + 11):
+        limiter.take(f"ROTATING{number}")
+    clock.now = 1
+    limiter.take("ROTATING0")  # Still in use
+    clock.now = 2.5
+    limiter.take("NEW")
+
+    # TEST: Only SWEEP_BATCH at a time are swept
+    assert len(limiter) == 10 + 2  # The 10 left for the next sweep, ROTATING0 and NEW
+    limiter.take("NEW")
+    assert len(limiter) == 2  # noqa: PLR2004 Only ROTATING0 and NEW are left
+
+    clock.now = 10
+    limiter.take("NEW")
+    assert len(limiter) == 1
+
+
+def test_rate_limited_endpoints(tmp_path, get_test_config):
+    """TEST: Over the limit gets a 429 without the input being queued, per client id and per address."""
+    import flaskcontroller
+
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["rate_limit"] = {"client_rate": 1, "client_burst": 2, "address_rate": 1, "address_burst": 4}
+    client = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path).test_client()
+    limited_before = controller.metric_rate_limited.get()
+
+    assert client.post("/input/D_GBA_A", headers={"client-id": "FLOOD"}).status_code == HTTPStatus.OK
+    assert client.get("/GetStatus", headers={"client-id": "FLOOD"}).status_code == HTTPStatus.OK
+    response = client.post("/inputs", json=["U_GBA_A"], headers={"client-id": "FLOOD"})
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert response.headers["Retry-After"] == "1"
+    assert len(controller.input_queue) == 1
+
+    # TEST: A new client id from the same address gets what is left of the address's burst
+    assert client.post("/input/U_GBA_A", headers={"client-id": "ROTATED"}).status_code == HTTPStatus.OK
+    response = client.post("/input/U_GBA_A", headers={"client-id": "ROTATED_AGAIN"})
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+
+    # TEST: Each input in a batch costs a token, 2 more than the request's own is over what the address has left
+    client = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path).test_client()
+    response = client.post("/inputs", json=["D_GBA_A", "U_GBA_A"], headers={"client-id": "BATCH"})
+    assert response.status_code == HTTPStatus.OK
+    response = client.post("/inputs", json=["D_GBA_A", "U_GBA_A", "D_GBA_A"], headers={"client-id": "BATCH2"})
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert controller.players.get_state("BATCH2") == 0
+
+    # TEST: Other endpoints aren't limited
+    assert client.get("/metrics").status_code == HTTPStatus.OK
+    assert controller.metric_rate_limited.get() - limited_before == 3  # noqa: PLR2004
+
+
+def test_rate_limit_off(tmp_path, get_test_config):
+    """TEST: A rate of 0 turns the limit off."""
+    import flaskcontroller
+
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["rate_limit"] = {"client_rate": 0, "address_rate": 0}
+    flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+
+    assert controller.client_limiter is None
+    assert controller.address_limiter is None
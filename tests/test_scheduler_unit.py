@@ -0,0 +1,121 @@
+"""Unit test the tick scheduler module."""
+
+import threading
+import time
+
+import pytest
+
+from flaskcontroller.input_queue import InputQueue
+from flaskcontroller.scheduler import TickScheduler
+
+TICK_RATE = 50
+PERIOD = 1 / TICK_RATE
+
+
+def test_scheduler_timeout():
+    """TEST: With nothing in the queue the scheduler times out."""
+    scheduler = TickScheduler(TICK_RATE)
+
+    assert not scheduler.wait(InputQueue(), timeout=0.01)
+    assert scheduler.get_stats()["ticks"] == 0
+    assert scheduler.get_stats()["mean_jitter"] == 0
+
+
+def test_scheduler_wakes_on_input():
+    """TEST: An idle scheduler fires as soon as input arrives, not at the next tick."""
+    scheduler = TickScheduler(1)  # A full second per tick, so waiting for the tick would be obvious
+    input_queue = InputQueue()
+
+    threading.Timer(0.05, input_queue.append, args=(1,)).start()
+
+    start = time.monotonic()
+    assert scheduler.wait(input_queue, timeout=2)
+    assert time.monotonic() - start < 0.5  # noqa: PLR2004
+
+
+def test_scheduler_minimum_gap_no_drift():
+    """TEST: Back to back ticks are spaced by the period and don't drift."""
+    n_ticks = 10
+    scheduler = TickScheduler(TICK_RATE)
+    input_queue = InputQueue()
+    input_queue.append(1)  # Never drained, so there is always input
+
+    start = time.monotonic()
+    for _ in range(n_ticks):
+        assert scheduler.wait(input_queue, timeout=1)
+    elapsed = time.monotonic() - start
+
+    # The first tick fires immediately, the rest are one period apart.
+    assert elapsed >= (n_ticks - 1) * PERIOD
+    assert elapsed < (n_ticks + 2) * PERIOD
+
+    stats = scheduler.get_stats()
+    assert stats["ticks"] == n_ticks
+    assert stats["max_jitter"] >= stats["mean_jitter"] >= 0
+
+
+class FakeClock:
+    """Stands in for the time module in the scheduler, sleeping just moves the clock on."""
+
+    def __init__(self) -> None:
+        """Start at 100 seconds."""
+        self.now = 100.0
+
+    def monotonic(self) -> float:
+        """Return the fake time."""
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        """Move the clock on."""
+        self.now += seconds
+
+
+def test_scheduler_late_loop_no_drift(monkeypatch):
+    """TEST: A loop that comes back a little late stays on its deadlines, a whole period late starts a new chain."""
+    import flaskcontroller.scheduler
+
+    clock = FakeClock()
+    monkeypatch.setattr(flaskcontroller.scheduler, "time", clock)
+    scheduler = TickScheduler(TICK_RATE)
+    input_queue = InputQueue()
+    input_queue.append(1)  # Never drained, so there is always input
+
+    # Every other pass overruns the period by a quarter, the passes in between make it up
+    fired = []
+    for work in [1.25, 0.5] * 5:
+        assert scheduler.wait(input_queue, timeout=1)
+        fired.append(clock.now - 100)
+        clock.now += work * PERIOD
+    for tick, at in enumerate(fired):
+        assert at == pytest.approx(tick * PERIOD + (PERIOD / 4 if tick % 2 else 0))
+    assert scheduler.get_stats()["max_jitter"] == pytest.approx(PERIOD / 4)
+
+    # TEST: Stalled for over a period, fire now and start a new chain from there
+    clock.now += 3 * PERIOD
+    assert scheduler.wait(input_queue, timeout=1)
+    stalled_at = clock.now
+    assert scheduler.wait(input_queue, timeout=1)
+    assert clock.now == pytest.approx(stalled_at + PERIOD)
+
+
+def test_scheduler_time_to_tick():
+    """TEST: How long wait() would block, the timeout without input, otherwise until the next deadline."""
+    scheduler = TickScheduler(TICK_RATE)
+    input_queue = InputQueue()
+    assert scheduler.time_to_tick(input_queue, 1) == 1
+
+    input_queue.append(1)
+    assert scheduler.time_to_tick(input_queue, 1) == 0  # Idle, fires straight away
+    assert scheduler.wait(input_queue, timeout=0)
+    assert 0 < scheduler.time_to_tick(input_queue, 1) <= PERIOD
+
+
+def test_scheduler_set_tick_rate():
+    """TEST: Invalid tick rates are rejected, valid ones change the period."""
+    scheduler = TickScheduler(TICK_RATE)
+
+    with pytest.raises(ValueError, match="Tick rate"):
+        scheduler.set_tick_rate(0)
+
+    scheduler.set_tick_rate(100)
+    assert scheduler.period == pytest.approx(0.01)
@@ -0,0 +1,534 @@
+"""Unit test the multi target sender."""
+
+import contextlib
+import socket
+import threading
+import time
+
+import pytest
+
+from flaskcontroller import controller, sender
+from flaskcontroller.sender import TargetSender, get_targets, parse_target
+
+
+class Listener:
+    """Emulator stand-in that accepts one connection and reads everything sent to it, unless told not to."""
+
+    def __init__(self, read: bool = True, port: int = 0):
+        """Listen on port, a free one by default."""
+        self.server = socket.create_server(("127.0.0.1", port))
+        self.port = self.server.getsockname()[1]
+        self.received = bytearray()
+        self.conn = None
+        self._read = read
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self) -> None:
+        try:
+            self.conn, _ = self.server.accept()
+        except OSError:
+            return  # Closed by the test before anything connected
+        if not self._read:
+            return
+        with contextlib.suppress(OSError):  # Closed by the test
+            while data := self.conn.recv(65536):
+                self.received += data
+
+    def close(self):
+        """Close everything."""
+        if self.conn:
+            self.conn.close()
+        self.server.close()
+
+
+def wait_until(condition, timeout=5):
+    """Poll until condition() is true."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_parse_target():
+    """TEST: Targets are host:port."""
+    assert parse_target("127.0.0.1:5001") == ("127.0.0.1", 5001)
+    assert parse_target("emulator.lan:5003") == ("emulator.lan", 5003)
+
+    for target in ["127.0.0.1", ":5001", "127.0.0.1:port"]:
+        with pytest.raises(ValueError, match="Invalid target"):
+            parse_target(target)
+
+    # TEST: Unix sockets are unix:/path
+    assert parse_target("unix:/run/emulator.sock") == ("/run/emulator.sock", None)
+    with pytest.raises(ValueError, match="Invalid target"):
+        parse_target("unix:")
+
+    # TEST: With no targets configured, socket_address:socket_port is used
+    assert get_targets({"socket_address": "127.0.0.1", "socket_port": 5001, "targets": []}) == [("127.0.0.1", 5001)]
+    assert get_targets({"targets": ["a:1", "b:2"]}) == [("a", 1), ("b", 2)]
+
+
+def test_socket_options():
+    """TEST: The socket options from the config are set on TCP sockets."""
+    options = sender.get_socket_options({"socket_nodelay": False, "socket_sndbuf": 65536})
+    assert options == {**sender.DEFAULT_SOCKET_OPTIONS, "nodelay": False, "sndbuf": 65536}
+
+    with sender.create_socket(unix=False) as sock:
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+        if hasattr(socket, "TCP_KEEPCNT"):
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT) == options["keepalive_count"]
+
+    with sender.create_socket(unix=False, options=options) as sock:
+        assert not sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= 65536  # noqa: PLR2004 Linux doubles it
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="No unix sockets on this platform")
+def test_unix_socket_target(tmp_path, caplog):
+    """TEST: Unix socket targets connect, send, and retry while the socket isn't there."""
+    path = str(tmp_path / "emulator.sock")
+    target_sender = TargetSender([(path, None)], reconnect_delay=0.05, reconnect_max_delay=0.05)
+    target = target_sender.targets[0]
+    assert target.name == f"unix:{path}"
+
+    target_sender.connect_due()
+    assert "Socket connection refused" in caplog.text
+    assert not target.connected
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(path)
+        server.listen()
+        wait_until(lambda: target_sender.connect_due() or target.connected)
+        conn, _ = server.accept()
+        with conn:
+            target_sender.broadcast(b"\x01\x00")
+            assert conn.recv(2) == b"\x01\x00"
+    target_sender.close()
+
+
+def test_backoff_delay():
+    """TEST: Retries back off exponentially up to the ceiling, with jitter."""
+    for failures, full_delay in [(1, 1), (2, 2), (3, 4), (6, 30), (1000, 30)]:
+        delays = [sender.backoff_delay(failures, base=1, ceiling=30) for _ in range(50)]
+        assert all(full_delay / 2 <= delay <= full_delay for delay in delays)
+        assert len(set(delays)) > 1
+
+
+def test_target_sender_fan_out(caplog):
+    """TEST: Every tick's frame goes to every target, a slow target drops frames without holding up the others."""
+    fast = Listener()
+    slow = Listener(read=False)
+    with socket.create_server(("127.0.0.1", 0)) as closed:  # Refuses connections once closed
+        closed_port = closed.getsockname()[1]
+
+    target_sender = TargetSender(
+        [("127.0.0.1", fast.port), ("127.0.0.1", slow.port), ("127.0.0.1", closed_port)],
+        reconnect_delay=0.05,
+        reconnect_max_delay=0.1,
+    )
+    fast_target, slow_target, closed_target = target_sender.targets
+
+    # TEST: Connects complete through the selector, the closed port is refused and retried on its own
+    while not (fast_target.connected and slow_target.connected and closed_target.attempts >= 2):  # noqa: PLR2004
+        target_sender.connect_due()
+        target_sender.service(0.01)
+    assert "Socket connection refused" in caplog.text
+    assert target_sender.any_connected()
+    assert closed_target.failures >= 2  # noqa: PLR2004
+    assert fast_target.failures == 0
+
+    # TEST: Big frames fill the slow target's socket buffer, its oldest unsent frames are dropped
+    frame = b"\x01" * 65536
+    n_frames = sender.MAX_PENDING_FRAMES * 4
+    start = time.monotonic()
+    for _ in range(n_frames):
+        target_sender.broadcast(frame)
+        while fast_target.has_pending():  # Keep the fast target caught up, the slow one falls behind
+            target_sender.service(0.01)
+    assert time.monotonic() - start < 5  # noqa: PLR2004 Never blocked on the slow target
+
+    slow_stats = slow_target.get_stats()
+    assert slow_stats["connected"]
+    assert slow_stats["frames_dropped"] > 0
+    assert slow_stats["pending_frames"] == sender.MAX_PENDING_FRAMES
+    assert slow_stats["lag"] > 0
+
+    # TEST: The fast target gets every frame
+    wait_until(lambda: len(fast.received) == n_frames * len(frame))
+    assert fast_target.get_stats()["frames_dropped"] == 0
+
+    # TEST: A target that goes away is reconnected on its own
+    fast.close()
+    wait_until(lambda: not (target_sender.broadcast(b"\x00\x00") or fast_target.connected))
+    assert "Disconnected from socket, cringe" in caplog.text
+    assert slow_target.connected
+
+    target_sender.close()
+    slow.close()
+
+
+def test_socket_sender_targets(tmp_path, get_test_config):
+    """TEST: The socket sender sends the same input to every target and reports each of them in the status."""
+    import flaskcontroller
+
+    listeners = [Listener(), Listener()]
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["targets"] = [f"127.0.0.1:{listener.port}" for listener in listeners]
+    app = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+
+    controller._run_thread = True
+    thread = threading.Thread(target=controller.socket_sender, args=(app.config,))
+    thread.start()
+    try:
+        wait_until(lambda: controller.get_status_dict()["sock_connected"])
+        wait_until(lambda: all(target["connected"] for target in controller.get_status_dict()["targets"]))
+
+        app.test_client().post("/input/D_GBA_B", headers={"client-id": "FANOUT"})
+        wait_until(lambda: all(listener.received.endswith(b"\x02\x00") for listener in listeners))
+
+        status = app.test_client().get("/GetStatus").json
+        assert [target["target"] for target in status["targets"]] == test_config["app"]["targets"]
+        assert all(target["frames_sent"] >= 1 for target in status["targets"])
+    finally:
+        controller._run_thread = False
+        thread.join()
+        for listener in listeners:
+            listener.close()
+
+
+def test_socket_sender_tap(tmp_path, get_test_config):
+    """TEST: A press and release that land in the same tick both reach the emulator."""
+    import flaskcontroller
+
+    listener = Listener()
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["targets"] = [f"127.0.0.1:{listener.port}"]
+    test_config["app"]["tick_rate"] = 2  # Plenty of time to get both inputs in before the next tick
+    app = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+    client = app.test_client()
+
+    controller._run_thread = True
+    thread = threading.Thread(target=controller.socket_sender, args=(app.config,))
+    thread.start()
+    try:
+        wait_until(lambda: controller.get_status_dict()["sock_connected"])
+        client.post("/input/D_GBA_B", headers={"client-id": "TAPPER"})  # Sent straight away, starts a tick
+        wait_until(lambda: listener.received.endswith(b"\x02\x00"))
+        sent = len(listener.received)
+        client.post("/input/D_GBA_A", headers={"client-id": "TAPPER"})
+        client.post("/input/U_GBA_A", headers={"client-id": "TAPPER"})
+
+        wait_until(lambda: len(listener.received) >= sent + 4)
+        time.sleep(0.1)
+        assert bytes(listener.received[sent:]) == b"\x03\x00\x02\x00"
+    finally:
+        controller._run_thread = False
+        thread.join()
+        listener.close()
+
+
+@pytest.mark.parametrize("protocol_version", [1, 2])
+def test_socket_sender_batch_tap(tmp_path, get_test_config, protocol_version: int):
+    """TEST: A batch that presses and releases a button presses it on the emulator."""
+    import flaskcontroller
+    from flaskcontroller.protocol import V1_STATE, FrameDecoder
+
+    listener = Listener()
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["targets"] = [f"127.0.0.1:{listener.port}"]
+    test_config["app"]["protocol_version"] = protocol_version
+    app = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+
+    def received_states() -> list[int]:
+        if protocol_version == 1:
+            return [state for (state,) in V1_STATE.iter_unpack(bytes(listener.received))]
+        return [state for frame in FrameDecoder().feed(bytes(listener.received)) for state in frame.states]
+
+    controller._run_thread = True
+    thread = threading.Thread(target=controller.socket_sender, args=(app.config,))
+    thread.start()
+    try:
+        wait_until(lambda: controller.get_status_dict()["sock_connected"])
+        wait_until(lambda: received_states() == [0])  # The state on connect
+        response = app.test_client().post("/inputs", json=["D_GBA_A", "U_GBA_A"], headers={"client-id": "MACRO"})
+        assert response.text == "VALID KEYPRESSES"
+
+        wait_until(lambda: len(received_states()) >= 3)  # noqa: PLR2004
+        assert received_states() == [0, 1, 0]
+    finally:
+        controller._run_thread = False
+        thread.join()
+        listener.close()
+
+
+def test_socket_sender_outage(tmp_path, get_test_config):
+    """TEST: Input during an outage isn't piled up, when the emulator comes back it gets just the current state."""
+    import flaskcontroller
+
+    with socket.create_server(("127.0.0.1", 0)) as closed:  # Find a port, nothing listens on it yet
+        port = closed.getsockname()[1]
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["targets"] = [f"127.0.0.1:{port}"]
+    test_config["app"]["reconnect_delay"] = 0.05
+    test_config["app"]["reconnect_max_delay"] = 0.1
+    test_config["app"]["input_ttl"] = 0.2
+    app = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+    client = app.test_client()
+
+    controller._run_thread = True
+    thread = threading.Thread(target=controller.socket_sender, args=(app.config,))
+    thread.start()
+    listener = None
+    try:
+        client.post("/input/D_GBA_A", headers={"client-id": "STALE"})
+        for _ in range(20):
+            client.post("/input/D_GBA_B", headers={"client-id": "FRESH"})
+            client.post("/input/U_GBA_B", headers={"client-id": "FRESH"})
+
+        # TEST: Queued input older than the TTL is dropped while nothing is connected
+        wait_until(lambda: controller.input_queue.get_stats()["expired"] == 41)  # noqa: PLR2004
+        assert len(controller.input_queue) == 0
+
+        client.post("/input/D_GBA_START", headers={"client-id": "FRESH"})
+        listener = Listener(port=port)
+        wait_until(lambda: controller.get_status_dict()["sock_connected"])
+
+        # TEST: One frame with the current state, STALE's A press is older than the TTL so it is released
+        wait_until(lambda: len(listener.received) >= 2)  # noqa: PLR2004
+        time.sleep(0.1)
+        assert bytes(listener.received) == b"\x08\x00"
+    finally:
+        controller._run_thread = False
+        thread.join()
+        if listener:
+            listener.close()
+
+
+@pytest.mark.parametrize("protocol_version", [1, 2])
+def test_socket_sender_late_target(tmp_path, get_test_config, protocol_version: int):
+    """TEST: A target that connects while another is already up gets the current state straight away."""
+    import flaskcontroller
+    from flaskcontroller.protocol import V1_STATE, FrameDecoder
+
+    with socket.create_server(("127.0.0.1", 0)) as closed:  # Find a port, nothing listens on it yet
+        late_port = closed.getsockname()[1]
+    first = Listener()
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["targets"] = [f"127.0.0.1:{first.port}", f"127.0.0.1:{late_port}"]
+    test_config["app"]["protocol_version"] = protocol_version
+    test_config["app"]["reconnect_delay"] = 0.05
+    test_config["app"]["reconnect_max_delay"] = 0.1
+    app = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+    client = app.test_client()
+
+    def received_states(listener: Listener, decoder: FrameDecoder) -> list[int]:
+        if protocol_version == 1:
+            return [state for (state,) in V1_STATE.iter_unpack(bytes(listener.received))]
+        return [state for frame in decoder.feed(bytes(listener.received)) for state in frame.states]
+
+    controller._run_thread = True
+    thread = threading.Thread(target=controller.socket_sender, args=(app.config,))
+    thread.start()
+    late = None
+    try:
+        wait_until(lambda: controller.get_status_dict()["sock_connected"])
+        client.post("/input/D_GBA_A", headers={"client-id": "HOLDER"})
+        wait_until(lambda: received_states(first, FrameDecoder())[-1:] == [1])
+
+        # TEST: A held while the second target (a mirror, or a restarted emulator) connects, it gets A
+        late = Listener(port=late_port)
+        wait_until(lambda: received_states(late, FrameDecoder()) == [1])
+
+        # TEST: Both carry on together from there, without a gap in the sequence numbers
+        client.post("/input/D_GBA_B", headers={"client-id": "HOLDER"})
+        decoders = [FrameDecoder(), FrameDecoder()]
+        wait_until(lambda: received_states(late, FrameDecoder())[-1:] == [3])
+        wait_until(lambda: received_states(first, FrameDecoder())[-1:] == [3])
+        assert received_states(late, decoders[0]) == [1, 3]
+        received_states(first, decoders[1])
+        assert decoders[0].lost == decoders[1].lost == 0
+    finally:
+        controller._run_thread = False
+        thread.join()
+        first.close()
+        if late:
+            late.close()
+
+
+def test_socket_sender_target_restart(tmp_path, get_test_config):
+    """TEST: An emulator that drops out while another target stays up comes back to the current state."""
+    import flaskcontroller
+
+    steady = Listener()
+    restarting = Listener()
+    port = restarting.port
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["targets"] = [f"127.0.0.1:{steady.port}", f"127.0.0.1:{port}"]
+    test_config["app"]["reconnect_delay"] = 0.05
+    test_config["app"]["reconnect_max_delay"] = 0.1
+    app = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+    client = app.test_client()
+
+    controller._run_thread = True
+    thread = threading.Thread(target=controller.socket_sender, args=(app.config,))
+    thread.start()
+    try:
+        wait_until(lambda: all(target["connected"] for target in controller.get_status_dict()["targets"]))
+        client.post("/input/D_GBA_A", headers={"client-id": "HOLDER"})
+        wait_until(lambda: restarting.received.endswith(b"\x01\x00"))
+
+        # TEST: A is released while the emulator is gone, it hears about it when it reconnects
+        restarting.close()
+        client.post("/input/U_GBA_A", headers={"client-id": "HOLDER"})
+
+        def send_fails() -> bool:  # Nothing is read from targets here, a closed one is noticed when a send fails
+            client.post("/input/D_GBA_B", headers={"client-id": "POKER"})
+            client.post("/input/U_GBA_B", headers={"client-id": "POKER"})
+            time.sleep(0.05)
+            return not controller.get_status_dict()["targets"][1]["connected"]
+
+        wait_until(send_fails)
+        restarting = Listener(port=port)
+        wait_until(lambda: len(restarting.received) >= 2)  # noqa: PLR2004
+        time.sleep(0.1)
+        assert bytes(restarting.received) == b"\x00\x00"
+        assert controller.get_status_dict()["sock_connected"]  # The steady target never went away
+    finally:
+        controller._run_thread = False
+        thread.join()
+        steady.close()
+        restarting.close()
+
+
+def test_socket_sender_expires_players(tmp_path, get_test_config):
+    """TEST: Players who go away are expired by the sender, even while someone else keeps the input coming."""
+    import flaskcontroller
+
+    listener = Listener()
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["targets"] = [f"127.0.0.1:{listener.port}"]
+    test_config["app"]["player_timeout"] = 0.2
+    app = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+    client = app.test_client()
+
+    controller._run_thread = True
+    thread = threading.Thread(target=controller.socket_sender, args=(app.config,))
+    thread.start()
+    try:
+        wait_until(lambda: controller.get_status_dict()["sock_connected"])
+        client.post("/input/D_GBA_A", headers={"client-id": "LEAVER"})
+
+        def busy_input() -> bool:  # The sender never waits for input long enough to call it idle
+            for button in ["D_GBA_B", "U_GBA_B"]:
+                client.post(f"/input/{button}", headers={"client-id": "BUSY"})
+            time.sleep(0.01)
+            return "LEAVER" not in controller.presence
+
+        wait_until(busy_input)
+        assert controller.players.get_state("LEAVER") == 0  # Their A was released
+        assert "BUSY" in controller.presence
+    finally:
+        controller._run_thread = False
+        thread.join()
+        listener.close()
+
+
+def test_socket_sender_reload(tmp_path, get_test_config):
+    """TEST: A reloaded config changes the tick rate and the targets without a restart."""
+    import flaskcontroller
+    from flaskcontroller.config import ConfigWatcher
+
+    first = Listener()
+    second = Listener()
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["targets"] = [f"127.0.0.1:{first.port}"]
+    test_config["app"]["tick_rate"] = 60
+    app = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+    client = app.test_client()
+    controller.config_watcher = ConfigWatcher(instance_path=tmp_path)
+
+    controller._run_thread = True
+    thread = threading.Thread(target=controller.socket_sender, args=(app.config,))
+    thread.start()
+    try:
+        wait_until(lambda: controller.get_status_dict()["sock_connected"])
+        client.post("/input/D_GBA_A", headers={"client-id": "MOVED"})
+        wait_until(lambda: first.received.endswith(b"\x01\x00"))
+        sent_to_first = len(first.received)
+
+        config_file = tmp_path / "config.toml"
+        first_target = f'"127.0.0.1:{first.port}"'
+        second_target = f'"127.0.0.1:{second.port}"'
+        contents = config_file.read_text()
+        contents = contents.replace(first_target, f"{first_target}, {second_target}")
+        config_file.write_text(contents.replace("tick_rate = 60", "tick_rate = 240"))
+        assert controller.config_watcher.poll()
+
+        # TEST: A target added while the first is still connected is sent the held state once it connects
+        wait_until(lambda: len(second.received) >= 2)  # noqa: PLR2004
+        assert bytes(second.received) == b"\x01\x00"
+        assert controller.tick_scheduler.period == 1 / 240
+        targets = controller.get_status_dict()["targets"]
+        assert [target["target"] for target in targets] == [f"127.0.0.1:{first.port}", f"127.0.0.1:{second.port}"]
+        assert targets[0]["attempts"] == 1  # Kept its connection
+        assert len(first.received) == sent_to_first
+
+        # TEST: A removed target is disconnected, the rest carry on
+        config_file.write_text(contents.replace(f"{first_target}, ", ""))
+        assert controller.config_watcher.poll()
+        wait_until(lambda: len(controller.get_status_dict()["targets"]) == 1)
+        assert controller.get_status_dict()["targets"][0]["target"] == f"127.0.0.1:{second.port}"
+        client.post("/input/D_GBA_B", headers={"client-id": "MOVED"})
+        wait_until(lambda: second.received.endswith(b"\x03\x00"))
+    finally:
+        controller._run_thread = False
+        thread.join()
+        controller.config_watcher = None
+        first.close()
+        second.close()
+
+
+def test_wake():
+    """TEST: wake() cuts a service() wait short, from another thread, and only once enabled."""
+    target_sender = TargetSender([])
+    try:
+        target_sender.wake()  # Not enabled, does nothing
+        start = time.monotonic()
+        target_sender.service(0.05)
+        assert time.monotonic() - start >= 0.05  # noqa: PLR2004
+
+        wake = target_sender.enable_wake()
+        threading.Timer(0.05, wake).start()
+        start = time.monotonic()
+        target_sender.service(5)
+        assert time.monotonic() - start < 1
+
+        # TEST: A wake that came in while nothing was waiting ends the next wait, and is only used once
+        wake()
+        wake()
+        target_sender.service(5)
+        start = time.monotonic()
+        target_sender.service(0.05)
+        assert time.monotonic() - start >= 0.05  # noqa: PLR2004
+    finally:
+        target_sender.close()
+    target_sender.wake()  # Closed, does nothing
+
+
+def test_set_targets():
+    """TEST: Targets still in the list keep their connection, removed ones are disconnected."""
+    listener = Listener()
+    target_sender = TargetSender([("127.0.0.1", listener.port), ("127.0.0.1", 1)])
+    try:
+        target_sender.connect_due()
+        wait_until(lambda: target_sender.service(0.01) or target_sender.targets[0].connected)
+        kept = target_sender.targets[0]
+
+        target_sender.set_targets([("127.0.0.1", listener.port), ("127.0.0.1", 2)])
+        assert target_sender.targets[0] is kept
+        assert kept.connected
+        assert [target.port for target in target_sender.targets] == [listener.port, 2]
+    finally:
+        target_sender.close()
+        listener.close()
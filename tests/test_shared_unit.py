@@ -0,0 +1,174 @@
+"""Unit test the shared memory between the sender and web worker processes."""
+
+import subprocess
+import sys
+import uuid
+from http import HTTPStatus
+
+import pytest
+
+from flaskcontroller import controller, shared
+from flaskcontroller.shared import EVENT_INPUT, EVENT_TOUCH, SharedSegment, SharedSegmentError
+
+
+@pytest.fixture()
+def segment_name() -> str:
+    """Unique segment name, so tests running at the same time don't share."""
+    return f"fctest_{uuid.uuid4().hex[:12]}"
+
+
+def test_ring(segment_name):
+    """TEST: Events come out in the order they went in, and a full ring drops new events."""
+    segment = SharedSegment.create(segment_name, capacity=4)
+    try:
+        assert segment.put(EVENT_INPUT, "PLAYER", 0b10, pressed=True)
+        assert segment.put(EVENT_TOUCH, "VIEWER")
+        assert segment.drain() == [(EVENT_INPUT, "PLAYER", 0b10, True), (EVENT_TOUCH, "VIEWER", 0, False)]
+        assert segment.drain() == []
+
+        # TEST: Wrapping around the end of the ring, then overflowing it
+        for number in range(5):
+            segment.put(EVENT_INPUT, f"P{number}", number, pressed=False)
+        assert segment.get_stats() == {"depth": 4, "capacity": 4, "enqueued": 6, "dropped": 1}
+        assert [event[1] for event in segment.drain()] == ["P0", "P1", "P2", "P3"]
+
+        # TEST: A batch goes in together, what doesn't fit is dropped
+        assert segment.put_many(EVENT_INPUT, "BATCH", [(1, True), (2, True), (1, False), (4, True), (8, True)]) == 4  # noqa: PLR2004
+        assert segment.drain() == [
+            (EVENT_INPUT, "BATCH", 1, True),
+            (EVENT_INPUT, "BATCH", 2, True),
+            (EVENT_INPUT, "BATCH", 1, False),
+            (EVENT_INPUT, "BATCH", 4, True),
+        ]
+        assert segment.get_stats()["dropped"] == 2  # noqa: PLR2004
+
+        # TEST: Long player ids are cut short rather than spilling into the next slot
+        segment.put(EVENT_INPUT, "X" * 100, 1, pressed=True)
+        assert segment.drain()[0][1] == "X" * shared.MAX_ID_BYTES
+    finally:
+        segment.close()
+
+
+def test_doorbell(segment_name, monkeypatch):
+    """TEST: Every write rings the doorbell, one wait takes all the rings so the sender doesn't wake for nothing."""
+    import multiprocessing
+    import time
+
+    monkeypatch.setattr(shared, "doorbell", multiprocessing.Semaphore(0))
+    segment = SharedSegment.create(segment_name, capacity=8)
+    try:
+        for number in range(5):
+            segment.put(EVENT_INPUT, f"P{number}", 1, pressed=True)
+        shared.wait_doorbell(1)
+        assert len(segment.drain()) == 5  # noqa: PLR2004
+
+        start = time.monotonic()
+        shared.wait_doorbell(0.05)
+        assert time.monotonic() - start >= 0.05  # noqa: PLR2004 Nothing left over to wake on
+    finally:
+        segment.close()
+
+
+def test_status(segment_name):
+    """TEST: The status the sender publishes is what the workers read."""
+    segment = SharedSegment.create(segment_name, capacity=4)
+    try:
+        assert segment.read_status() is None  # Nothing published yet
+
+        segment.write_status({"sock_connected": True, "players_connected": 3})
+        segment.write_status({"sock_connected": False, "players_connected": 2})
+        assert segment.read_status() == {"sock_connected": False, "players_connected": 2}
+
+        # TEST: A status that doesn't fit isn't published, the last one stays
+        segment.write_status({"big": "x" * shared.STATUS_SIZE})
+        assert segment.read_status() == {"sock_connected": False, "players_connected": 2}
+    finally:
+        segment.close()
+
+    # TEST: Once the sender has removed it, workers can't attach
+    with pytest.raises(SharedSegmentError, match="is the sender process running"):
+        SharedSegment.attach(segment_name)
+
+
+def test_other_process(segment_name):
+    """TEST: Another process can attach, write input, and exit without removing the segment."""
+    segment = SharedSegment.create(segment_name, capacity=4)
+    try:
+        code = (
+            "from flaskcontroller.shared import SharedSegment\n"
+            f"segment = SharedSegment.attach({segment_name!r})\n"
+            "segment.put(1, 'CHILD', 4, pressed=True)\n"
+            "segment.close()\n"
+        )
+        subprocess.run([sys.executable, "-c", code], check=True, timeout=30)  # noqa: S603 Our own code
+
+        assert segment.drain() == [(EVENT_INPUT, "CHILD", 4, True)]
+        attached = SharedSegment.attach(segment_name)  # Still there
+        assert attached.get_stats()["enqueued"] == 1
+        attached.close()
+    finally:
+        segment.close()
+
+
+def test_worker_mode(tmp_path, get_test_config, monkeypatch, segment_name):
+    """TEST: A web worker forwards input and presence to the sender, and serves the sender's status."""
+    import flaskcontroller
+
+    segment = SharedSegment.create(segment_name, capacity=16)
+    monkeypatch.setattr(shared, "process_mode", shared.PROCESS_WORKER)
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["shared_memory_name"] = segment_name
+    try:
+        client = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path).test_client()
+
+        # TEST: Until the sender publishes, nothing is connected
+        assert client.get("/GetStatus").json == {"sock_connected": False, "players_connected": 0}
+
+        response = client.post("/input/D_GBA_A", headers={"client-id": "WORKER"})
+        assert response.text == "VALID KEYPRESS"
+        assert len(controller.input_queue) == 0  # Not queued in this process
+        assert segment.drain() == [(EVENT_INPUT, "WORKER", 0b1, True)]
+
+        client.post("/inputs", json=["D_GBA_B", "U_GBA_B"], headers={"client-id": "BATCH"})
+        assert segment.drain() == [(EVENT_INPUT, "BATCH", 0b10, True), (EVENT_INPUT, "BATCH", 0b10, False)]
+
+        client.get("/GetStatus", headers={"client-id": "VIEWER"})
+        assert segment.drain() == [(EVENT_TOUCH, "VIEWER", 0, False)]
+
+        segment.write_status({"sock_connected": True, "players_connected": 7})
+        assert client.get("/GetStatus").json == {"sock_connected": True, "players_connected": 7}
+
+        # TEST: When the ring is full the input is refused rather than quietly dropped, and counted
+        refused = controller.metric_inputs_refused.get()
+        segment.put_many(EVENT_INPUT, "FLOOD", [(1, True)] * segment.capacity)
+        response = client.post("/input/D_GBA_A", headers={"client-id": "WORKER"})
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        response = client.post("/inputs", json=["D_GBA_B", "U_GBA_B"], headers={"client-id": "BATCH"})
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        assert controller.metric_inputs_refused.get() == refused + 3
+    finally:
+        controller.shared_segment.close()
+        controller.shared_segment = None
+        segment.close()
+
+
+def test_sender_mode(tmp_path, get_test_config, monkeypatch, segment_name):
+    """TEST: The sender process creates the segment and applies the workers' input like its own."""
+    import flaskcontroller
+
+    monkeypatch.setattr(shared, "process_mode", shared.PROCESS_SENDER)
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["shared_memory_name"] = segment_name
+    flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+    segment = controller.shared_segment
+    try:
+        segment.put(EVENT_INPUT, "WORKER", 0b10, pressed=True)
+        segment.put(EVENT_TOUCH, "VIEWER")
+        controller.drain_shared_input(segment)
+
+        assert len(controller.input_queue) == 1
+        assert controller.players.merge() == 0b10  # noqa: PLR2004
+        assert controller.get_status_dict()["players_connected"] == 2  # noqa: PLR2004
+    finally:
+        segment.close()
+        controller.shared_segment = None
@@ -0,0 +1,61 @@
+"""Unit test the status stream broadcaster."""
+
+import json
+import threading
+
+from flaskcontroller.status import StatusBroadcaster, format_event
+
+
+def test_format_event():
+    """TEST: Events are formatted per the Server-Sent Events spec."""
+    assert format_event("status", "{}") == b"event: status\ndata: {}\n\n"
+
+
+def test_status_broadcaster():
+    """TEST: The status is only sent when it changes, and serialised once for every stream."""
+    status = {"sock_connected": False, "players_connected": 0, "input_queue": {"depth": 0}}
+    n_calls = 0
+
+    def status_getter() -> dict:
+        nonlocal n_calls
+        n_calls += 1
+        return dict(status)
+
+    broadcaster = StatusBroadcaster(status_getter, max_clients=2, interval=0)
+
+    # TEST: A new stream gets the current status straight away
+    version, event = broadcaster.wait(0)
+    assert version == 1
+    assert json.loads(event.decode().split("data: ")[1]) == status
+
+    # TEST: Other stats changing isn't worth an event, waiting times out
+    status["input_queue"] = {"depth": 10}
+    assert broadcaster.wait(version, timeout=0.05) == (version, b"")
+
+    # TEST: Every waiting stream gets the same event object when the player count changes
+    events = []
+
+    def waiter() -> None:
+        events.append(broadcaster.wait(version, timeout=5)[1])
+
+    threads = [threading.Thread(target=waiter) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    status["players_connected"] = 1
+    for thread in threads:
+        thread.join()
+
+    assert len(events) == 3  # noqa: PLR2004
+    assert all(event is events[0] for event in events)
+    assert b'"players_connected": 1' in events[0]
+    assert broadcaster.version == version + 1
+
+
+def test_status_broadcaster_clients():
+    """TEST: Streams past max_clients are turned away until one is given back."""
+    broadcaster = StatusBroadcaster(dict, max_clients=1)
+
+    assert broadcaster.subscribe()
+    assert not broadcaster.subscribe()
+    broadcaster.unsubscribe()
+    assert broadcaster.subscribe()
@@ -0,0 +1,288 @@
+"""PyTest, Tests the websocket input channel."""
+
+import asyncio
+import base64
+import json
+import os
+import socket
+import struct
+import time
+from http import HTTPStatus
+
+import pytest
+
+import flaskcontroller
+from flaskcontroller import websocket
+
+
+class WebSocketTestClient:
+    """Minimal blocking websocket client, just enough to talk to our server."""
+
+    def __init__(self, port: int, path: str = "/ws?client-id=TEST"):
+        """Connect and do the handshake."""
+        self.sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall(
+            (
+                f"GET {path} HTTP/1.1\r\n"
+                "Host: localhost\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Key: {key}\r\n"
+                "Sec-WebSocket-Version: 13\r\n\r\n"
+            ).encode()
+        )
+        response = b""
+        while b"\r\n\r\n" not in response:
+            chunk = self.sock.recv(1024)
+            if not chunk:
+                break
+            response += chunk
+        response, _, self._buffer = response.partition(b"\r\n\r\n")
+        self.response = response.decode()
+        self.expected_accept = websocket.accept_key(key)
+
+    def close(self):
+        """Close the socket."""
+        self.sock.close()
+
+    def send_frame(self, opcode: int, payload: bytes, *, fin: bool = True, masked: bool = True):
+        """Send a (masked) client frame."""
+        mask = os.urandom(4)
+        first = (0x80 if fin else 0) | opcode
+        length = len(payload)
+        if length < 126:  # noqa: PLR2004
+            header = struct.pack("!BB", first, (0x80 if masked else 0) | length)
+        else:
+            header = struct.pack("!BBH", first, (0x80 if masked else 0) | 126, length)
+        if masked:
+            self.sock.sendall(header + mask + websocket.unmask(payload, mask))
+        else:
+            self.sock.sendall(header + payload)
+
+    def _recv_exactly(self, n: int) -> bytes:
+        data, self._buffer = self._buffer[:n], self._buffer[n:]
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def recv_until_closed(self):
+        """Read frames until the server closes the connection."""
+        with pytest.raises(ConnectionError):  # noqa: PT012 Status pushes may arrive before the close
+            while True:
+                self.recv_frame()
+
+    def recv_frame(self) -> tuple[int, bytes]:
+        """Receive an (unmasked) server frame."""
+        first, second = self._recv_exactly(2)
+        length = second & 0x7F
+        if length == 126:  # noqa: PLR2004
+            (length,) = struct.unpack("!H", self._recv_exactly(2))
+        return first & 0x0F, self._recv_exactly(length)
+
+    def recv_json(self, message_type: str = "ack") -> dict:
+        """Receive text frames as json until one of the type we want turns up."""
+        while True:
+            _, payload = self.recv_frame()
+            message = json.loads(payload)
+            if message["type"] == message_type:
+                return message
+
+
+@pytest.fixture
+def ws_port(tmp_path, get_test_config, monkeypatch):
+    """Start the app with the websocket enabled on a free port."""
+    monkeypatch.setattr(websocket, "STATUS_INTERVAL", 0.05)
+    test_config = get_test_config("testing_true_valid.toml")
+    test_config["app"]["websocket_enabled"] = True
+    test_config["app"]["websocket_port"] = 0
+
+    app = flaskcontroller.create_app(test_config=test_config, instance_path=tmp_path)
+
+    # TEST: The homepage tells the js which port to connect to
+    response = app.test_client().get("/")
+    assert f'data-websocket-port="{websocket.websocket_server.port}"'.encode() in response.data
+
+    yield websocket.websocket_server.port
+
+    websocket.websocket_server.stop()
+
+
+def test_websocket_input(ws_port):
+    """TEST: Inputs sent over the websocket are acked and queued, status is pushed."""
+    client = WebSocketTestClient(ws_port)
+
+    # TEST: The handshake completes
+    assert client.response.startswith("HTTP/1.1 101")
+    assert client.expected_accept in client.response
+
+    # TEST: Status is pushed on connect
+    status = client.recv_json("status")
+    assert status["sock_connected"] is False
+
+    # TEST: Valid input
+    client.send_frame(websocket.OP_TEXT, b"D_GBA_A")
+    ack = client.recv_json()
+    assert ack == {"type": "ack", "input": "D_GBA_A", "message": "VALID KEYPRESS", "status": HTTPStatus.OK}
+    assert flaskcontroller.controller.players.get_state("TEST") == 1
+
+    # TEST: Invalid input, sent as binary and fragmented
+    client.send_frame(websocket.OP_BINARY, b"INVA", fin=False)
+    client.send_frame(websocket.OP_CONTINUATION, b"LID")
+    assert client.recv_json()["message"] == "INVALID KEYPRESS, DROPPING"
+
+    # TEST: Status is pushed when the player count changes
+    flaskcontroller.controller.touch_player("SOMEONE_ELSE")
+    while client.recv_json("status")["players_connected"] != 2:  # noqa: PLR2004
+        pass
+
+    # TEST: Ping gets a pong, pongs are ignored
+    client.send_frame(websocket.OP_PONG, b"")
+    client.send_frame(websocket.OP_PING, b"hi")
+    while (frame := client.recv_frame())[0] != websocket.OP_PONG:
+        pass
+    assert frame == (websocket.OP_PONG, b"hi")
+
+    # TEST: A close from the client is answered
+    client.send_frame(websocket.OP_CLOSE, struct.pack("!H", 1000))
+    while client.recv_frame()[0] != websocket.OP_CLOSE:
+        pass
+    client.close()
+
+
+def test_websocket_rate_limit(ws_port, monkeypatch):
+    """TEST: Websocket inputs are charged to the same per client and per address limits as /input."""
+    from flaskcontroller.ratelimit import TokenBucketLimiter
+
+    monkeypatch.setattr(flaskcontroller.controller, "client_limiter", TokenBucketLimiter(rate=0.1, burst=2))
+    monkeypatch.setattr(flaskcontroller.controller, "address_limiter", TokenBucketLimiter(rate=0.1, burst=4))
+    client = WebSocketTestClient(ws_port, path="/ws?client-id=FLOOD")
+    client.recv_json("status")
+
+    statuses = []
+    for _ in range(3):
+        client.send_frame(websocket.OP_TEXT, b"D_GBA_A")
+        statuses.append(client.recv_json()["status"])
+    assert statuses == [HTTPStatus.OK, HTTPStatus.OK, HTTPStatus.TOO_MANY_REQUESTS]
+
+    # TEST: A new client id from the same address only gets what is left of the address's burst
+    rotated = WebSocketTestClient(ws_port, path="/ws?client-id=ROTATED")
+    rotated.recv_json("status")
+    for _ in range(2):
+        rotated.send_frame(websocket.OP_TEXT, b"D_GBA_B")
+        statuses.append(rotated.recv_json()["status"])
+    assert statuses[3:] == [HTTPStatus.OK, HTTPStatus.TOO_MANY_REQUESTS]
+    client.close()
+    rotated.close()
+
+
+def test_websocket_bad_clients(ws_port, caplog):
+    """TEST: Bad handshakes are rejected, protocol errors close the connection."""
+    # TEST: No client id
+    client = WebSocketTestClient(ws_port, path="/ws")
+    assert client.response.startswith("HTTP/1.1 400")
+    client.close()
+
+    # TEST: Unmasked frame
+    client = WebSocketTestClient(ws_port)
+    client.recv_json("status")
+    client.send_frame(websocket.OP_TEXT, b"D_GBA_A", masked=False)
+    client.recv_until_closed()
+    client.close()
+
+    # TEST: Message too big
+    client = WebSocketTestClient(ws_port)
+    client.recv_json("status")
+    client.send_frame(websocket.OP_TEXT, b"A" * (websocket.MAX_MESSAGE_SIZE + 1))
+    client.recv_until_closed()
+    client.close()
+
+    # TEST: Fragmented message that gets too big
+    client = WebSocketTestClient(ws_port)
+    client.recv_json("status")
+    client.send_frame(websocket.OP_TEXT, b"A" * websocket.MAX_MESSAGE_SIZE, fin=False)
+    client.send_frame(websocket.OP_CONTINUATION, b"A")
+    client.recv_until_closed()
+    client.close()
+
+    # TEST: Text that isn't UTF-8 is closed with 1007
+    client = WebSocketTestClient(ws_port)
+    client.recv_json("status")
+    client.send_frame(websocket.OP_TEXT, b"D_GBA_\xff")
+    while (frame := client.recv_frame())[0] != websocket.OP_CLOSE:
+        pass
+    assert frame[1] == struct.pack("!H", websocket.CLOSE_INVALID_DATA)
+    client.recv_until_closed()
+    client.close()
+
+    time.sleep(0.1)
+    assert "Client frames must be masked" in caplog.text
+    assert "Message too large" in caplog.text
+    assert "isn't UTF-8" in caplog.text
+
+
+class FakeWriter:
+    """Just enough of a StreamWriter for a status push."""
+
+    def __init__(self, *, stuck: bool = False):
+        """A stuck writer never finishes draining, like a client that has stopped reading."""
+        self.written = b""
+        self.closed = False
+        self._stuck = stuck
+
+    def write(self, data: bytes):
+        """Buffer data."""
+        self.written += data
+
+    async def drain(self):
+        """Wait for the buffer to empty, forever if stuck."""
+        if self._stuck:
+            await asyncio.Event().wait()
+
+    def close(self):
+        """Close."""
+        self.closed = True
+
+
+def test_websocket_slow_reader(monkeypatch):
+    """TEST: A client that doesn't read its status pushes doesn't hold up the others, and is disconnected."""
+    monkeypatch.setattr(websocket, "STATUS_SEND_TIMEOUT", 0.05)
+    server = websocket.WebSocketServer("127.0.0.1", 0, None, None, None)
+    stuck = websocket.WebSocketConnection(None, FakeWriter(stuck=True), "STUCK")
+    reading = websocket.WebSocketConnection(None, FakeWriter(), "READING")
+    server._connections.update([stuck, reading])
+
+    start = time.monotonic()
+    asyncio.run(server._broadcast("status"))
+    assert time.monotonic() - start < 1
+    assert reading.writer.written == websocket.encode_frame(websocket.OP_TEXT, b"status")
+    assert not reading.writer.closed
+    assert stuck.writer.closed
+
+
+def test_websocket_disabled(client):
+    """TEST: The websocket is off by default and the js is told not to connect."""
+    response = client.get("/")
+    assert b'data-websocket-port="0"' in response.data
+
+
+def test_websocket_port_in_use(caplog):
+    """TEST: Failing to bind is logged rather than hanging."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        sock.listen()
+        server = websocket.WebSocketServer("127.0.0.1", sock.getsockname()[1], None, None, None)
+        server.start()
+
+    assert "Could not start websocket server" in caplog.text
+
+
+@pytest.mark.parametrize("length", [10, 200, 70000])
+def test_encode_frame(length: int):
+    """TEST: Frame lengths are encoded per RFC 6455."""
+    frame = websocket.encode_frame(websocket.OP_BINARY, b"A" * length)
+    assert frame.endswith(b"A" * length)
+    assert len(frame) - length in [2, 4, 10]